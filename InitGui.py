@@ -94,6 +94,9 @@ class SMWorkbench(Workbench):
             self.list.insert(
                 self.list.index("SheetMetal_Unfold") + 1, "SheetMetal_UnattendedUnfold"
             )
+            self.list.insert(
+                self.list.index("SheetMetal_UnattendedUnfold") + 1, "SheetMetal_BatchUnfold"
+            )
         self.appendToolbar(
             FreeCAD.Qt.translate("SheetMetal", "Sheet Metal"), self.list
         )  # creates a new toolbar with your commands
@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#  SheetMetalBatchUnfold.py
+#
+#  Copyright 2023 Ondsel Inc.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+###############################################################################
+
+# Unfolding of many parts at once.
+#
+# The shapes are written to BREP files, one job file per part. A pool of
+# long-lived FreeCADCmd processes running this file as script unfolds
+# them, one process per core, so FreeCAD and the workbench are loaded once
+# per process and not once per part. A worker reads the names of its job
+# files from stdin, one per line, writes the result file next to the job
+# file and answers with a line starting with DONE_MARK. A worker that dies
+# or takes longer than WORKER_TIMEOUT for a part is replaced by a new one.
+# If no FreeCADCmd executable is found, the parts are unfolded one after
+# the other in the running FreeCAD.
+#
+# batchUnfold blocks until all parts are done, the batch unfold command
+# calls writeJobs, runJobs and readResults itself to run the jobs in a
+# thread and show the progress.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import queue
+
+import FreeCAD
+import Part
+
+WORKER_ENV = "SM_BATCH_WORKER"
+DONE_MARK = "SM_BATCH_DONE "
+WORKER_TIMEOUT = 600  # seconds for a single part
+
+
+class BatchUnfoldResult:
+    """Result of the unfold of one (object, face name) pair."""
+
+    def __init__(self, obj, faceName):
+        self.object = obj
+        self.faceName = faceName  # the stationary face of the unfold
+        self.shape = None  # the unfolded shape
+        self.foldLines = None  # compound of the fold lines
+        self.error = None  # error message if the unfold failed
+
+
+def findFreeCADCmd():
+    # search the console executable next to the running FreeCAD
+    names = ("FreeCADCmd", "FreeCADCmd.exe", "freecadcmd")
+    folders = [os.path.dirname(sys.executable)]
+    try:
+        folders.append(os.path.join(FreeCAD.getHomePath(), "bin"))
+    except Exception:
+        pass
+    for folder in folders:
+        for name in names:
+            path = os.path.join(folder, name)
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                return path
+    for name in names:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def unfoldJob(job):
+    """Unfolds the part of a job dictionary and writes the result shapes to
+    BREP files. Used by the worker processes and for unfolds in process.
+    Returns a result dictionary.
+    """
+    import SheetMetalUnfolder as smu
+
+    result = {"flat": None, "folds": None, "error": None, "face_idx": None}
+    try:
+        shape = Part.Shape()
+        shape.importBrep(job["brep"])
+        lookup = {float(k): v for k, v in job["k_factor_lookup"].items()}
+        if job.get("best_face"):
+            flat, folds, tree = smu.getBestUnfold(
+                shape,
+                job["face_idx"],
+                lookup,
+                job["k_factor_standard"],
+                job["refine"],
+            )
+        else:
+            # the tree is not used again, drop its data while unfolding
+            flat, folds, tree = smu.getUnfoldFromShape(
+                shape,
+                job["face_idx"],
+                lookup,
+                job["k_factor_standard"],
+                job["refine"],
+                release=True,
+            )
+        if flat is None:
+            result["error"] = "unfold failed"
+            if tree.error_code is not None:
+                result["error"] = "%s at Face%d" % (
+                    smu.unfold_error[tree.error_code],
+                    tree.failed_face_idx + 1,
+                )
+        else:
+            result["face_idx"] = tree.root.idx
+            result["flat"] = job["brep"] + ".flat.brep"
+            flat.exportBrep(result["flat"])
+            if folds is not None and len(folds.Edges) > 0:
+                result["folds"] = job["brep"] + ".folds.brep"
+                folds.exportBrep(result["folds"])
+    except Exception as e:
+        result["error"] = str(e)
+    return result
+
+
+def _failedResult(error):
+    return {"flat": None, "folds": None, "error": error, "face_idx": None}
+
+
+def runWorker():
+    # entry point of a FreeCADCmd worker process, the file descriptors are
+    # used directly as FreeCAD redirects sys.stdout to its console
+    with os.fdopen(os.dup(0)) as jobFiles:
+        for line in jobFiles:
+            jobFile = line.strip()
+            if not jobFile:
+                continue
+            try:
+                with open(jobFile) as f:
+                    job = json.load(f)
+                result = unfoldJob(job)
+                with open(job["result"], "w") as f:
+                    json.dump(result, f)
+            except Exception:
+                pass  # no result file, the job is reported as failed
+            os.write(1, (DONE_MARK + jobFile + "\n").encode("utf-8"))
+
+
+class _Worker:
+    """A FreeCADCmd process unfolding the jobs it is given one by one."""
+
+    def __init__(self, executable):
+        env = dict(os.environ)
+        env[WORKER_ENV] = "1"
+        self.timedOut = False
+        self.process = subprocess.Popen(
+            [executable, os.path.abspath(__file__)],
+            env=env,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            bufsize=1,
+        )
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+
+    def _timeout(self):
+        self.timedOut = True
+        self.kill()
+
+    def unfold(self, jobFile, job):
+        """Sends a job to the process and waits for its result dictionary."""
+        timer = threading.Timer(WORKER_TIMEOUT, self._timeout)
+        timer.start()
+        try:
+            self.process.stdin.write(jobFile + "\n")
+            self.process.stdin.flush()
+            # FreeCAD writes its own messages to stdout too
+            for line in self.process.stdout:
+                if line.rstrip("\n") == DONE_MARK + jobFile:
+                    break
+            else:
+                self.kill()
+                return _failedResult(
+                    "timeout" if self.timedOut else "worker process failed"
+                )
+        except (OSError, ValueError):
+            self.kill()
+            return _failedResult("worker process failed")
+        finally:
+            timer.cancel()
+        try:
+            with open(job["result"]) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return _failedResult("unfold failed")
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+            self.process.wait()
+
+
+def writeJobs(selection, tempDir, k_factor_lookup, kFactorStandard, bestFace):
+    """Writes the shapes of a list of (object, face name) pairs and their
+    job files to tempDir. Returns the list of (job file, job) pairs.
+    """
+    jobs = []
+    for i, (obj, faceName) in enumerate(selection):
+        base = os.path.join(tempDir, "part%d" % i)
+        obj.Shape.exportBrep(base + ".brep")
+        job = {
+            "brep": base + ".brep",
+            "result": base + ".json",
+            "face_idx": int(faceName.lstrip("Face")) - 1,
+            "k_factor_lookup": {str(k): v for k, v in k_factor_lookup.items()},
+            "k_factor_standard": kFactorStandard,
+            "refine": getattr(obj, "Refine", False) is True,
+            "best_face": bestFace,
+        }
+        jobFile = base + ".job.json"
+        with open(jobFile, "w") as f:
+            json.dump(job, f)
+        jobs.append((jobFile, job))
+    return jobs
+
+
+def runJobs(jobs, executable=None, maxWorkers=None, progress=None, cancel=None):
+    """Unfolds the jobs of writeJobs with maxWorkers worker processes,
+    default is the number of cores. Does not touch the document, so it can
+    run in a thread.
+    executable: the FreeCADCmd to use, the jobs run in process if None.
+    progress: called with the number of done jobs and of all jobs after
+    each job, from the thread that ran it.
+    cancel: a threading.Event, the remaining jobs are dropped and the
+    worker processes killed when it is set.
+    Returns the list of result dictionaries in the order of the jobs.
+    """
+    if maxWorkers is None:
+        maxWorkers = os.cpu_count() or 1
+    if cancel is None:
+        cancel = threading.Event()
+    jobResults = [None] * len(jobs)
+    lock = threading.Lock()
+    done = [0]
+
+    def finish(i, result):
+        with lock:
+            jobResults[i] = result
+            done[0] += 1
+            if progress is not None:
+                progress(done[0], len(jobs))
+
+    if executable is None:
+        FreeCAD.Console.PrintLog("FreeCADCmd not found, unfolding in process\n")
+        for i, (jobFile, job) in enumerate(jobs):
+            if cancel.is_set():
+                break
+            finish(i, unfoldJob(job))
+    else:
+        pending = queue.Queue()
+        for i, job in enumerate(jobs):
+            pending.put((i, job))
+        workers = []
+
+        def work():
+            worker = None
+            try:
+                while not cancel.is_set():
+                    try:
+                        i, (jobFile, job) = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    if worker is None or not worker.alive():
+                        worker = _Worker(executable)
+                        with lock:
+                            workers.append(worker)
+                    finish(i, worker.unfold(jobFile, job))
+            finally:
+                if worker is not None:
+                    worker.close()
+
+        threads = [
+            threading.Thread(target=work) for i in range(min(maxWorkers, len(jobs)))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.2)
+                if cancel.is_set():
+                    with lock:
+                        for worker in workers:
+                            worker.kill()
+    return [r if r is not None else _failedResult("cancelled") for r in jobResults]
+
+
+def readResults(selection, jobResults):
+    """Reads the shapes of the result dictionaries of runJobs.
+    Returns a list of BatchUnfoldResult in the order of the selection.
+    """
+    results = []
+    for (obj, faceName), jobResult in zip(selection, jobResults):
+        result = BatchUnfoldResult(obj, faceName)
+        result.error = jobResult["error"]
+        if jobResult.get("face_idx") is not None:
+            result.faceName = "Face%d" % (jobResult["face_idx"] + 1)
+        if jobResult["flat"]:
+            result.shape = Part.Shape()
+            result.shape.importBrep(jobResult["flat"])
+        if jobResult["folds"]:
+            result.foldLines = Part.Shape()
+            result.foldLines.importBrep(jobResult["folds"])
+        results.append(result)
+    return results
+
+
+def batchUnfold(
+    selection,
+    k_factor_lookup,
+    kFactorStandard="ansi",
+    maxWorkers=None,
+    executable=None,
+    bestFace=False,
+    progress=None,
+):
+    """Unfolds a list of (object, face name) pairs, like (obj, "Face3").
+    k_factor_lookup and kFactorStandard are used for all parts.
+    maxWorkers: number of worker processes, default is the number of cores.
+    executable: the FreeCADCmd to use, searched if None.
+    bestFace: try all flat faces of a part as stationary face and keep the
+    unfold with the smallest bounding box, see getBestUnfold.
+    progress: called with the number of done parts and of all parts.
+    Returns a list of BatchUnfoldResult in the order of the selection.
+    """
+    if executable is None:
+        executable = findFreeCADCmd()
+    with tempfile.TemporaryDirectory(prefix="SheetMetalBatch") as tempDir:
+        jobs = writeJobs(selection, tempDir, k_factor_lookup, kFactorStandard, bestFace)
+        jobResults = runJobs(jobs, executable, maxWorkers, progress)
+        return readResults(selection, jobResults)
+
+
+def addBatchResults(results, doc=None):
+    """Adds the unfolded shapes and fold lines to the document.
+    Returns the list of the new unfold objects.
+    """
+    if doc is None:
+        doc = FreeCAD.ActiveDocument
+    objects = []
+    for result in results:
+        if result.shape is None:
+            FreeCAD.Console.PrintError(
+                "Unfold of %s failed: %s\n" % (result.object.Label, result.error)
+            )
+            continue
+        unfoldShape = doc.addObject("Part::Feature", "Unfold")
+        unfoldShape.Label = result.object.Label + "_Unfold"
+        unfoldShape.Shape = result.shape
+        objects.append(unfoldShape)
+        if result.foldLines is not None:
+            foldLines = doc.addObject("Part::Feature", "FoldLines")
+            foldLines.Label = result.object.Label + "_FoldLines"
+            foldLines.Shape = result.foldLines
+    doc.recompute()
+    return objects
+
+
+if __name__ == "__main__" and WORKER_ENV in os.environ:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    runWorker()
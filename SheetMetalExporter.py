@@ -0,0 +1,505 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#  SheetMetalExporter.py
+#
+#  Copyright 2023 Ondsel Inc.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+###############################################################################
+
+# Export of flat patterns to DXF and SVG.
+#
+# The flat pattern is written in DXF R12, which is read by all CAM and
+# CAD programs. The entities are written to the file one after the other
+# while the wires of the flat pattern are walked, the edges of a wire are
+# only kept while it is written. Circles are written as CIRCLE, the other wires as
+# polylines with bulges for the arcs, loose edges as LINE and ARC. Curves
+# other than lines and circles are approximated by polyline points.
+# The outline, the internal cutouts and the bend lines are put on the
+# layers of LAYERS, in SVG these are groups.
+#
+# Cutouts, which are the same up to a translation, like the holes of a
+# perforated panel, are written once as a DXF block or an SVG definition
+# and referenced by INSERT or <use> at each position, see groupCutouts.
+# For this the wires are walked once before writing, which keeps the group
+# and the position of each cutout, but not its edges.
+
+import math
+
+import Part
+
+# name, color (AutoCAD color index) and SVG color of the layers
+LAYER_OUTLINE = "Outline"
+LAYER_INTERNAL = "Internal"
+LAYER_BEND = "Bend"
+LAYERS = (
+    (LAYER_OUTLINE, 7, "#000000"),
+    (LAYER_INTERNAL, 5, "#0000ff"),
+    (LAYER_BEND, 1, "#ff0000"),
+)
+
+CURVE_DEFLECTION = 0.01  # deflection of the polylines of other curves
+TOLERANCE = 1e-7  # distance of the ends of a closed chain
+SIGNATURE_DIGITS = 6  # rounding of the coordinates of the cutout signatures
+CUTOUT_NAME = "Cutout%d"  # name of the DXF blocks and SVG definitions
+SVG_STROKE_WIDTH = 0.1
+
+
+def flatPatternWires(shape):
+    """Yields the edge chains of a flat pattern, the outline first. shape
+    is the unfolded face, the compound of the flat pattern wires or a
+    compound of projected edges. Each chain is a list of connected edges.
+    """
+    if len(shape.Faces) == 1:
+        face = shape.Faces[0]
+        wires = face.Wires
+        outer = face.OuterWire
+    else:
+        wires = shape.Wires
+        if not wires:
+            # projected edges, the chains need the sorting of all edges
+            wires = [Part.Wire(chain) for chain in Part.sortEdges(shape.Edges)]
+        outer = max(wires, key=lambda wire: wire.BoundBox.DiagonalLength)
+    yield outer.OrderedEdges
+    for wire in wires:
+        if not wire.isSame(outer):
+            yield wire.OrderedEdges
+
+
+def cutoutChains(shape):
+    # the edge chains of the cutouts of a flat pattern, see flatPatternWires
+    chains = flatPatternWires(shape)
+    next(chains)  # the outline
+    return chains
+
+
+def orientedEdges(chain):
+    """Yields (edge, reversed) along a chain of connected edges. reversed
+    is True, if the chain runs against the parameter of the edge.
+    """
+    current = None
+    for i, edge in enumerate(chain):
+        p0, p1 = edgeEnds(edge, False)
+        if current is None:
+            # the first edge ends where the next one is connected
+            current = p0
+            if i + 1 < len(chain):
+                nextPoints = [v.Point for v in chain[i + 1].Vertexes]
+                d0 = min((p0 - p).Length for p in nextPoints)
+                d1 = min((p1 - p).Length for p in nextPoints)
+                if d0 < d1:
+                    current = p1
+        reverse = (p1 - current).Length < (p0 - current).Length
+        yield edge, reverse
+        current = p0 if reverse else p1
+
+
+def isCircle(edge):
+    return isinstance(edge.Curve, Part.Circle)
+
+
+def edgeEnds(edge, reverse):
+    # start and end point of an edge along a chain
+    ends = [edge.valueAt(edge.FirstParameter), edge.valueAt(edge.LastParameter)]
+    if reverse:
+        ends.reverse()
+    return ends
+
+
+def arcBulge(edge, reverse):
+    # bulge of a polyline segment along the arc: the tangent of a quarter of
+    # the opening angle, positive for counterclockwise arcs
+    start, end = edgeEnds(edge, reverse)
+    mid = edge.valueAt((edge.FirstParameter + edge.LastParameter) / 2.0)
+    chord = end - start
+    side = chord.x * (mid.y - start.y) - chord.y * (mid.x - start.x)
+    bulge = math.tan(abs(edge.LastParameter - edge.FirstParameter) / 4.0)
+    return bulge if side < 0 else -bulge
+
+
+def edgePoints(edge, reverse):
+    # points of a curve, which is not a line or an arc
+    points = edge.discretize(Deflection=CURVE_DEFLECTION)
+    if reverse:
+        points.reverse()
+    return points
+
+
+def isFullCircle(chain):
+    return len(chain) == 1 and isCircle(chain[0]) and chain[0].Closed
+
+
+def chainVertexes(chain):
+    """Returns the polyline vertexes (x, y, bulge) of a chain of edges and
+    if the chain is closed. The bulge belongs to the segment starting at
+    the vertex, the start of a closed chain is not repeated at the end.
+    Full circles have no polyline, see isFullCircle.
+    """
+    oriented = list(orientedEdges(chain))
+    start = edgeEnds(*oriented[0])[0]
+    end = edgeEnds(*oriented[-1])[1]
+    closed = (end - start).Length < TOLERANCE
+    vertexes = []
+    for edge, reverse in oriented:
+        if isinstance(edge.Curve, Part.Line) or isCircle(edge):
+            p = edgeEnds(edge, reverse)[0]
+            bulge = arcBulge(edge, reverse) if isCircle(edge) else 0.0
+            vertexes.append((p.x, p.y, bulge))
+        else:
+            points = edgePoints(edge, reverse)
+            vertexes.extend((p.x, p.y, 0.0) for p in points[:-1])
+    if not closed:
+        vertexes.append((end.x, end.y, 0.0))
+    return vertexes, closed
+
+
+def chainSignature(chain):
+    """Returns the signature of a chain of edges and the lower left corner
+    of its bounding box. Chains, which are the same up to a translation,
+    have the same signature: the sorted keys of the edges, made of the
+    curve type and points on the edge relative to the corner. The keys do
+    not depend on the order and the direction of the edges.
+    """
+    box = Part.Compound(chain).BoundBox
+    keys = []
+    for edge in chain:
+        number = 3 if isinstance(edge.Curve, (Part.Line, Part.Circle)) else 9
+        points = tuple(
+            (
+                round(p.x - box.XMin, SIGNATURE_DIGITS),
+                round(p.y - box.YMin, SIGNATURE_DIGITS),
+            )
+            for p in edge.discretize(Number=number)
+        )
+        keys.append((edge.Curve.TypeId, min(points, points[::-1])))
+    keys.sort()
+    return tuple(keys), (box.XMin, box.YMin)
+
+
+def groupCutouts(chains):
+    """Groups the chains of the cutouts, which are the same up to a
+    translation, see chainSignature. Rotated copies are not detected.
+    Returns the group index of each chain and for each group the lower
+    left corners of its chains.
+    """
+    groups = {}  # signature -> group index
+    chainGroups = []
+    corners = []
+    for chain in chains:
+        signature, corner = chainSignature(chain)
+        group = groups.setdefault(signature, len(groups))
+        if group == len(corners):
+            corners.append([])
+        corners[group].append(corner)
+        chainGroups.append(group)
+    return chainGroups, corners
+
+
+class DxfWriter:
+    """Writes the entities of a DXF R12 file to an open text file."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.origin = (0.0, 0.0)  # subtracted from the points, for blocks
+
+    def group(self, code, value):
+        self.stream.write("%d\n%s\n" % (code, value))
+
+    def point(self, x, y, code=10):
+        # x and y with the group codes code and code + 10, z is 0
+        x -= self.origin[0]
+        y -= self.origin[1]
+        self.stream.write(
+            "%d\n%.10g\n%d\n%.10g\n%d\n0.0\n" % (code, x, code + 10, y, code + 20)
+        )
+
+    def header(self):
+        self.group(0, "SECTION")
+        self.group(2, "HEADER")
+        self.group(9, "$ACADVER")
+        self.group(1, "AC1009")
+        self.group(0, "ENDSEC")
+        self.group(0, "SECTION")
+        self.group(2, "TABLES")
+        self.group(0, "TABLE")
+        self.group(2, "LTYPE")
+        self.group(70, 1)
+        self.group(0, "LTYPE")
+        self.group(2, "CONTINUOUS")
+        self.group(70, 0)
+        self.group(3, "Solid line")
+        self.group(72, 65)
+        self.group(73, 0)
+        self.group(40, 0.0)
+        self.group(0, "ENDTAB")
+        self.group(0, "TABLE")
+        self.group(2, "LAYER")
+        self.group(70, len(LAYERS))
+        for name, color, svgColor in LAYERS:
+            self.group(0, "LAYER")
+            self.group(2, name)
+            self.group(70, 0)
+            self.group(62, color)
+            self.group(6, "CONTINUOUS")
+        self.group(0, "ENDTAB")
+        self.group(0, "ENDSEC")
+
+    def section(self, name):
+        self.group(0, "SECTION")
+        self.group(2, name)
+
+    def endSection(self):
+        self.group(0, "ENDSEC")
+
+    def footer(self):
+        self.group(0, "EOF")
+
+    def block(self, name, chain, corner, layer):
+        # block of a chain, the base point is the corner of the chain
+        self.group(0, "BLOCK")
+        self.group(8, layer)
+        self.group(2, name)
+        self.group(70, 0)
+        self.point(0.0, 0.0)
+        self.group(3, name)
+        self.origin = corner
+        self.chain(chain, layer)
+        self.origin = (0.0, 0.0)
+        self.group(0, "ENDBLK")
+        self.group(8, layer)
+
+    def insert(self, name, corner, layer):
+        self.group(0, "INSERT")
+        self.group(8, layer)
+        self.group(2, name)
+        self.point(*corner)
+
+    def line(self, start, end, layer):
+        self.group(0, "LINE")
+        self.group(8, layer)
+        self.point(start.x, start.y)
+        self.point(end.x, end.y, 11)
+
+    def circle(self, center, radius, layer):
+        self.group(0, "CIRCLE")
+        self.group(8, layer)
+        self.point(center.x, center.y)
+        self.group(40, "%.10g" % radius)
+
+    def arc(self, edge, layer):
+        # DXF arcs run counterclockwise from the start to the end angle
+        center = edge.Curve.Center
+        start, end = edgeEnds(edge, arcBulge(edge, False) < 0)
+        self.group(0, "ARC")
+        self.group(8, layer)
+        self.point(center.x, center.y)
+        self.group(40, "%.10g" % edge.Curve.Radius)
+        angle = math.degrees(math.atan2(start.y - center.y, start.x - center.x))
+        self.group(50, "%.10g" % angle)
+        angle = math.degrees(math.atan2(end.y - center.y, end.x - center.x))
+        self.group(51, "%.10g" % angle)
+
+    def polyline(self, vertexes, closed, layer):
+        # vertexes: iterable of (x, y, bulge)
+        self.group(0, "POLYLINE")
+        self.group(8, layer)
+        self.group(66, 1)
+        self.group(70, 1 if closed else 0)
+        self.group(10, 0.0)  # the elevation, the vertexes have the points
+        self.group(20, 0.0)
+        self.group(30, 0.0)
+        for x, y, bulge in vertexes:
+            self.group(0, "VERTEX")
+            self.group(8, layer)
+            self.point(x, y)
+            if bulge:
+                self.group(42, "%.10g" % bulge)
+        self.group(0, "SEQEND")
+        self.group(8, layer)
+
+    def edge(self, edge, layer):
+        if isinstance(edge.Curve, Part.Line):
+            self.line(edge.Vertexes[0].Point, edge.Vertexes[-1].Point, layer)
+        elif isCircle(edge) and edge.Closed:
+            self.circle(edge.Curve.Center, edge.Curve.Radius, layer)
+        elif isCircle(edge):
+            self.arc(edge, layer)
+        else:
+            points = edgePoints(edge, False)
+            self.polyline(((p.x, p.y, 0.0) for p in points), False, layer)
+
+    def chain(self, chain, layer):
+        """Writes a chain of connected edges as one polyline, a single
+        edge as LINE, ARC or CIRCLE.
+        """
+        if len(chain) == 1:
+            self.edge(chain[0], layer)
+        else:
+            self.polyline(*chainVertexes(chain), layer)
+
+
+class SvgWriter:
+    """Writes the elements of an SVG file to an open text file. The points
+    are written in the coordinates of the flat pattern, in millimeters,
+    the layers flip the y axis.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.origin = (0.0, 0.0)  # subtracted from the points, for definitions
+
+    def header(self, box):
+        # box: the bounding box of the flat pattern
+        m = SVG_STROKE_WIDTH
+        width = box.XLength + 2 * m
+        height = box.YLength + 2 * m
+        self.stream.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'width="%.10gmm" height="%.10gmm" viewBox="%.10g %.10g %.10g %.10g">\n'
+            % (width, height, box.XMin - m, -box.YMax - m, width, height)
+        )
+
+    def footer(self):
+        self.stream.write("</svg>\n")
+
+    def layer(self, name, color):
+        self.stream.write(
+            '<g id="%s" transform="scale(1,-1)" fill="none" stroke="%s" '
+            'stroke-width="%.10g">\n' % (name, color, SVG_STROKE_WIDTH)
+        )
+
+    def endLayer(self):
+        self.stream.write("</g>\n")
+
+    def definition(self, name, chain, corner):
+        # definition of a chain, placed by the corner of the chain
+        self.stream.write("<defs>\n")
+        self.origin = corner
+        self.chain(chain, ' id="%s"' % name)
+        self.origin = (0.0, 0.0)
+        self.stream.write("</defs>\n")
+
+    def use(self, name, corner):
+        self.stream.write(
+            '<use xlink:href="#%s" x="%.10g" y="%.10g"/>\n'
+            % (name, corner[0], corner[1])
+        )
+
+    def chain(self, chain, attributes=""):
+        ox, oy = self.origin
+        if isFullCircle(chain):
+            center = chain[0].Curve.Center
+            self.stream.write(
+                '<circle%s cx="%.10g" cy="%.10g" r="%.10g"/>\n'
+                % (attributes, center.x - ox, center.y - oy, chain[0].Curve.Radius)
+            )
+            return
+        vertexes, closed = chainVertexes(chain)
+        if closed:
+            vertexes.append(vertexes[0])
+        x0, y0, bulge = vertexes[0]
+        path = ["M %.10g %.10g" % (x0 - ox, y0 - oy)]
+        for x, y, nextBulge in vertexes[1:]:
+            if bulge:
+                # arc through the end points with the opening angle of the bulge
+                chord = math.hypot(x - x0, y - y0)
+                radius = chord * (1.0 + bulge * bulge) / (4.0 * abs(bulge))
+                path.append(
+                    "A %.10g %.10g 0 %d %d %.10g %.10g"
+                    % (radius, radius, abs(bulge) > 1.0, bulge > 0, x - ox, y - oy)
+                )
+            else:
+                path.append("L %.10g %.10g" % (x - ox, y - oy))
+            x0, y0, bulge = x, y, nextBulge
+        if closed:
+            path.append("Z")
+        self.stream.write('<path%s d="%s"/>\n' % (attributes, " ".join(path)))
+
+
+def exportFlatPatternDxf(filename, shape, foldEdges=None):
+    """Writes a flat pattern to a DXF R12 file. shape is the flat pattern in
+    the XY plane, see flatPatternWires, foldEdges a shape with the bend
+    lines or None. Repeated cutouts are written as blocks.
+    """
+    chainGroups, corners = groupCutouts(cutoutChains(shape))
+    with open(filename, "w", newline="\r\n") as stream:
+        writer = DxfWriter(stream)
+        writer.header()
+        writer.section("BLOCKS")
+        written = set()
+        for chain, group in zip(cutoutChains(shape), chainGroups):
+            if len(corners[group]) > 1 and group not in written:
+                written.add(group)
+                name = CUTOUT_NAME % group
+                writer.block(name, chain, corners[group][0], LAYER_INTERNAL)
+        writer.endSection()
+        writer.section("ENTITIES")
+        chains = flatPatternWires(shape)
+        writer.chain(next(chains), LAYER_OUTLINE)
+        written = set()
+        for chain, group in zip(chains, chainGroups):
+            if len(corners[group]) == 1:
+                writer.chain(chain, LAYER_INTERNAL)
+            elif group not in written:
+                written.add(group)
+                for corner in corners[group]:
+                    writer.insert(CUTOUT_NAME % group, corner, LAYER_INTERNAL)
+        if foldEdges is not None:
+            for edge in foldEdges.Edges:
+                writer.edge(edge, LAYER_BEND)
+        writer.endSection()
+        writer.footer()
+
+
+def exportFlatPatternSvg(filename, shape, foldEdges=None):
+    """Writes a flat pattern to an SVG file, like exportFlatPatternDxf.
+    Repeated cutouts are written as definitions with <use> references.
+    """
+    chainGroups, corners = groupCutouts(cutoutChains(shape))
+    box = shape.BoundBox
+    if foldEdges is not None:
+        box.add(foldEdges.BoundBox)
+    colors = {name: svgColor for name, color, svgColor in LAYERS}
+    with open(filename, "w") as stream:
+        writer = SvgWriter(stream)
+        writer.header(box)
+        chains = flatPatternWires(shape)
+        writer.layer(LAYER_OUTLINE, colors[LAYER_OUTLINE])
+        writer.chain(next(chains))
+        writer.endLayer()
+        # the definition is written at the first cutout of a group
+        writer.layer(LAYER_INTERNAL, colors[LAYER_INTERNAL])
+        written = set()
+        for chain, group in zip(chains, chainGroups):
+            if len(corners[group]) == 1:
+                writer.chain(chain)
+            elif group not in written:
+                written.add(group)
+                writer.definition(CUTOUT_NAME % group, chain, corners[group][0])
+                for corner in corners[group]:
+                    writer.use(CUTOUT_NAME % group, corner)
+        writer.endLayer()
+        if foldEdges is not None:
+            writer.layer(LAYER_BEND, colors[LAYER_BEND])
+            for edge in foldEdges.Edges:
+                writer.chain([edge])
+            writer.endLayer()
+        writer.footer()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+###############################################################################
+#
+#  SheetMetalUnfoldCache.py
+#
+#  Copyright 2023 Ondsel Inc.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+###############################################################################
+
+# Cache of unfold results.
+#
+# The key is a hash of the shape BREP, the index of the base face and the
+# unfold settings, including the flat pattern only mode. The last unfolds
+# are kept in memory, and optionally in files under the user data folder,
+# which are removed oldest first when the folder gets bigger than the
+# maximum size.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import FreeCAD
+import Part
+
+# change this, if the unfolder gives different results for the same input
+CACHE_VERSION = "2"
+
+
+def shapeKey(shape, refine):
+    # hash of the shape and the settings of the analysis of the shape,
+    # the analyzed tree can be unfolded from any of its flat faces
+    h = hashlib.sha256()
+    h.update(CACHE_VERSION.encode())
+    h.update(shape.exportBrepToString().encode())
+    h.update(repr(bool(refine)).encode())
+    return h.hexdigest()
+
+
+class UnfoldCache:
+    def __init__(self, maxEntries=32, diskDir=None, maxDiskSize=100 * 1024 * 1024):
+        self.maxEntries = maxEntries  # number of results in memory
+        self.diskDir = diskDir  # folder of the disk cache, None: no disk cache
+        self.maxDiskSize = maxDiskSize  # size of the disk cache in bytes
+        self.entries = OrderedDict()  # key -> (flat shape, fold lines)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(
+        shape,
+        face_idx,
+        k_factor_lookup,
+        kFactorStandard,
+        refine,
+        sKey=None,
+        flatPatternOnly=False,
+    ):
+        # sKey: shapeKey(shape, refine), if it is already known
+        if sKey is None:
+            sKey = shapeKey(shape, refine)
+        lookup = sorted((float(k), float(v)) for k, v in k_factor_lookup.items())
+        settings = (sKey, face_idx, lookup, kFactorStandard, bool(flatPatternOnly))
+        return hashlib.sha256(repr(settings).encode()).hexdigest()
+
+    def _diskPaths(self, key):
+        return (
+            os.path.join(self.diskDir, key + ".flat.brep"),
+            os.path.join(self.diskDir, key + ".folds.brep"),
+        )
+
+    def get(self, key):
+        """Returns copies of the cached (flat shape, fold lines) or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None and self.diskDir is not None:
+            entry = self._readDisk(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        return entry[0].copy(), entry[1].copy()
+
+    def put(self, key, flat, folds):
+        entry = (flat.copy(), folds.copy())
+        self._remember(key, entry)
+        if self.diskDir is not None:
+            self._writeDisk(key, entry)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if self.diskDir is not None and os.path.isdir(self.diskDir):
+            for name in os.listdir(self.diskDir):
+                if name.endswith(".brep"):
+                    os.remove(os.path.join(self.diskDir, name))
+
+    def _remember(self, key, entry):
+        if self.maxEntries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def _readDisk(self, key):
+        flatPath, foldsPath = self._diskPaths(key)
+        if not (os.path.isfile(flatPath) and os.path.isfile(foldsPath)):
+            return None
+        try:
+            flat = Part.Shape()
+            flat.importBrep(flatPath)
+            folds = Part.Shape()
+            folds.importBrep(foldsPath)
+            # the modification time is used for the eviction of old entries
+            os.utime(flatPath)
+            os.utime(foldsPath)
+        except Exception as e:
+            FreeCAD.Console.PrintLog("Unfold cache: can't read entry: " + str(e) + "\n")
+            return None
+        return flat, folds
+
+    def _writeDisk(self, key, entry):
+        flatPath, foldsPath = self._diskPaths(key)
+        try:
+            os.makedirs(self.diskDir, exist_ok=True)
+            entry[0].exportBrep(flatPath)
+            entry[1].exportBrep(foldsPath)
+            self._evictDisk()
+        except Exception as e:
+            FreeCAD.Console.PrintLog(
+                "Unfold cache: can't write entry: " + str(e) + "\n"
+            )
+
+    def _evictDisk(self):
+        # remove the oldest entries, the flat shape and the fold lines of an
+        # entry are removed together
+        entries = {}  # key -> [modification time, size, paths]
+        size = 0
+        for name in os.listdir(self.diskDir):
+            for suffix in (".flat.brep", ".folds.brep"):
+                if name.endswith(suffix):
+                    path = os.path.join(self.diskDir, name)
+                    stat = os.stat(path)
+                    entry = entries.setdefault(name[: -len(suffix)], [0.0, 0, []])
+                    entry[0] = max(entry[0], stat.st_mtime)
+                    entry[1] += stat.st_size
+                    entry[2].append(path)
+                    size += stat.st_size
+        for mtime, esize, paths in sorted(entries.values()):
+            if size <= self.maxDiskSize:
+                break
+            for path in paths:
+                os.remove(path)
+            size -= esize
+
+
+_cache = None
+
+
+def getUnfoldCache():
+    """Returns the unfold cache configured in the preferences, None if the
+    cache is disabled.
+    """
+    global _cache
+    pg = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/SheetMetal")
+    maxEntries = pg.GetInt("UnfoldCacheEntries", 32)
+    diskDir = None
+    if pg.GetInt("UnfoldDiskCache", 0):  # 0 = disabled, 1 = enabled
+        diskDir = os.path.join(FreeCAD.getUserAppDataDir(), "SheetMetal", "UnfoldCache")
+    if maxEntries <= 0 and diskDir is None:
+        return None
+    maxDiskSize = pg.GetInt("UnfoldDiskCacheSize", 100) * 1024 * 1024  # MB
+    if _cache is None:
+        _cache = UnfoldCache(maxEntries, diskDir, maxDiskSize)
+    else:
+        _cache.maxEntries = maxEntries
+        _cache.diskDir = diskDir
+        _cache.maxDiskSize = maxDiskSize
+    return _cache
@@ -24,7 +24,7 @@
 #
 ###############################################################################
 
-import Part, FreeCAD, FreeCADGui, os
+import Part, FreeCAD, FreeCADGui, os, tempfile, threading
 from PySide import QtGui, QtCore
 from FreeCAD import Gui
 from UnfoldGUI import SMUnfoldTaskPanel
@@ -35,6 +35,7 @@ except:
     from Drawing import projectEx
 
 from engineering_mode import engineering_mode_enabled
+import SheetMetalBatchUnfold
 from SheetMetalLogger import SMLogger, UnfoldException, BendException, TreeException
 
 
@@ -54,7 +55,10 @@ class SMUnfoldUnattendedCommandClass:
                 "SheetMetal",
                 "Flatten folded sheet metal object with default options\n"
                 "1. Select flat face on sheetmetal shape.\n"
-                "2. Change parameters from task Panel to create unfold Shape & Flatten drawing.",
+                "2. Change parameters from task Panel to create unfold Shape & Flatten drawing.\n"
+                "With the preference 'Unfold from the best flat face', the flat\n"
+                "face giving the smallest flat pattern is used instead of the\n"
+                "selected one.",
             ),
         }
 
@@ -78,6 +82,7 @@ class SMUnfoldUnattendedCommandClass:
         taskd.form.bendColor.setProperty("color", pg.GetString("bendColor"))
         taskd.form.genColor.setProperty("color", pg.GetString("genColor"))
         taskd.form.internalColor.setProperty("color", pg.GetString("intColor"))
+        taskd.bestFace = pg.GetBool("batchUnfoldBestFace", False)
         # taskd.new_mds_name = taskd.material_sheet_name
         taskd.accept()
         return
@@ -143,3 +148,137 @@ class SMUnfoldCommandClass:
         return isinstance(selFace.Surface, Part.Plane)
 
 Gui.addCommand("SheetMetal_Unfold", SMUnfoldCommandClass())
+
+
+class SMBatchUnfoldRun:
+    """Runs the jobs of a batch unfold in a thread and shows the progress.
+    The shapes are written and the results added in the GUI thread.
+    """
+
+    def __init__(self, selection, lookup, kFactorStandard, bestFace):
+        self.selection = selection
+        self.doc = FreeCAD.ActiveDocument
+        self.tempDir = tempfile.TemporaryDirectory(prefix="SheetMetalBatch")
+        jobs = SheetMetalBatchUnfold.writeJobs(
+            selection, self.tempDir.name, lookup, kFactorStandard, bestFace
+        )
+        self.executable = SheetMetalBatchUnfold.findFreeCADCmd()
+        self.done = 0
+        self.jobResults = None
+        self.error = None
+        self.finished = False
+        self.cancel = threading.Event()
+        self.dialog = QtGui.QProgressDialog(
+            FreeCAD.Qt.translate("SheetMetal", "Unfolding sheet metal objects..."),
+            FreeCAD.Qt.translate("SheetMetal", "Cancel"),
+            0,
+            len(jobs),
+            Gui.getMainWindow(),
+        )
+        self.dialog.setWindowTitle(FreeCAD.Qt.translate("SheetMetal", "Batch Unfold"))
+        self.dialog.setAutoClose(False)
+        self.dialog.setMinimumDuration(0)
+        self.dialog.canceled.connect(self.cancel.set)
+        self.thread = threading.Thread(target=self.run, args=(jobs,), daemon=True)
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.update)
+        self.thread.start()
+        self.timer.start(200)
+
+    def progress(self, done, total):
+        # called from the worker threads, the dialog is updated by the timer
+        self.done = done
+
+    def run(self, jobs):
+        try:
+            self.jobResults = SheetMetalBatchUnfold.runJobs(
+                jobs, self.executable, progress=self.progress, cancel=self.cancel
+            )
+        except Exception as e:
+            self.error = e
+
+    def update(self):
+        self.dialog.setValue(self.done)
+        if self.thread.is_alive():
+            return
+        self.timer.stop()
+        self.dialog.close()
+        try:
+            if self.error is not None:
+                SMLogger.error(
+                    FreeCAD.Qt.translate("Logger", "Batch unfold failed: {}").format(
+                        self.error
+                    )
+                )
+            elif self.doc.Name in FreeCAD.listDocuments():
+                results = SheetMetalBatchUnfold.readResults(
+                    self.selection, self.jobResults
+                )
+                self.doc.openTransaction("Batch Unfold")
+                SheetMetalBatchUnfold.addBatchResults(results, self.doc)
+                self.doc.commitTransaction()
+        finally:
+            self.tempDir.cleanup()
+            self.finished = True
+
+
+class SMBatchUnfoldCommandClass:
+    """Unfold many objects"""
+
+    def __init__(self):
+        self.running = None
+
+    def GetResources(self):
+        __dir__ = os.path.dirname(__file__)
+        iconPath = os.path.join(__dir__, "Resources", "icons")
+        return {
+            "Pixmap": os.path.join(
+                iconPath, "SheetMetal_UnfoldUnattended.svg"
+            ),  # the name of a svg file available in the resources
+            "MenuText": FreeCAD.Qt.translate("SheetMetal", "Batch Unfold"),
+            "ToolTip": FreeCAD.Qt.translate(
+                "SheetMetal",
+                "Flatten several folded sheet metal objects with default options\n"
+                "1. Select one flat face on each sheetmetal shape.\n"
+                "2. The objects are unfolded in parallel with the manual K-factor.\n"
+                "   With the preference 'Unfold from the best flat face', the flat\n"
+                "   face giving the smallest flat pattern is used instead of the\n"
+                "   selected one.",
+            ),
+        }
+
+    def Activated(self):
+        pg = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/SheetMetal")
+        lookup = {1: pg.GetFloat("manualKFactor", 0.40)}
+        selection = [
+            (sel.Object, sel.SubElementNames[0])
+            for sel in Gui.Selection.getSelectionEx()
+        ]
+        SMLogger.message(
+            FreeCAD.Qt.translate("Logger", "Running batch unfold of {} objects...").format(
+                len(selection)
+            )
+        )
+        # keep the run, it is needed until its thread has finished
+        self.running = SMBatchUnfoldRun(
+            selection,
+            lookup,
+            pg.GetString("kFactorStandard", "ansi"),
+            pg.GetBool("batchUnfoldBestFace", False),
+        )
+
+    def IsActive(self):
+        if self.running is not None and not self.running.finished:
+            return False
+        selection = Gui.Selection.getSelectionEx()
+        if len(selection) < 1:
+            return False
+        for sel in selection:
+            if len(sel.SubElementNames) != 1:
+                return False
+            if not isinstance(sel.SubObjects[0].Surface, Part.Plane):
+                return False
+        return True
+
+
+Gui.addCommand("SheetMetal_BatchUnfold", SMBatchUnfoldCommandClass())
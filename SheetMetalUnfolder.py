@@ -103,10 +103,11 @@ if __name__ == '__main__':
 """
 
 
-import Part, FreeCAD, FreeCADGui, os, sys
+import Part, FreeCAD, os, sys
+import bisect
 from FreeCAD import Base
-import DraftVecUtils, math, time
-import Draft
+import math, time
+import numpy as np
 
 # import traceback
 
@@ -120,13 +121,13 @@ except ImportError:
 from lookup import get_val_from_range
 
 import tempfile
+import copy
 from math import sqrt
 
 from SheetMetalLogger import SMLogger, UnfoldException, BendException, TreeException
+import SheetMetalUnfoldCache
 
 
-KFACTORSTANDARD = None
-
 # TODO: Error Codes
 # - Put error numbers into the text
 # - Put user help into more texts
@@ -160,6 +161,7 @@ unfold_error = {
     24: ("Unfold: bend-face without child not implemented"),
     25: ("Unfold: "),
     26: ("Unfold: not handled curve type in unbendFace"),
+    27: ("Unfold: edges of a bend face wire are not connected"),
     -1: ("Unknown error"),
 }
 
@@ -279,6 +281,69 @@ def radial_vector(point, axis_pnt, axis):
     return perp.normalize()
 
 
+def unbend_points(
+    points,
+    cent,
+    axis,
+    nullVec,
+    tanVec,
+    transRad,
+    compRadialVec=None,
+    wrapAngle=-math.pi / 8,
+):
+    """Unbends a list of points of a bend around the bend axis in one go.
+    points: list of Base.Vector or (N,3) array.
+    cent, axis: bend axis, axis is a unit vector.
+    nullVec: radial vector at the parent edge, where the angle is 0.
+    tanVec, transRad: the unbend point moves by tanVec * transRad * angle.
+    compRadialVec: aligns the unbend points to the sheet plane, used for
+    the top and the counter face.
+    wrapAngle: angles below this are taken as angle + 2*pi.
+    Returns an (N,3) array of the unbend points.
+    """
+    pts = np.array([(p[0], p[1], p[2]) for p in points], dtype=float).reshape(-1, 3)
+    c = np.array((cent.x, cent.y, cent.z))
+    a = np.array((axis.x, axis.y, axis.z))
+    n = np.array((nullVec.x, nullVec.y, nullVec.z))
+    t = np.array((tanVec.x, tanVec.y, tanVec.z))
+
+    rel = pts - c
+    along = rel @ a
+    radial = rel - np.outer(along, a)  # same direction as radial_vector
+    angle = np.arctan2(np.cross(n, radial) @ a, radial @ n)
+    angle = np.where(angle < wrapAngle, angle + 2 * math.pi, angle)
+
+    # rotate by -angle around the axis, like SheetTree.rotateVec
+    a_x_rel = np.cross(a, rel)
+    rot = (
+        np.cross(a_x_rel, a) * np.cos(angle)[:, None]
+        - a_x_rel * np.sin(angle)[:, None]
+        + np.outer(along, a)
+    )
+    result = c + rot + np.outer(transRad * angle, t)
+    if compRadialVec is not None:
+        # correctionVec = compRadialVec - axis x (axis x (-rot))
+        comp = np.array((compRadialVec.x, compRadialVec.y, compRadialVec.z))
+        result += comp - np.cross(a, np.cross(a, -rot))
+    return result
+
+
+def to_vectors(points):
+    # (N,3) array to a list of Base.Vector
+    return [Base.Vector(p[0], p[1], p[2]) for p in points.tolist()]
+
+
+def near_values(entries, value, tol):
+    # face indexes of the entries of a sorted list of (value, face index),
+    # whose value differs not more than tol from value
+    result = []
+    pos = bisect.bisect_left(entries, (value - tol, -1))
+    while pos < len(entries) and entries[pos][0] <= value + tol:
+        result.append(entries[pos][1])
+        pos += 1
+    return result
+
+
 def equal_angle(ang1, ang2, p=5):
     # compares two angles
     result = False
@@ -312,6 +377,64 @@ def equal_edge(edg1, edg2, p=5):
     return result
 
 
+class VertexIndex(object):
+    """Spatial hash for points, used to find coincident vertices in near
+    constant time. The points are stored in a grid of cells keyed by their
+    quantized coordinates. Two points are coincident, if equal_vector
+    accepts them with the precision p. Each group of coincident points
+    gets an id, which is the index of its first point in self.points.
+    """
+
+    def __init__(self, p=5):
+        self.p = p
+        self.tol = 10.0**-p  # upper bound of the distance accepted by equal_vector
+        self.cell = 16.0 * self.tol  # cell size, points near a border need a neighbor cell
+        self.grid = {}  # cell key -> list of vertex ids
+        self.points = []  # vertex id -> Base.Vector of the first point
+
+    def _cell_keys(self, point):
+        # Return the key of the cell of point and of the neighbor cells,
+        # if point is nearer than the tolerance to the cell border.
+        offsets = []
+        keys = []
+        for coord in (point.x, point.y, point.z):
+            scaled = coord / self.cell
+            k = math.floor(scaled)
+            frac = (scaled - k) * self.cell
+            axis_offsets = [k]
+            if frac < self.tol:
+                axis_offsets.append(k - 1)
+            if self.cell - frac < self.tol:
+                axis_offsets.append(k + 1)
+            offsets.append(axis_offsets)
+        for kx in offsets[0]:
+            for ky in offsets[1]:
+                for kz in offsets[2]:
+                    keys.append((kx, ky, kz))
+        return keys
+
+    def find(self, point):
+        """Return the vertex id of a point coincident to point or None."""
+        for key in self._cell_keys(point):
+            for vid in self.grid.get(key, ()):
+                if equal_vector(self.points[vid], point, self.p):
+                    return vid
+        return None
+
+    def add(self, point):
+        """Add point to the index and return its vertex id.
+        A point coincident to an already known point gets the known id.
+        """
+        vid = self.find(point)
+        if vid is None:
+            vid = len(self.points)
+            self.points.append(point)
+            scaled = (point.x / self.cell, point.y / self.cell, point.z / self.cell)
+            key = tuple(math.floor(c) for c in scaled)
+            self.grid.setdefault(key, []).append(vid)
+        return vid
+
+
 class Simple_node(object):
     """This class defines the nodes of a tree, that is the result of
     the analysis of a sheet-metal-part.
@@ -319,16 +442,49 @@ class Simple_node(object):
     The indexes are the number of the face in the original part.
     Faces of the edge of the metal-sheet need in cases to be split.
     These new faces are added to the index list.
+    The attributes are slots, trees of big parts have many nodes.
     """
 
-    global KFACTORSTANDARD
+    __slots__ = (
+        "idx",
+        "c_face_idx",
+        "node_type",
+        "p_node",
+        "p_edge",
+        "child_list",
+        "child_idx_lists",
+        "axis",
+        "facePosi",
+        "bendCenter",
+        "distCenter",
+        "innerRadius",
+        "thickness",
+        "bend_dir",
+        "bend_angle",
+        "tan_vec",
+        "oppositePoint",
+        "vertexDict",
+        "vertexIndex",
+        "vertexKeys",
+        "edgeDict",
+        "_trans_length",
+        "trans_angle",
+        "analysis_ok",
+        "error_code",
+        "context",
+        "k_factor_lookup",
+        "nfIndexes",
+        "seam_edges",
+        "unfoldTopList",
+        "unfoldCounterList",
+    )
 
     def __init__(
         self,
         f_idx=None,
         Parent_node=None,
         Parent_edge=None,
-        k_factor_lookup=None,
+        context=None,
     ):
         self.idx = f_idx  # Index of the "top-face"
         self.c_face_idx = (
@@ -340,7 +496,6 @@ class Simple_node(object):
         self.child_list = []  # List of child-nodes = link to tree structure
         self.child_idx_lists = []  # List of lists with child_idx and child_edge
         # need a list of indices of child faces
-        self.sheet_edges = []  # List of edges without child-face
         self.axis = None  # Direction of the axis of the detected cylindrical face
         self.facePosi = None
         self.bendCenter = None  # Vector of the center of the detected cylindrical face
@@ -348,33 +503,31 @@ class Simple_node(object):
             None  # Value used to detect faces at opposite side of the bend
         )
         self.innerRadius = None  # nominal radius of the bend
+        self.thickness = None  # sheet thickness, used for the K-factor
         # self.axis for 'Flat'-face: vector pointing from the surface into the metal
         self.bend_dir = None  # Bend direction values: "up" or "down"
         self.bend_angle = None  # Angle in radians
         self.tan_vec = None  # Direction of translation for Bend nodes
         self.oppositePoint = None  # Point of a vertex on the opposite site, used to align points to the sheet plane
         self.vertexDict = {}  # Vertexes of a bend, original and unbend coordinates, flags p, c, t, o
-        self.edgeDict = {}  # Unbend edges dictionary, key is a combination of indexes to vertexDict.
+        self.vertexIndex = None  # Original coordinates of vertexDict, see findVertex
+        self.vertexKeys = {}  # vertex id in vertexIndex -> key in vertexDict
+        self.edgeDict = {}  # Unbend edges dictionary, key is the tuple of the sorted vertexDict keys.
         self._trans_length = None  # Length of translation for Bend nodes
+        self.trans_angle = None  # Bend angle used for the translation length
         self.analysis_ok = (
             True  # Indicator if something went wrong with the analysis of the face
         )
         self.error_code = None  # Index to unfold_error dictionary
+        self.context = context  # UnfoldContext of the tree
         self.k_factor_lookup = (
-            k_factor_lookup  # K-factor lookup dictionary, according to ANSI standard
-        )
+            context.k_factor_lookup if context else None
+        )  # K-factor lookup dictionary, according to ANSI standard
         # new node features:
         self.nfIndexes = []  # List of all face-indexes of a node (flat and bend: folded state)
         self.seam_edges = []  # List with edges to seams
-        # bend faces are needed for movement simulation at single other bends.
-        # otherwise unfolded faces are recreated from self.b_edges
-        self.node_flattened_faces = []  # Faces of a flattened bend node
         self.unfoldTopList = None  # Source of identical side edges
         self.unfoldCounterList = None  # Source of identical side edges
-        self.actual_angle = None  # State of angle in refolded sheet metal part
-        self.p_wire = None  # Wire common with parent node, used for bend node
-        self.c_wire = None  # Wire common with child node, used for bend node
-        self.b_edges = []  # List of edges in a bend node, that needs to be recalculated, at unfolding
 
     def dump(self):
         print("Node: %s" % (str(self.idx)))
@@ -383,7 +536,6 @@ class Simple_node(object):
         print("  Parent edge: %s" % (str(self.p_edge)))
         print("  Children: %s" % (str(self.child_list)))
         print("  Child idx lists: %s" % (str(self.child_idx_lists)))
-        print("  Sheet edges: %s" % (str(self.sheet_edges)))
         print("  Axis: %s" % (str(self.axis)))
         print("  Face position: %s" % (str(self.facePosi)))
         print("  Bend center: %s" % (str(self.bendCenter)))
@@ -396,28 +548,63 @@ class Simple_node(object):
         print("  Vertex dictionary: %s" % (str(self.vertexDict)))
         print("  Edge dictionary: %s" % (str(self.edgeDict)))
         print("  translation length %s" % (str(self._trans_length)))
+        print("  translation angle %s" % (str(self.trans_angle)))
         print("  Analysis ok: %s" % (str(self.analysis_ok)))
         print("  Error code: %s" % (str(self.error_code)))
         print("  K-factor lookup: %s" % (str(self.k_factor_lookup)))
         print("  nfIndexes: %s" % (str(self.nfIndexes)))
         print("  seam edges: %s" % (str(self.seam_edges)))
-        print("  node flattened faces: %s" % (str(self.node_flattened_faces)))
         print("  unfoldTopList: %s" % (str(self.unfoldTopList)))
         print("  unfoldCounterList: %s" % (str(self.unfoldCounterList)))
-        print("  actual angle: %s" % (str(self.actual_angle)))
-        print("  p_wire: %s" % (str(self.p_wire)))
-        print("  c_wire: %s" % (str(self.c_wire)))
-        print("  b_edges: %s" % (str(self.b_edges)))
 
     def get_Face_idx(self):
         # get the face index from the tree-element
         return self.idx
 
+    def addVertex(self, key, flagStr, origVec, unbendVec):
+        # add an entry to vertexDict and to the index of its original point
+        self.vertexDict[key] = flagStr, origVec, unbendVec
+        if self.vertexIndex is None:
+            self.vertexIndex = VertexIndex()
+        self.vertexKeys[self.vertexIndex.add(origVec)] = key
+
+    def findVertex(self, point):
+        # key of the vertexDict entry with the original point at point or None
+        if self.vertexIndex is None:
+            return None
+        vid = self.vertexIndex.find(point)
+        if vid is None:
+            return None
+        key = self.vertexKeys.get(vid)
+        if key not in self.vertexDict:
+            return None  # removed by removeVertex
+        if not equal_vector(self.vertexDict[key][1], point):
+            return None  # the key was used again for another point
+        return key
+
+    def removeVertex(self, key):
+        del self.vertexDict[key]
+
+    def clearVertexes(self):
+        self.vertexDict = {}
+        self.vertexIndex = None
+        self.vertexKeys = {}
+        self.edgeDict = {}
+
+    def release(self):
+        # drop the edges and unbend data, after the node has been unfolded
+        self.clearVertexes()
+        self.p_edge = None
+        self.child_idx_lists = []
+        self.seam_edges = []
+        self.unfoldTopList = None
+        self.unfoldCounterList = None
+
     @property
     def k_Factor(self):
         k = get_val_from_range(self.k_factor_lookup, self.innerRadius / self.thickness)
 
-        return k if KFACTORSTANDARD == "ansi" else k / 2
+        return k if self.context.k_factor_standard == "ansi" else k / 2
 
     @k_Factor.setter
     def k_Factor(self, val):
@@ -429,6 +616,40 @@ class Simple_node(object):
         )
 
 
+class UnfoldContext(object):
+    """Settings of one unfold operation, carried by the SheetTree and its
+    nodes. Each unfold has its own context, so unfolds with different
+    settings can run at the same time.
+    """
+
+    def __init__(
+        self,
+        k_factor_lookup,
+        k_factor_standard="ansi",
+        refine=False,
+        cFaceTol=0.002,
+    ):
+        # K-factor lookup dictionary, according to ANSI standard
+        self.k_factor_lookup = k_factor_lookup
+        # "ansi" or "din", DIN K-factors are half of the ANSI ones
+        self.k_factor_standard = k_factor_standard
+        # The Refine property of the unfolded object. With refined shapes, the
+        # counter faces are checked by distance and chamfers are handled.
+        self.refine = refine
+        # tolerance to detect counter-face vertices
+        # this high tolerance was needed for more real parts
+        self.cFaceTol = cFaceTol
+
+
+def face_contains(face, point, tol=1e-7):
+    # True, if point is on the face
+    surface = face.Surface
+    u, v = surface.parameter(point)
+    if surface.value(u, v).distanceToPoint(point) > tol:
+        return False
+    return face.isPartOfDomain(u, v)
+
+
 def get_surface(face):
     # 'searchSubShape' is used to distinguish upstream FreeCAD with LinkStage3
     # branch, which has a different implementation of findPlane()
@@ -445,6 +666,64 @@ def get_surface(face):
     return surface
 
 
+class SurfaceTable(object):
+    """Descriptors of the faces of a shape, queried once from OCC. The
+    values are stored in NumPy arrays indexed by the face index:
+    kinds: PLANE, CYLINDER or OTHER
+    directions: outer normal of a plane (see get_surface), axis of a cylinder
+    centers: position of a plane, center of a cylinder
+    radii: radius of a cylinder
+    par_ranges: parameter range (u0, u1, v0, v1) of the face
+    The surfaces are kept for the queries of surface parameters. The areas
+    are only computed on request, see area.
+    """
+
+    PLANE = 0
+    CYLINDER = 1
+    OTHER = 2
+
+    def __init__(self, faces):
+        n = len(faces)
+        self.surfaces = []
+        self.kinds = np.full(n, self.OTHER, dtype=np.int8)
+        self.directions = np.zeros((n, 3))
+        self.centers = np.zeros((n, 3))
+        self.radii = np.zeros(n)
+        self.par_ranges = np.zeros((n, 4))
+        self.faces = faces
+        self.areas = {}  # face index -> area, see area
+        for i, face in enumerate(faces):
+            surface = get_surface(face)
+            self.surfaces.append(surface)
+            if isinstance(surface, Part.Plane):
+                self.kinds[i] = self.PLANE
+                self.directions[i] = tuple(surface.Axis)
+                self.centers[i] = tuple(surface.Position)
+            elif isinstance(surface, Part.Cylinder):
+                self.kinds[i] = self.CYLINDER
+                self.directions[i] = tuple(surface.Axis)
+                self.centers[i] = tuple(surface.Center)
+                self.radii[i] = surface.Radius
+            self.par_ranges[i] = face.ParameterRange
+
+    def surface(self, idx):
+        return self.surfaces[idx]
+
+    def area(self, idx):
+        # area of the face idx, computed on the first request
+        if idx not in self.areas:
+            self.areas[idx] = self.faces[idx].Area
+        return self.areas[idx]
+
+    def axis(self, idx):
+        # normal or axis of the face idx as Base.Vector
+        return Base.Vector(*self.directions[idx].tolist())
+
+    def center(self, idx):
+        # position or center of the face idx as Base.Vector
+        return Base.Vector(*self.centers[idx].tolist())
+
+
 class SheetTree(object):
     # Class representing a wire to replace in the unfolded shape. During tree creation, some features are detected
     # (e.g. countersink and counterbore holes) and are replaced later when the unfolded shape is created.
@@ -465,15 +744,19 @@ class SheetTree(object):
         print("index Unfold list:")
         print(self.index_unfold_list)
 
-    def __init__(self, TheShape, f_idx, k_factor_lookup):
-        self.cFaceTol = 0.002  # tolerance to detect counter-face vertices
-        # this high tolerance was needed for more real parts
+    def __init__(self, TheShape, f_idx, context):
+        if not isinstance(context, UnfoldContext):
+            context = UnfoldContext(context)  # a k-factor lookup dictionary
+        self.context = context
+        self.cFaceTol = context.cFaceTol  # tolerance to detect counter-face vertices
         self.root = None  # make_new_face_node adds the root node if parent_node == None
-        self.__Shape = TheShape.copy()
+        self.__Shape = TheShape  # the shape is not modified, no copy needed
         self.error_code = None
         self.failed_face_idx = None
-        self.k_factor_lookup = k_factor_lookup
+        self.k_factor_lookup = context.k_factor_lookup
         self.wire_replacements = []  # list of wires to be replaced during unfold shape creation
+        self.refine = context.refine  # the shape is refined, see UnfoldContext
+        self.released = False  # node data dropped by unfold_tree2(release=True)
 
         if not self.__Shape.isValid():
             FreeCAD.Console.PrintLog("The shape is not valid!" + "\n")
@@ -495,12 +778,29 @@ class SheetTree(object):
             self.index_unfold_list.append(i)
             self.f_list.append(self.__Shape.Faces[i])
         # print self.index_list
-        self.max_f_idx = len(
-            self.f_list
-        )  # need this value to make correct indices to new faces
+        self.index_set = set(self.index_list)  # fast membership test for index_list
+        # surface data of the faces of the shape, see SurfaceTable
+        self.surface_table = SurfaceTable(self.f_list)
+
+        # Vertex index of all faces in f_list. Used to find faces with
+        # coincident vertices without searching all faces.
+        self.vertex_index = VertexIndex()
+        self.vertex_faces = {}  # vertex id -> list of face indexes
+        self.face_vertex_ids = []  # face index -> set of vertex ids
+        # Edge to face adjacency of all faces in f_list, see edge_keys.
+        self.edge_faces = {}  # edge key -> list of [face index, face edge]
         self.unfoldFaces = len(
             self.f_list
         )  # need the original number of faces for error detection
+        for i in range(len(self.f_list)):
+            self.index_face(i)
+        self.opposite_cache = {}  # (node idx, vertex id) -> result of isVertOpposite
+        self.node_by_face = {}  # face index -> node owning the face
+        self.counter_faces = {}  # face index -> counter face candidates
+
+        self.max_f_idx = len(
+            self.f_list
+        )  # need this value to make correct indices to new faces
 
         # withoutSplitter = self.__Shape.removeSplitter()
         # if self.unfoldFaces > len(withoutSplitter.Faces): # This is not a good idea! Most sheet metal parts have unneeded edges.
@@ -530,7 +830,7 @@ class SheetTree(object):
 
         # Part.show(self.__Shape.Faces[f_idx])
         # print 'the object is a face! vertices: ', len(self.__Shape.Faces[f_idx].Vertexes)
-        F_type = self.__Shape.Faces[f_idx].Surface
+        F_type = self.surface_table.surface(f_idx)
         # FIXME: through an error, if not Plane Object
         FreeCAD.Console.PrintLog("It is a: " + str(F_type) + "\n")
         FreeCAD.Console.PrintLog(
@@ -548,6 +848,141 @@ class SheetTree(object):
         mvec = m_vec.multiply(1.0 / len(self.__Shape.Faces[f_idx].Vertexes))
         FreeCAD.Console.PrintLog("mvec: " + str(mvec) + "\n")
 
+        # Measure the distance to the parallel face on the other side of the
+        # sheet. The boolean probe with the shape is only needed, if there is
+        # no such face.
+        self.__thickness = self.plane_thickness(f_idx, mvec, estimated_thickness)
+        lLine = None
+        if self.__thickness is None:
+            self.__thickness, lLine = self.probe_thickness(
+                f_idx, mvec, estimated_thickness
+            )
+
+        # self.__thickness = lLine.Length
+        if (self.__thickness < estimated_thickness) or (
+            self.__thickness > 1.9 * estimated_thickness
+        ):
+            self.error_code = 3
+            self.failed_face_idx = f_idx
+            FreeCAD.Console.PrintLog(
+                "estimated thickness: "
+                + str(estimated_thickness)
+                + " measured thickness: "
+                + str(self.__thickness)
+                + "\n"
+            )
+            if lLine is not None:
+                Part.show(lLine, "Measurement_Thickness_trial")
+            return
+
+        self.counter_faces = self.pair_counter_faces()
+
+    def pair_counter_faces(self):
+        """Pairs all planar and cylindrical faces with the candidates for
+        their counter face in one pass. Planes pair with planes of opposite
+        normal at thickness distance, cylinders with cylinders of the same
+        axis and a radius difference of the thickness. The faces are bucketed
+        by the direction of the normal or axis and sorted by the offset of
+        the plane or the radius, so no face is compared with all others.
+        Returns a dictionary: face index -> sorted list of face indexes.
+        """
+        tol = self.cFaceTol
+        thickness = self.__thickness
+        table = self.surface_table
+        # offsets of the planes along their normal and the points of the
+        # axes of the cylinders nearest to the origin
+        offsets = np.einsum("ij,ij->i", table.centers, table.directions)
+        feet = to_vectors(table.centers - table.directions * offsets[:, None])
+        offsets = offsets.tolist()
+        radii = table.radii.tolist()
+        directions = VertexIndex(4)  # normals and axes
+        foot_index = VertexIndex(3)
+        planes = {}  # direction id -> list of (offset, face index)
+        cylinders = {}  # (direction id, foot id) -> list of (radius, face index)
+        paired = []  # (face index, direction, foot id)
+        for i, kind in enumerate(table.kinds.tolist()):
+            direction = table.axis(i)
+            if kind == SurfaceTable.PLANE:
+                key = directions.add(direction)
+                planes.setdefault(key, []).append((offsets[i], i))
+                paired.append((i, direction, None))
+            elif kind == SurfaceTable.CYLINDER:
+                foot = foot_index.add(feet[i])
+                key = (directions.add(direction), foot)
+                cylinders.setdefault(key, []).append((radii[i], i))
+                paired.append((i, direction, foot))
+        for bucket in list(planes.values()) + list(cylinders.values()):
+            bucket.sort()
+
+        counter_faces = {}
+        for i, direction, foot in paired:
+            if foot is None:
+                # the counter face has the opposite normal, its offset along
+                # that normal is the thickness minus the offset of the face
+                key = directions.find(-direction)
+                offset = thickness - offsets[i]
+                candidates = near_values(planes.get(key, []), offset, tol)
+            else:
+                # the axes of the bend faces may point in opposite directions
+                bend_radii = (radii[i] - thickness, radii[i] + thickness)
+                candidates = []
+                for axis in (direction, -direction):
+                    bucket = cylinders.get((directions.find(axis), foot), [])
+                    for radius in bend_radii:
+                        candidates.extend(near_values(bucket, radius, tol))
+            counter_faces[i] = sorted(set(candidates) - {i})
+        return counter_faces
+
+    def plane_thickness(self, f_idx, mvec, estimated_thickness):
+        """Returns the distance of the planar face f_idx to the nearest
+        parallel planar face at the other side of the sheet, measured at
+        mvec or at points near the vertexes of the face. Returns None, if
+        there is no such face.
+        """
+        table = self.surface_table
+        if table.kinds[f_idx] != SurfaceTable.PLANE:
+            return None
+        face = self.f_list[f_idx]
+        ext_Vec = -table.axis(f_idx)  # pointing into the metal
+
+        # points on the face, the mean of the vertexes first
+        points = [mvec]
+        for pvert in face.OuterWire.Vertexes:
+            shiftvec = mvec.sub(pvert.Point)
+            if shiftvec.Length > 0.0:
+                shiftvec = shiftvec.normalize() * 2.0 * estimated_thickness
+                points.append(pvert.Point.add(shiftvec))
+        points = [p for p in points if face_contains(face, p)]
+        if not points:
+            return None
+
+        # the outer normal of the counter face points into the metal
+        ext = -table.directions[f_idx]
+        parallel = table.kinds == SurfaceTable.PLANE
+        parallel &= table.directions @ ext >= 1.0 - 1e-7
+        parallel[f_idx] = False
+        c_indexes = np.nonzero(parallel)[0]
+        for measure_pos in points:
+            thickness = None
+            dists = (table.centers[c_indexes] - tuple(measure_pos)) @ ext
+            for i, dist in zip(c_indexes.tolist(), dists.tolist()):
+                if dist <= 1e-7 or dist > 2.0 * estimated_thickness:
+                    continue
+                if thickness is not None and dist >= thickness:
+                    continue
+                if face_contains(self.f_list[i], measure_pos + ext_Vec * dist):
+                    thickness = dist
+            if thickness is not None:
+                FreeCAD.Console.PrintLog(
+                    "thickness at Face" + str(f_idx + 1) + ": " + str(thickness) + "\n"
+                )
+                return thickness
+        return None
+
+    def probe_thickness(self, f_idx, mvec, estimated_thickness):
+        # Measure the thickness with the common of a line through the sheet
+        # and the shape. Returns the thickness and the line.
+        thickness = 0.0
         # if hasattr(self.__Shape.Faces[f_idx].Surface,'Position'):
         # s_Posi = self.__Shape.Faces[f_idx].Surface.Position
         # k = 0
@@ -579,19 +1014,15 @@ class SheetTree(object):
             self.error_code = 2
             self.failed_face_idx = f_idx
 
-        surface = get_surface(self.__Shape.Faces[f_idx])
-        s_Axis = surface.Axis
-        s_Posi = surface.Position
+        s_Axis = self.surface_table.axis(f_idx)
+        s_Posi = self.surface_table.center(f_idx)
         # print 'We have a position: ', s_Posi
         s_Axismp = Base.Vector(s_Axis.x, s_Axis.y, s_Axis.z).multiply(
             2.0 * estimated_thickness
         )
         # Part.show(Meassure_axis)
         Meassure_axis = Part.makeLine(measure_pos, measure_pos.sub(s_Axismp))
-        ext_Vec = Base.Vector(-s_Axis.x, -s_Axis.y, -s_Axis.z)
 
-        lostShape = self.__Shape.copy()
-        lLine = Meassure_axis.common(lostShape)
         lLine = Meassure_axis.common(self.__Shape)
         FreeCAD.Console.PrintLog("lLine number edges: " + str(len(lLine.Edges)) + "\n")
         measVert = Part.Vertex(measure_pos)
@@ -599,22 +1030,67 @@ class SheetTree(object):
             if equal_vertex(mEdge.Vertexes[0], measVert) or equal_vertex(
                 mEdge.Vertexes[1], measVert
             ):
-                self.__thickness = mEdge.Length
-
-        # self.__thickness = lLine.Length
-        if (self.__thickness < estimated_thickness) or (
-            self.__thickness > 1.9 * estimated_thickness
-        ):
-            self.error_code = 3
-            self.failed_face_idx = f_idx
-            FreeCAD.Console.PrintLog(
-                "estimated thickness: "
-                + str(estimated_thickness)
-                + " measured thickness: "
-                + str(self.__thickness)
-                + "\n"
-            )
-            Part.show(lLine, "Measurement_Thickness_trial")
+                thickness = mEdge.Length
+        return thickness, lLine
+
+    def index_face(self, f_idx):
+        # add a face appended to self.f_list to the vertex and edge indexes
+        self.index_face_vertices(f_idx)
+        self.index_face_edges(f_idx)
+
+    def index_face_vertices(self, f_idx):
+        # add the vertexes of the face self.f_list[f_idx] to the vertex index
+        vertex_ids = set()
+        for theVert in self.f_list[f_idx].Vertexes:
+            vid = self.vertex_index.add(theVert.Point)
+            if vid not in vertex_ids:
+                vertex_ids.add(vid)
+                self.vertex_faces.setdefault(vid, []).append(f_idx)
+        self.face_vertex_ids.append(vertex_ids)
+
+    def index_face_edges(self, f_idx):
+        # add the edges of the face self.f_list[f_idx] to the edge index
+        for theEdge in self.f_list[f_idx].Edges:
+            for key in self.edge_keys(theEdge):
+                self.edge_faces.setdefault(key, []).append([f_idx, theEdge])
+
+    def edge_keys(self, theEdge, reverse=False):
+        # Keys of an edge in the edge index: the hash of the edge TShape and,
+        # for edges with two vertexes, the hashes of the vertexes. With
+        # reverse=True the vertex key is reversed, in order to find edges
+        # defined with the vertexes in the other order (see same_edges).
+        keys = [("e", theEdge.hashCode())]
+        if len(theEdge.Vertexes) == 2:
+            v0 = theEdge.firstVertex().hashCode()
+            v1 = theEdge.lastVertex().hashCode()
+            keys.append(("v", v1, v0) if reverse else ("v", v0, v1))
+        return keys
+
+    def find_edge_faces(self, theEdge, strict=False):
+        """Returns the sorted indexes of the faces in f_list having theEdge.
+        With strict=True only faces of the shape with an edge isSame to
+        theEdge are returned, like ancestorsOfType of the shape would do.
+        """
+        faces = set()
+        for key in self.edge_keys(theEdge, reverse=not strict):
+            for f_idx, face_edge in self.edge_faces.get(key, ()):
+                if f_idx in faces:
+                    continue
+                if strict:
+                    if f_idx < self.unfoldFaces and face_edge.isSame(theEdge):
+                        faces.add(f_idx)
+                elif self.same_edges(face_edge, theEdge):
+                    faces.add(f_idx)
+        return sorted(faces)
+
+    def vertex_id(self, theVert):
+        # get the vertex id of a Part.Vertex, None if not in the vertex index
+        return self.vertex_index.find(theVert.Point)
+
+    def remove_index(self, f_idx):
+        # remove a face from the list of faces not yet assigned to a node
+        self.index_list.remove(f_idx)
+        self.index_set.discard(f_idx)
 
     def get_node_faces(self, theNode, wires_e_lists):
         """This function searches for all faces making up the node, except
@@ -636,48 +1112,33 @@ class SheetTree(object):
         found_indices = []
         # A search strategy for faces based on the wires_e_lists is needed.
 
+        # The vertex index delivers the faces with a vertex common to the edge.
         for theWire in wires_e_lists:
             for theEdge in theWire:
-                analyVert = theEdge.Vertexes[0]
-                for i in self.index_list:
-                    for lookVert in self.f_list[i].Vertexes:
-                        if equal_vertex(lookVert, analyVert):
-                            if len(theEdge.Vertexes) == 1:  # Edge is a circle
-                                if not self.is_sheet_edge_face(theEdge, theNode):
-                                    found_indices.append(i)  # found a node face
-                                    theNode.child_idx_lists.append([i, theEdge])
-                                    # self.index_list.remove(i) # remove this face from the index_list
-                                    # Part.show(self.f_list[i])
-                            else:
-                                nextVert = theEdge.Vertexes[1]
-                                for looknextVert in self.f_list[i].Vertexes:
-                                    if equal_vertex(looknextVert, nextVert):
-                                        # Special case to handle : sometimes, holes are defined as two semicircles, thus there are 2 edges and 2 interior faces for the hole.
-                                        # Since both edges have the exact same vertices, this algorithm would bind each interior face with each edge, so we'd get something
-                                        # like that : [[face1, edge1], [face2, edge2], [face1, edge2], [face2, edge1]]. Here the last two pairs are not valid, thus we remove
-                                        # them by checking that the edge is part of the face before adding the pair to the list.
-                                        edge_faces = self.__Shape.ancestorsOfType(
-                                            theEdge, Part.Face
-                                        )
-                                        found = False
-
-                                        for edge_face in edge_faces:
-                                            if edge_face.isSame(self.f_list[i]):
-                                                found = True
-                                                break
-
-                                        if found:
-                                            if not self.is_sheet_edge_face(
-                                                theEdge, theNode
-                                            ):
-                                                found_indices.append(
-                                                    i
-                                                )  # found a node face
-                                                theNode.child_idx_lists.append(
-                                                    [i, theEdge]
-                                                )
-                                                # self.index_list.remove(i) # remove this face from the index_list
-                                                # Part.show(self.f_list[i])
+                analyVid = self.vertex_id(theEdge.Vertexes[0])
+                if analyVid is None:
+                    continue
+                nextVid = None
+                if len(theEdge.Vertexes) > 1:
+                    nextVid = self.vertex_id(theEdge.Vertexes[1])
+                for i in self.vertex_faces[analyVid]:
+                    if i not in self.index_set:
+                        continue
+                    if len(theEdge.Vertexes) == 1:  # Edge is a circle
+                        if not self.is_sheet_edge_face(theEdge, theNode):
+                            found_indices.append(i)  # found a node face
+                            theNode.child_idx_lists.append([i, theEdge])
+                            # Part.show(self.f_list[i])
+                    elif nextVid is not None and nextVid in self.face_vertex_ids[i]:
+                        # Special case to handle : sometimes, holes are defined as two semicircles, thus there are 2 edges and 2 interior faces for the hole.
+                        # Since both edges have the exact same vertices, this algorithm would bind each interior face with each edge, so we'd get something
+                        # like that : [[face1, edge1], [face2, edge2], [face1, edge2], [face2, edge1]]. Here the last two pairs are not valid, thus we remove
+                        # them by checking that the edge is part of the face before adding the pair to the list.
+                        if i in self.find_edge_faces(theEdge, strict=True):
+                            if not self.is_sheet_edge_face(theEdge, theNode):
+                                found_indices.append(i)  # found a node face
+                                theNode.child_idx_lists.append([i, theEdge])
+                                # Part.show(self.f_list[i])
         FreeCAD.Console.PrintLog("found_indices: " + str(found_indices) + "\n")
 
     def is_sheet_edge_face(self, ise_edge, tree_node):  # ise_edge: IsSheetEdge_edge
@@ -692,13 +1153,10 @@ class SheetTree(object):
         # get the face which has a common edge with ise_edge
         the_index = None
         has_sheet_distance_vertex = False
-        for i in self.index_list:
-            for sf_edge in self.f_list[i].Edges:
-                if self.same_edges(sf_edge, ise_edge):
-                    the_index = i
-                    # print 'got edge face: Face', str(i+1)
-                    break
-            if the_index is not None:
+        for i in self.find_edge_faces(ise_edge):
+            if i in self.index_set:
+                the_index = i
+                # print 'got edge face: Face', str(i+1)
                 break
 
         # Simple strategy applied: look if the connecting face has vertexes
@@ -706,6 +1164,7 @@ class SheetTree(object):
         # FIXME: this will fail with sharpened sheet edges with two faces
         # between top and bottom.
         if the_index is not None:
+            i = the_index
             # now we need to search for vertexes with sheet_thickness_distance
             for F_vert in self.f_list[i].Vertexes:
                 # vDist = self.getDistanceToFace(F_vert, tree_node)
@@ -718,7 +1177,7 @@ class SheetTree(object):
                     has_sheet_distance_vertex = True
                     if len(self.f_list[i].Edges) < 5:
                         tree_node.nfIndexes.append(i)
-                        self.index_list.remove(i)
+                        self.remove_index(i)
                         # Part.show(self.f_list[i])
                     else:
                         # need to cut the face at the ends of ise_edge
@@ -748,14 +1207,25 @@ class SheetTree(object):
         )
 
     def isVertOpposite(self, theVert, theNode):
-        F_type = str(get_surface(self.f_list[theNode.idx]))
+        # The result is cached per node and coincident vertex, as the same
+        # vertexes are tested again for each edge of a side face.
+        vid = self.vertex_id(theVert)
+        if vid is not None:
+            cacheKey = (theNode.idx, vid)
+            if cacheKey not in self.opposite_cache:
+                self.opposite_cache[cacheKey] = self.calcVertOpposite(theVert, theNode)
+            return self.opposite_cache[cacheKey]
+        return self.calcVertOpposite(theVert, theNode)
+
+    def calcVertOpposite(self, theVert, theNode):
+        kind = self.surface_table.kinds[theNode.idx]
         vF_vert = Base.Vector(theVert.X, theVert.Y, theVert.Z)
-        if F_type == "<Plane object>":
+        if kind == SurfaceTable.PLANE:
             distFailure = (
                 vF_vert.distanceToPlane(theNode.facePosi, theNode.axis)
                 - self.__thickness
             )
-        elif F_type == "<Cylinder object>":
+        elif kind == SurfaceTable.CYLINDER:
             distFailure = (
                 vF_vert.distanceToLine(theNode.bendCenter, theNode.axis)
                 - theNode.distCenter
@@ -775,15 +1245,15 @@ class SheetTree(object):
             return False
 
     def getDistanceToFace(self, theVert, theNode):
-        F_type = str(get_surface(self.f_list[theNode.idx]))
+        kind = self.surface_table.kinds[theNode.idx]
         vF_vert = Base.Vector(theVert.X, theVert.Y, theVert.Z)
         # a positive distance should go through the sheet metal
-        if F_type == "<Plane object>":
+        if kind == SurfaceTable.PLANE:
             dist = vF_vert.distanceToPlane(theNode.facePosi, theNode.axis)
-        if F_type == "<Cylinder object>":
+        if kind == SurfaceTable.CYLINDER:
             dist = (
                 vF_vert.distanceToLine(theNode.bendCenter, theNode.axis)
-                - self.f_list[theNode.idx].Surface.Radius
+                - self.surface_table.radii[theNode.idx]
             )
             if theNode.bend_dir == "down":
                 dist = -dist
@@ -798,18 +1268,27 @@ class SheetTree(object):
         # make another cut, in order to add the residual face(s) to the face list.
 
         # Search edges in the face with a vertex common with ise_edge
-        F_type = str(get_surface(self.f_list[tree_node.idx]))
+        iseVid0 = self.vertex_id(ise_edge.Vertexes[0])
+        iseVid1 = self.vertex_id(ise_edge.Vertexes[1])
         needCut0 = True
         firstCutFaceIdx = None
         for sEdge in self.f_list[fIdx].Edges:
-            if equal_vertex(
-                ise_edge.Vertexes[0], sEdge.Vertexes[0]
-            ) and self.isVertOpposite(sEdge.Vertexes[1], tree_node):
+            if len(sEdge.Vertexes) < 2:
+                continue
+            sVid0 = self.vertex_id(sEdge.Vertexes[0])
+            sVid1 = self.vertex_id(sEdge.Vertexes[1])
+            if (
+                iseVid0 is not None
+                and iseVid0 == sVid0
+                and self.isVertOpposite(sEdge.Vertexes[1], tree_node)
+            ):
                 needCut0 = False
                 theEdge = sEdge
-            if equal_vertex(
-                ise_edge.Vertexes[0], sEdge.Vertexes[1]
-            ) and self.isVertOpposite(sEdge.Vertexes[0], tree_node):
+            if (
+                iseVid0 is not None
+                and iseVid0 == sVid1
+                and self.isVertOpposite(sEdge.Vertexes[0], tree_node)
+            ):
                 needCut0 = False
                 theEdge = sEdge
         if needCut0:
@@ -818,23 +1297,24 @@ class SheetTree(object):
 
             tree_node.nfIndexes.append(self.max_f_idx)
             self.f_list.append(nFace)
+            self.index_face(self.max_f_idx)
             firstCutFaceIdx = self.max_f_idx
             self.max_f_idx += 1
-            # self.f_list.append(rFace)
-            # self.index_list.append(self.max_f_idx)
-            # self.max_f_idx += 1
-            # self.index_list.remove(fIdx)
             # Part.show(nFace)
         # else:
         #  Part.show(theEdge)
 
         needCut1 = True
         for sEdge in self.f_list[fIdx].Edges:
-            if equal_vertex(ise_edge.Vertexes[1], sEdge.Vertexes[0]):
+            if len(sEdge.Vertexes) < 2:
+                continue
+            sVid0 = self.vertex_id(sEdge.Vertexes[0])
+            sVid1 = self.vertex_id(sEdge.Vertexes[1])
+            if iseVid1 is not None and iseVid1 == sVid0:
                 if self.isVertOpposite(sEdge.Vertexes[1], tree_node):
                     needCut1 = False
                     theEdge = sEdge
-            if equal_vertex(ise_edge.Vertexes[1], sEdge.Vertexes[1]):
+            if iseVid1 is not None and iseVid1 == sVid1:
                 if self.isVertOpposite(sEdge.Vertexes[0], tree_node):
                     needCut1 = False
                     theEdge = sEdge
@@ -846,13 +1326,9 @@ class SheetTree(object):
             nFace = self.cutEdgeFace(1, fIdx, ise_edge, tree_node)
             tree_node.nfIndexes.append(self.max_f_idx)
             self.f_list.append(nFace)
+            self.index_face(self.max_f_idx)
             firstCutFaceIdx = self.max_f_idx
             self.max_f_idx += 1
-            # self.f_list.append(rFace)
-            # self.index_list.append(self.max_f_idx)
-            # self.max_f_idx += 1
-            # if not needCut0:
-            #  self.index_list.remove(fIdx)
             # Part.show(nFace)
         # else:
         #  Part.show(theEdge)
@@ -874,8 +1350,8 @@ class SheetTree(object):
 
         origin = theEdge.Vertexes[eIdx].Point
 
-        F_type = str(get_surface(self.f_list[theNode.idx]))
-        if F_type == "<Plane object>":
+        kind = self.surface_table.kinds[theNode.idx]
+        if kind == SurfaceTable.PLANE:
             tan_vec = theEdge.Vertexes[eIdx].Point - theEdge.Vertexes[otherIdx].Point
             # o_thick = Base.Vector(o_vec.x, o_vec.y, o_vec.z)
             tan_vec.normalize()
@@ -915,7 +1391,7 @@ class SheetTree(object):
             Spnt3 = origin + vec1 + vec1 + crossVec
             Spnt4 = origin + vec1 + vec1 - crossVec
 
-        if F_type == "<Cylinder object>":
+        if kind == SurfaceTable.CYLINDER:
             ePar = theEdge.parameterAt(theEdge.Vertexes[eIdx])
             FreeCAD.Console.PrintLog("Idx: " + str(eIdx) + " ePar: " + str(ePar) + "\n")
             otherPar = theEdge.parameterAt(theEdge.Vertexes[otherIdx])
@@ -996,21 +1472,20 @@ class SheetTree(object):
         P_node = newNode.p_node
         P_edge = newNode.p_edge
         face_idx = newNode.idx
-        theFace = self.__Shape.Faces[face_idx]
+        table = self.surface_table
 
         s_Axis = newNode.axis
         s_Center = newNode.bendCenter
 
         # Start to investigate the angles at self.__Shape.Faces[face_idx].ParameterRange[0]
-        angle_0 = theFace.ParameterRange[0]
-        angle_1 = theFace.ParameterRange[1]
+        angle_0, angle_1 = table.par_ranges[face_idx, :2].tolist()
 
         # idea: identify the angle at edge_vec = P_edge.Vertexes[0].copy().Point
         # This will be = angle_start
         # calculate the tan_vec from valueAt
 
         edge_vec = P_edge.Vertexes[0].copy().Point
-        edgeAngle, edgePar = theFace.Surface.parameter(edge_vec)
+        edgeAngle, edgePar = table.surface(face_idx).parameter(edge_vec)
 
         # print 'the angles: ', angle_0, ' ', angle_1, ' ', edgeAngle, ' ', edgeAngle - 2*math.pi
 
@@ -1055,9 +1530,9 @@ class SheetTree(object):
                 newNode.tan_vec = pTanVec
 
         if newNode.bend_dir == "up":
-            innerRadius = theFace.Surface.Radius
+            innerRadius = float(table.radii[face_idx])
         else:
-            innerRadius = theFace.Surface.Radius - self.__thickness
+            innerRadius = float(table.radii[face_idx]) - self.__thickness
 
         # Will be used to determine the correct K-factor
         newNode.thickness = self.__thickness
@@ -1071,13 +1546,15 @@ class SheetTree(object):
             + str(newNode.k_Factor)
             + "\n"
         )
+        # the bend_angle may be corrected later by the child node, but the
+        # translation length is based on this angle.
+        newNode.trans_angle = newNode.bend_angle
         newNode._trans_length = (
             innerRadius + newNode.k_Factor * self.__thickness
-        ) * newNode.bend_angle
+        ) * newNode.trans_angle
 
         # print 'newNode._trans_length: ', newNode._trans_length
-        cAngle_0 = self.__Shape.Faces[newNode.c_face_idx].ParameterRange[0]
-        cAngle_1 = self.__Shape.Faces[newNode.c_face_idx].ParameterRange[1]
+        cAngle_0, cAngle_1 = table.par_ranges[newNode.c_face_idx, :2].tolist()
 
         cFaceAngle = cAngle_1 - cAngle_0
 
@@ -1094,34 +1571,246 @@ class SheetTree(object):
 
         # print 'node angles: ', newNode.bend_angle, ' ', diffAngle
 
+    def link_flat_child(self, newNode):
+        # newNode is a flat node below a bend node: check the bend angle of
+        # the bend and correct it, add the unbend vertexes of the flat node
+        # to the vertexDict of the bend.
+        face_idx = newNode.idx
+        P_edge = newNode.p_edge
+        if newNode.p_node.p_node.node_type == "Flat":
+            # calculate the angle on base of ext_Vec
+            ppVec = newNode.p_node.p_node.axis  # normal of the flat face
+            myVec = newNode.axis  # normal of the flat face
+            theAxis = newNode.p_node.axis  # Bend axis
+            angle = math.atan2(ppVec.cross(myVec).dot(theAxis), ppVec.dot(myVec))
+            if angle < -math.pi / 8:
+                angle = angle + 2 * math.pi
+            # print 'compare angles, bend: ', newNode.p_node.bend_angle, ' ', angle
+            newNode.p_node.bend_angle = angle  # This seems to be an improvement!
+            # newNode.p_node.bend_angle = (angle + newNode.p_node.bend_angle) / 2.0 # this is a bad approach
+
+        # update the newNode.p_node.vertexDict with the Vertex data
+        # from the own vertexes corresponding to the parent edge: P_edge
+        topVertIndexes = range(len(self.__Shape.Faces[face_idx].Vertexes))
+        myFlatVertIndexes = []
+        # for theVert in self.__Shape.Faces[face_idx].Vertexes:
+        for vertIdx in topVertIndexes:
+            theVert = self.__Shape.Faces[face_idx].Vertexes[vertIdx]
+            if equal_vertex(theVert, P_edge.Vertexes[0]):
+                myFlatVertIndexes.append(vertIdx)
+            if equal_vertex(theVert, P_edge.Vertexes[1]):
+                myFlatVertIndexes.append(vertIdx)
+
+        rotatedFace = self.f_list[face_idx].copy()
+        trans_vec = newNode.p_node.tan_vec * newNode.p_node._trans_length
+        rotatedFace.rotate(
+            self.surface_table.center(newNode.p_node.idx),
+            newNode.p_node.axis,
+            math.degrees(-newNode.p_node.bend_angle),
+        )
+        rotatedFace.translate(trans_vec)
+
+        for vertIdx in myFlatVertIndexes:
+            theVert = self.__Shape.Faces[face_idx].Vertexes[vertIdx]
+            vKey = newNode.p_node.findVertex(theVert.Point)
+            if vKey is not None:
+                flagStr, origVec, unbendVec = newNode.p_node.vertexDict[vKey]
+                flagStr = flagStr + "c"
+                newNode.p_node.vertexDict[vKey] = (
+                    flagStr,
+                    origVec,
+                    rotatedFace.Vertexes[vertIdx].Point,
+                )
+
+        # update the newNode.p_node.vertexDict with the Vertex data
+        # from the own vertexes corresponding to the opposite face
+        oppVertIndexes = range(len(self.__Shape.Faces[newNode.c_face_idx].Vertexes))
+        myFlatVertIndexes = []
+        # for theVert in self.__Shape.Faces[face_idx].Vertexes:
+        for vertIdx in oppVertIndexes:
+            theVert = self.__Shape.Faces[newNode.c_face_idx].Vertexes[vertIdx]
+            for cVert in self.__Shape.Faces[newNode.p_node.c_face_idx].Vertexes:
+                if equal_vertex(theVert, cVert):
+                    myFlatVertIndexes.append(vertIdx)
+
+        rotatedFace = self.f_list[newNode.c_face_idx].copy()
+        trans_vec = newNode.p_node.tan_vec * newNode.p_node._trans_length
+        rotatedFace.rotate(
+            self.surface_table.center(newNode.p_node.idx),
+            newNode.p_node.axis,
+            math.degrees(-newNode.p_node.bend_angle),
+        )
+        rotatedFace.translate(trans_vec)
+
+        for vertIdx in myFlatVertIndexes:
+            theVert = self.__Shape.Faces[newNode.c_face_idx].Vertexes[vertIdx]
+            vKey = newNode.p_node.findVertex(theVert.Point)
+            if vKey is not None:
+                flagStr, origVec, unbendVec = newNode.p_node.vertexDict[vKey]
+                flagStr = flagStr + "c"
+                newNode.p_node.vertexDict[vKey] = (
+                    flagStr,
+                    origVec,
+                    rotatedFace.Vertexes[vertIdx].Point,
+                )
+
+    def set_bend_dir(self, newNode):
+        # bend direction and inner radius of the bend node newNode,
+        # seen from its parent node.
+        # Returns the distance of the opposite face to the bend axis.
+        P_node = newNode.p_node
+        P_edge = newNode.p_edge
+        face_idx = newNode.idx
+        s_Center = newNode.bendCenter
+        edge_vec = P_edge.Vertexes[0].copy().Point
+        FreeCAD.Console.PrintLog("edge_vec: " + str(edge_vec) + "\n")
+
+        if P_node.node_type == "Flat":
+            dist_c = edge_vec.distanceToPlane(
+                s_Center, P_node.axis
+            )  # distance to center
+        else:
+            radVector = radial_vector(
+                edge_vec,
+                self.surface_table.center(P_node.idx),
+                self.surface_table.axis(P_node.idx),
+            )
+            if P_node.bend_dir == "down":
+                dist_c = edge_vec.distanceToPlane(s_Center, radVector.multiply(-1.0))
+            else:
+                dist_c = edge_vec.distanceToPlane(s_Center, radVector)
+
+        radius = float(self.surface_table.radii[face_idx])
+        if dist_c < 0.0:
+            newNode.bend_dir = "down"
+            thick_test = radius - self.__thickness
+            newNode.innerRadius = thick_test
+        else:
+            newNode.bend_dir = "up"
+            thick_test = radius + self.__thickness
+            newNode.innerRadius = radius
+        newNode.distCenter = thick_test
+        # print "Face idx: ", face_idx, " bend_dir: ", newNode.bend_dir
+        FreeCAD.Console.PrintLog(
+            "Face"
+            + str(face_idx + 1)
+            + " Type: "
+            + str(newNode.node_type)
+            + " bend_dir: "
+            + str(newNode.bend_dir)
+            + "\n"
+        )
+        return thick_test
+
+    def set_bend_vertexes(self, newNode, wires_e_lists=None):
+        # opposite point, bend angle and vertexDict of the bend node newNode,
+        # its counter face must be known.
+        P_node = newNode.p_node
+        P_edge = newNode.p_edge
+        face_idx = newNode.idx
+        edge_vec = P_edge.Vertexes[0].copy().Point
+
+        # Need a Vertex from the parent node on the opposite side of the
+        # sheet metal part. This vertex is used to align other vertexes
+        # to the unbended sheet metal plane.
+        # The used vertex should be one of the opposite Face of the parent
+        # node with the closest distance to a line through edge_vec.
+        if P_node.node_type == "Flat":
+            searchAxis = P_node.axis
+        else:
+            searchAxis = radial_vector(
+                edge_vec,
+                self.surface_table.center(P_node.idx),
+                self.surface_table.axis(P_node.idx),
+            )
+
+        maxDistance = 1000
+        bestPoint = None
+        for theVert in self.__Shape.Faces[P_node.c_face_idx].Vertexes:
+            vertDist = theVert.Point.distanceToLine(edge_vec, searchAxis)
+            if vertDist < maxDistance:
+                maxDistance = vertDist
+                bestPoint = theVert.Point
+
+        newNode.oppositePoint = bestPoint
+        # Part.show(Part.makeLine(bestPoint, edge_vec), 'bestPoint'+str(face_idx+1)+'_')
+
+        self.getBendAngle(newNode, wires_e_lists)
+
+        # As I have learned, that it is necessary to apply corrections to Points / Vertexes,
+        # it will be difficult to have all vertexes of the faces of a bend to fit together.
+        # Therefore a dictionary is introduced, which holds the original coordinates and
+        # the unbend coordinates for the vertexes of the bend. It contains also flags,
+        # indicating if a point is part of the parent node (p) or child node (c),
+        # top face (t) or opposite face (o). All in newNode.vertexDict
+        # Structure: key: Flagstring, Base.Vector(original), Base.Vector(unbend)
+        # The unbend coordinates should be added before processing the top face and the
+        # opposite face in the generateBendShell2 procedure.
+        # Next is to identify for each vertex in the edges the corresponding vertex in
+        # newNode.vertexDict.
+        # Create a dictionary for the unbend edges. The key is the tuple of the sorted
+        # vertex indexes. simple_node.edgeDict
+        # Next is to unbend the edges, using the points in newNode.vertexDict as
+        # starting and ending vertex.
+        # Store the edge in self.edgeDict and process it to make a wire and a face.
+        #
+        # The side faces uses only the unbend vertexes from newNode.vertexDict,
+        # the edges from self.edgeDict are recycled.
+        # Only new to generate edges may need other vertexes too.
+        vertDictIdx = 0  # Index as key in newNode.vertexDict
+        for theVert in self.__Shape.Faces[face_idx].Vertexes:
+            flagStr = "t"
+            origVec = theVert.Point
+            unbendVec = None
+            if equal_vertex(theVert, P_edge.Vertexes[0]):
+                flagStr = flagStr + "p0"
+                origVec = P_edge.Vertexes[0].Point
+                unbendVec = origVec
+            else:
+                if equal_vertex(theVert, P_edge.Vertexes[1]):
+                    flagStr = flagStr + "p1"
+                    origVec = P_edge.Vertexes[1].Point
+                    unbendVec = origVec
+            # print('make vertexDict: ', flagStr, ' ', str(face_idx+1))
+            newNode.addVertex(vertDictIdx, flagStr, origVec, unbendVec)
+            vertDictIdx += 1
+
+        for theVert in self.__Shape.Faces[newNode.c_face_idx].Vertexes:
+            flagStr = "o"
+            origVec = theVert.Point
+            unbendVec = None
+            for pVert in self.__Shape.Faces[P_node.c_face_idx].Vertexes:
+                if equal_vertex(theVert, pVert):
+                    flagStr = flagStr + "p"
+                    origVec = pVert.Point
+                    unbendVec = origVec
+            # print('make vertexDict: ', flagStr, ' ', str(face_idx+1))
+            newNode.addVertex(vertDictIdx, flagStr, origVec, unbendVec)
+            vertDictIdx += 1
+
     def make_new_face_node(self, face_idx, P_node, P_edge, wires_e_lists):
         # e_list: list of edges of the top face of a node without the parent-edge (P_edge)
         # analyze the face and get type of face ("Flat" or "Bend")
         # search the counter face, get axis of Face
         # In case of "Bend" get angle, k_factor and trans_length
         # put the node into the tree
-        newNode = Simple_node(face_idx, P_node, P_edge, self.k_factor_lookup)
+        newNode = Simple_node(face_idx, P_node, P_edge, self.context)
 
         # This face should be a node in the tree, and is therefore known!
         # removed from the list of all unknown faces
-        self.index_list.remove(face_idx)
+        self.remove_index(face_idx)
         # This means, it could also not be found as neighbor face anymore.
         # newNode.node_faces.append(self.f_list[face_idx].copy())
         newNode.nfIndexes.append(face_idx)
 
-        such_list = []
-        for k in self.index_list:
-            such_list.append(k)
-
-        surface = get_surface(self.__Shape.Faces[face_idx])
-        F_type = str(surface)
+        kind = self.surface_table.kinds[face_idx]
 
-        if F_type == "<Plane object>":
+        if kind == SurfaceTable.PLANE:
             newNode.node_type = "Flat"  # FIXME
 
-            s_Posi = surface.Position
+            s_Posi = self.surface_table.center(face_idx)
             newNode.facePosi = s_Posi
-            s_Axis = surface.Axis
+            s_Axis = self.surface_table.axis(face_idx)
             ext_Vec = Base.Vector(-s_Axis.x, -s_Axis.y, -s_Axis.z)
 
             newNode.axis = ext_Vec
@@ -1141,19 +1830,21 @@ class SheetTree(object):
             counterFaceList = []
             gotCFace = False
             # search for the counter face
-            for i in such_list:
-                counter_found = True
-                for F_vert in self.f_list[i].Vertexes:
-                    vF_vert = Base.Vector(F_vert.X, F_vert.Y, F_vert.Z)
-                    dist_v = vF_vert.distanceToPlane(s_Posi, ext_Vec) - self.__thickness
-                    # print "counter face distance: ", dist_v + self.__thickness
-                    # print 'checking Face', str(i+1), ' dist_v: ', dist_v
-                    if (dist_v > self.cFaceTol) or (dist_v < -self.cFaceTol):
-                        counter_found = False
+            for such_list in self.counter_face_candidates(face_idx):
+                for i in such_list:
+                    counter_found = True
+                    for F_vert in self.f_list[i].Vertexes:
+                        vF_vert = Base.Vector(F_vert.X, F_vert.Y, F_vert.Z)
+                        dist_v = (
+                            vF_vert.distanceToPlane(s_Posi, ext_Vec) - self.__thickness
+                        )
+                        # print "counter face distance: ", dist_v + self.__thickness
+                        # print 'checking Face', str(i+1), ' dist_v: ', dist_v
+                        if (dist_v > self.cFaceTol) or (dist_v < -self.cFaceTol):
+                            counter_found = False
 
-                if counter_found:
-                    if hasattr(FreeCADGui.Selection.getSelection()[0], "Refine"):
-                        if FreeCADGui.Selection.getSelection()[0].Refine is True:
+                    if counter_found:
+                        if self.refine:
                             distance = self.__Shape.Faces[i].distToShape(
                                 self.__Shape.Faces[face_idx]
                             )[0]
@@ -1196,37 +1887,8 @@ class SheetTree(object):
                                     + str(counterMiddle)
                                     + "\n"
                                 )
-                    else:
-                        # need a mean point of the face to avoid false counter faces
-                        counterMiddle = Base.Vector(
-                            0.0, 0.0, 0.0
-                        )  # calculating a mean vector
-                        for Vvec in self.__Shape.Faces[i].OuterWire.Vertexes:
-                            counterMiddle = counterMiddle.add(Vvec.Point)
-                        counterMiddle = counterMiddle.multiply(
-                            1.0 / len(self.__Shape.Faces[i].OuterWire.Vertexes)
-                        )
-
-                        distVector = counterMiddle.sub(faceMiddle)
-                        counterDistance = distVector.Length
-
-                        if (
-                            counterDistance < 2 * self.__thickness
-                        ):  # FIXME: small stripes are a risk!
-                            FreeCAD.Console.PrintLog(
-                                "found counter-face" + str(i + 1) + "\n"
-                            )
-                            counterFaceList.append([i, counterDistance])
-                            gotCFace = True
-                        else:
-                            counter_found = False
-                            FreeCAD.Console.PrintLog(
-                                "faceMiddle: "
-                                + str(faceMiddle)
-                                + " counterMiddle: "
-                                + str(counterMiddle)
-                                + "\n"
-                            )
+                if gotCFace:
+                    break
 
             if gotCFace:
                 newNode.c_face_idx = counterFaceList[0][0]
@@ -1238,379 +1900,168 @@ class SheetTree(object):
                         if counterDistance > counterFaceList[i][1]:
                             counterDistance = counterFaceList[i][1]
                             newNode.c_face_idx = counterFaceList[i][0]
-                self.index_list.remove(newNode.c_face_idx)
+                self.remove_index(newNode.c_face_idx)
                 newNode.nfIndexes.append(newNode.c_face_idx)
 
             # if newNode.c_face_idx == None:
             #  Part.show(axis_line)
-            # if the parent is a bend: check the bend angle and correct it.
-            if newNode.p_node:
-                if newNode.p_node.node_type == "Bend":
-                    if newNode.p_node.p_node.node_type == "Flat":
-                        # calculate the angle on base of ext_Vec
-                        ppVec = newNode.p_node.p_node.axis  # normal of the flat face
-                        myVec = newNode.axis  # normal of the flat face
-                        theAxis = newNode.p_node.axis  # Bend axis
-                        angle = math.atan2(
-                            ppVec.cross(myVec).dot(theAxis), ppVec.dot(myVec)
-                        )
-                        if angle < -math.pi / 8:
-                            angle = angle + 2 * math.pi
-                        # print 'compare angles, bend: ', newNode.p_node.bend_angle, ' ', angle
-                        newNode.p_node.bend_angle = (
-                            angle  # This seems to be an improvement!
-                        )
-                        # newNode.p_node.bend_angle = (angle + newNode.p_node.bend_angle) / 2.0 # this is a bad approach
-
-                    # update the newNode.p_node.vertexDict with the Vertex data
-                    # from the own vertexes corresponding to the parent edge: P_edge
-                    topVertIndexes = range(len(self.__Shape.Faces[face_idx].Vertexes))
-                    myFlatVertIndexes = []
-                    # for theVert in self.__Shape.Faces[face_idx].Vertexes:
-                    for vertIdx in topVertIndexes:
-                        theVert = self.__Shape.Faces[face_idx].Vertexes[vertIdx]
-                        if equal_vertex(theVert, P_edge.Vertexes[0]):
-                            myFlatVertIndexes.append(vertIdx)
-                        if equal_vertex(theVert, P_edge.Vertexes[1]):
-                            myFlatVertIndexes.append(vertIdx)
-
-                    rotatedFace = self.f_list[face_idx].copy()
-                    trans_vec = newNode.p_node.tan_vec * newNode.p_node._trans_length
-                    rotatedFace.rotate(
-                        self.f_list[newNode.p_node.idx].Surface.Center,
-                        newNode.p_node.axis,
-                        math.degrees(-newNode.p_node.bend_angle),
-                    )
-                    rotatedFace.translate(trans_vec)
-
-                    for vKey in newNode.p_node.vertexDict:
-                        flagStr, origVec, unbendVec = newNode.p_node.vertexDict[vKey]
-                        # for theVert in myFlatVerts:
-                        for vertIdx in myFlatVertIndexes:
-                            theVert = self.__Shape.Faces[face_idx].Vertexes[vertIdx]
-                            if equal_vector(theVert.Point, origVec):
-                                flagStr = flagStr + "c"
-                                newNode.p_node.vertexDict[vKey] = (
-                                    flagStr,
-                                    origVec,
-                                    rotatedFace.Vertexes[vertIdx].Point,
-                                )
+            if newNode.p_node and newNode.p_node.node_type == "Bend":
+                self.link_flat_child(newNode)
 
-                    # update the newNode.p_node.vertexDict with the Vertex data
-                    # from the own vertexes corresponding to the opposite face
-                    oppVertIndexes = range(
-                        len(self.__Shape.Faces[newNode.c_face_idx].Vertexes)
-                    )
-                    myFlatVertIndexes = []
-                    # for theVert in self.__Shape.Faces[face_idx].Vertexes:
-                    for vertIdx in oppVertIndexes:
-                        theVert = self.__Shape.Faces[newNode.c_face_idx].Vertexes[
-                            vertIdx
-                        ]
-                        for cVert in self.__Shape.Faces[
-                            newNode.p_node.c_face_idx
-                        ].Vertexes:
-                            if equal_vertex(theVert, cVert):
-                                myFlatVertIndexes.append(vertIdx)
-
-                    rotatedFace = self.f_list[newNode.c_face_idx].copy()
-                    trans_vec = newNode.p_node.tan_vec * newNode.p_node._trans_length
-                    rotatedFace.rotate(
-                        self.f_list[newNode.p_node.idx].Surface.Center,
-                        newNode.p_node.axis,
-                        math.degrees(-newNode.p_node.bend_angle),
-                    )
-                    rotatedFace.translate(trans_vec)
-
-                    for vKey in newNode.p_node.vertexDict:
-                        flagStr, origVec, unbendVec = newNode.p_node.vertexDict[vKey]
-                        # for theVert in myFlatVerts:
-                        for vertIdx in myFlatVertIndexes:
-                            theVert = self.__Shape.Faces[newNode.c_face_idx].Vertexes[
-                                vertIdx
-                            ]
-                            if equal_vector(theVert.Point, origVec):
-                                flagStr = flagStr + "c"
-                                newNode.p_node.vertexDict[vKey] = (
-                                    flagStr,
-                                    origVec,
-                                    rotatedFace.Vertexes[vertIdx].Point,
-                                )
-
-        if F_type == "<Cylinder object>":
+        if kind == SurfaceTable.CYLINDER:
             newNode.node_type = "Bend"  # FIXME
-            s_Center = self.__Shape.Faces[face_idx].Surface.Center
-            s_Axis = self.__Shape.Faces[face_idx].Surface.Axis
+            s_Center = self.surface_table.center(face_idx)
+            s_Axis = self.surface_table.axis(face_idx)
             newNode.axis = s_Axis
             newNode.bendCenter = s_Center
-            edge_vec = P_edge.Vertexes[0].copy().Point
-            FreeCAD.Console.PrintLog("edge_vec: " + str(edge_vec) + "\n")
-
-            if P_node.node_type == "Flat":
-                dist_c = edge_vec.distanceToPlane(
-                    s_Center, P_node.axis
-                )  # distance to center
-            else:
-                P_face = self.__Shape.Faces[P_node.idx]
-                radVector = radial_vector(
-                    edge_vec, P_face.Surface.Center, P_face.Surface.Axis
-                )
-                if P_node.bend_dir == "down":
-                    dist_c = edge_vec.distanceToPlane(
-                        s_Center, radVector.multiply(-1.0)
-                    )
-                else:
-                    dist_c = edge_vec.distanceToPlane(s_Center, radVector)
-
-            if dist_c < 0.0:
-                newNode.bend_dir = "down"
-                thick_test = (
-                    self.__Shape.Faces[face_idx].Surface.Radius - self.__thickness
-                )
-                newNode.innerRadius = thick_test
-            else:
-                newNode.bend_dir = "up"
-                thick_test = (
-                    self.__Shape.Faces[face_idx].Surface.Radius + self.__thickness
-                )
-                newNode.innerRadius = self.__Shape.Faces[face_idx].Surface.Radius
-            newNode.distCenter = thick_test
-            # print "Face idx: ", face_idx, " bend_dir: ", newNode.bend_dir
-            FreeCAD.Console.PrintLog(
-                "Face"
-                + str(face_idx + 1)
-                + " Type: "
-                + str(newNode.node_type)
-                + " bend_dir: "
-                + str(newNode.bend_dir)
-                + "\n"
-            )
+            thick_test = self.set_bend_dir(newNode)
 
             # calculate mean point of face:
             # FIXME implement also for cylindric faces
 
             # Search the face at the opposite site of the sheet:
-            # for i in range(len(such_list)):
-            for i in such_list:
-                counter_found = True
-                for F_vert in self.f_list[i].Vertexes:
-                    vF_vert = Base.Vector(F_vert.X, F_vert.Y, F_vert.Z)
-                    dist_c = vF_vert.distanceToLine(s_Center, s_Axis) - thick_test
-                    if (dist_c > self.cFaceTol) or (dist_c < -self.cFaceTol):
-                        counter_found = False
+            counter_found = False
+            for such_list in self.counter_face_candidates(face_idx):
+                for i in such_list:
+                    counter_found = True
+                    for F_vert in self.f_list[i].Vertexes:
+                        vF_vert = Base.Vector(F_vert.X, F_vert.Y, F_vert.Z)
+                        dist_c = vF_vert.distanceToLine(s_Center, s_Axis) - thick_test
+                        if (dist_c > self.cFaceTol) or (dist_c < -self.cFaceTol):
+                            counter_found = False
 
-                if counter_found:
-                    # to do calculate mean point of counter face
+                    if counter_found:
+                        # to do calculate mean point of counter face
 
-                    # print "found counter Face", such_list[i]+1
-                    newNode.c_face_idx = i
-                    self.index_list.remove(i)
-                    newNode.nfIndexes.append(i)
-                    # Part.show(self.__Shape.Faces[newNode.c_face_idx])
+                        # print "found counter Face", such_list[i]+1
+                        newNode.c_face_idx = i
+                        self.remove_index(i)
+                        newNode.nfIndexes.append(i)
+                        # Part.show(self.__Shape.Faces[newNode.c_face_idx])
+                        break
+                if counter_found:
                     break
 
             if not counter_found:
-                newNode.analysis_ok = False
-                newNode.error_code = 13  # Analysis: counter face not found
-                self.error_code = 13
-                self.failed_face_idx = face_idx
-                FreeCAD.Console.PrintLog(
-                    "No opposite face Debugging Thickness: "
-                    + str(self.__thickness)
-                    + "\n"
-                )
-                Part.show(
-                    self.__Shape.Faces[face_idx], "FailedFace" + str(face_idx + 1) + "_"
-                )
-                return newNode
+                return self.counter_face_failed(newNode)
 
             else:
-                # Need a Vertex from the parent node on the opposite side of the
-                # sheet metal part. This vertex is used to align other vertexes
-                # to the unbended sheet metal plane.
-                # The used vertex should be one of the opposite Face of the parent
-                # node with the closest distance to a line through edge_vec.
-                if P_node.node_type == "Flat":
-                    searchAxis = P_node.axis
-                else:
-                    searchAxis = radVector
-
-                maxDistance = 1000
-                bestPoint = None
-                for theVert in self.__Shape.Faces[P_node.c_face_idx].Vertexes:
-                    vertDist = theVert.Point.distanceToLine(edge_vec, searchAxis)
-                    if vertDist < maxDistance:
-                        maxDistance = vertDist
-                        bestPoint = theVert.Point
-
-                newNode.oppositePoint = bestPoint
-                # Part.show(Part.makeLine(bestPoint, edge_vec), 'bestPoint'+str(face_idx+1)+'_')
-
-                self.getBendAngle(newNode, wires_e_lists)
-
-                # As I have learned, that it is necessary to apply corrections to Points / Vertexes,
-                # it will be difficult to have all vertexes of the faces of a bend to fit together.
-                # Therefore a dictionary is introduced, which holds the original coordinates and
-                # the unbend coordinates for the vertexes of the bend. It contains also flags,
-                # indicating if a point is part of the parent node (p) or child node (c),
-                # top face (t) or opposite face (o). All in newNode.vertexDict
-                # Structure: key: Flagstring, Base.Vector(original), Base.Vector(unbend)
-                # The unbend coordinates should be added before processing the top face and the
-                # opposite face in the generateBendShell2 procedure.
-                # Next is to identify for each vertex in the edges the corresponding vertex in
-                # newNode.vertexDict.
-                # Create a dictionary for the unbend edges. The key is a combination of the
-                # vertex indexes. The higher index is shifted 16 bits. simple_node.edgeDict
-                # Next is to unbend the edges, using the points in newNode.vertexDict as
-                # starting and ending vertex.
-                # Store the edge in self.edgeDict and process it to make a wire and a face.
-                #
-                # The side faces uses only the unbend vertexes from newNode.vertexDict,
-                # the edges from self.edgeDict are recycled.
-                # Only new to generate edges may need other vertexes too.
-                vertDictIdx = 0  # Index as key in newNode.vertexDict
-                for theVert in self.__Shape.Faces[face_idx].Vertexes:
-                    flagStr = "t"
-                    origVec = theVert.Point
-                    unbendVec = None
-                    if equal_vertex(theVert, P_edge.Vertexes[0]):
-                        flagStr = flagStr + "p0"
-                        origVec = P_edge.Vertexes[0].Point
-                        unbendVec = origVec
-                    else:
-                        if equal_vertex(theVert, P_edge.Vertexes[1]):
-                            flagStr = flagStr + "p1"
-                            origVec = P_edge.Vertexes[1].Point
-                            unbendVec = origVec
-                    # print('make vertexDict: ', flagStr, ' ', str(face_idx+1))
-                    newNode.vertexDict[vertDictIdx] = flagStr, origVec, unbendVec
-                    vertDictIdx += 1
-
-                for theVert in self.__Shape.Faces[newNode.c_face_idx].Vertexes:
-                    flagStr = "o"
-                    origVec = theVert.Point
-                    unbendVec = None
-                    for pVert in self.__Shape.Faces[P_node.c_face_idx].Vertexes:
-                        if equal_vertex(theVert, pVert):
-                            flagStr = flagStr + "p"
-                            origVec = pVert.Point
-                            unbendVec = origVec
-                    # print('make vertexDict: ', flagStr, ' ', str(face_idx+1))
-                    newNode.vertexDict[vertDictIdx] = flagStr, origVec, unbendVec
-                    vertDictIdx += 1
+                self.set_bend_vertexes(newNode, wires_e_lists)
 
         # Part.show(self.__Shape.Faces[newNode.c_face_idx])
         # Part.show(self.__Shape.Faces[newNode.idx])
         if newNode.c_face_idx is None:
-            newNode.analysis_ok = False
-            newNode.error_code = 13  # Analysis: counter face not found
-            self.error_code = 13
-            self.failed_face_idx = face_idx
-            FreeCAD.Console.PrintLog(
-                "No counter-face Debugging Thickness: " + str(self.__thickness) + "\n"
-            )
-            Part.show(
-                self.__Shape.Faces[face_idx], "FailedFace" + str(face_idx + 1) + "_"
-            )
+            return self.counter_face_failed(newNode)
 
         # now we call the new code
         self.get_node_faces(newNode, wires_e_lists)
         # for nFace in newNode.nfIndexes:
         #  Part.show(nFace)
 
+        # register the node for all its faces, see searchNode
+        for nf_idx in newNode.nfIndexes:
+            self.node_by_face.setdefault(nf_idx, newNode)
+        self.node_by_face[newNode.idx] = newNode
+
         if P_node is None:
             self.root = newNode
         else:
             P_node.child_list.append(newNode)
         return newNode
 
+    def counter_face_candidates(self, face_idx):
+        # lists of the faces to search for the counter face: the paired
+        # faces of pair_counter_faces first, then all remaining faces, which
+        # finds counter faces of other surface types, like B-splines
+        paired = [
+            i for i in self.counter_faces.get(face_idx, ()) if i in self.index_set
+        ]
+        if paired:
+            yield paired
+        yield list(self.index_list)
+
+    def counter_face_failed(self, newNode):
+        # stop the analysis at a node without counter face
+        face_idx = newNode.idx
+        newNode.analysis_ok = False
+        newNode.error_code = 13  # Analysis: counter face not found
+        self.error_code = 13
+        self.failed_face_idx = face_idx
+        FreeCAD.Console.PrintLog(
+            "No counter-face Debugging Thickness: " + str(self.__thickness) + "\n"
+        )
+        Part.show(self.__Shape.Faces[face_idx], "FailedFace" + str(face_idx + 1) + "_")
+        return newNode
+
     def Bend_analysis(self, face_idx, parent_node=None, parent_edge=None):
         # This functions traverses the shape in order to build the bend-tree
         # For each relevant face a t_node is created and linked into the tree
         # the linking is done in the call of self.make_new_face_node
-        # print "Bend_analysis Face", face_idx +1 ,
-        # analysis_ok = True # not used anymore?
-        # edge_list = []
-        if self.error_code is None:
-            wires_edge_lists = []
-            wire_idx = -1
-            for n_wire in self.f_list[face_idx].Wires:
-                wire_idx += 1
-                wires_edge_lists.append([])
-                # for n_edge in self.__Shape.Faces[face_idx].Edges:
-                for n_edge in n_wire.Edges:
-                    if parent_edge:
-                        if not self.same_edges(parent_edge, n_edge):
-                            # edge_list.append(n_edge)
-                            wires_edge_lists[wire_idx].append(n_edge)
-                        #
-                    else:
-                        # edge_list.append(n_edge)
-                        wires_edge_lists[wire_idx].append(n_edge)
-            if parent_node:
-                FreeCAD.Console.PrintLog(
-                    " Parent Face" + str(parent_node.idx + 1) + "\n"
-                )
-            FreeCAD.Console.PrintLog("The list: " + str(self.index_list) + "\n")
-            parent_node = self.make_new_face_node(
-                face_idx, parent_node, parent_edge, wires_edge_lists
-            )
-            # Need also the edge_list in the node!
-            FreeCAD.Console.PrintLog(
-                "The list after make_new_face_node: " + str(self.index_list) + "\n"
-            )
+        # The traversal is depth first like a recursive call per child face,
+        # but uses a stack of [node, face_idx, next child position, removalList]
+        # in order to not hit the recursion limit with long chains of bends.
+        new_node = self.analyze_face(face_idx, parent_node, parent_edge)
+        if new_node is None:
+            return
+        node_stack = [[new_node, face_idx, 0, []]]
 
+        while node_stack:
+            frame = node_stack[-1]
+            parent_node, face_idx, child_index, removalList = frame
             # in the new code, only the list of child faces will be analyzed.
-            removalList = []
-
-            for child_index, child_info in enumerate(parent_node.child_idx_lists):
-                if child_info[0] in self.index_list:
-                    child_face_idx = child_info[0]
-                    child_face = self.__Shape.Faces[child_face_idx]
-                    edge = child_info[1]
+            if child_index >= len(parent_node.child_idx_lists):
+                for seams in removalList:
+                    parent_node.child_idx_lists.remove(seams)
+                node_stack.pop()
+                continue
+            frame[2] = child_index + 1
+            child_info = parent_node.child_idx_lists[child_index]
+
+            if child_info[0] in self.index_set:
+                child_face_idx = child_info[0]
+                child_face = self.__Shape.Faces[child_face_idx]
+                edge = child_info[1]
+
+                if self.handle_hole(
+                    parent_node, face_idx, edge, child_face, child_index
+                ):
+                    continue
+                if self.refine and self.handle_chamfer(
+                    face_idx, edge, child_face, child_face_idx
+                ):
+                    continue
+                new_node = self.analyze_face(child_face_idx, parent_node, edge)
+                if new_node is not None:
+                    node_stack.append([new_node, child_face_idx, 0, []])
+            else:
+                FreeCAD.Console.PrintLog(
+                    "remove child from List: " + str(child_info[0]) + "\n"
+                )
+                parent_node.seam_edges.append(
+                    child_info[1]
+                )  # give Information to the node, that it has a seam.
+                FreeCAD.Console.PrintLog(
+                    "node faces before: " + str(parent_node.nfIndexes) + "\n"
+                )
+                # do not make Faces at a detected seam!
+                # self.makeSeamFace(child_info[1], t_node)
+                removalList.append(child_info)
+                FreeCAD.Console.PrintLog(
+                    "node faces with seam: " + str(parent_node.nfIndexes) + "\n"
+                )
+                otherSeamNode = self.searchNode(child_info[0])
+                FreeCAD.Console.PrintLog(
+                    "counterface on otherSeamNode: Face"
+                    + str(otherSeamNode.c_face_idx + 1)
+                    + "\n"
+                )
+                # do not make Faces at a detected seam!
+                # self.makeSeamFace(child_info[1], otherSeamNode)
 
-                    if not self.handle_hole(
-                        parent_node, face_idx, edge, child_face, child_index
-                    ):
-                        if hasattr(FreeCADGui.Selection.getSelection()[0], "Refine"):
-                            if FreeCADGui.Selection.getSelection()[0].Refine is True:
-                                if not self.handle_chamfer(
-                                    face_idx, edge, child_face, child_face_idx
-                                ):
-                                    self.Bend_analysis(
-                                        child_face_idx, parent_node, edge
-                                    )
-                            else:
-                                self.Bend_analysis(child_face_idx, parent_node, edge)
-                        else:
-                            self.Bend_analysis(child_face_idx, parent_node, edge)
-                else:
-                    FreeCAD.Console.PrintLog(
-                        "remove child from List: " + str(child_info[0]) + "\n"
-                    )
-                    parent_node.seam_edges.append(
-                        child_info[1]
-                    )  # give Information to the node, that it has a seam.
-                    FreeCAD.Console.PrintLog(
-                        "node faces before: " + str(parent_node.nfIndexes) + "\n"
-                    )
-                    # do not make Faces at a detected seam!
-                    # self.makeSeamFace(child_info[1], t_node)
-                    removalList.append(child_info)
-                    FreeCAD.Console.PrintLog(
-                        "node faces with seam: " + str(parent_node.nfIndexes) + "\n"
-                    )
-                    otherSeamNode = self.searchNode(child_info[0], self.root)
-                    FreeCAD.Console.PrintLog(
-                        "counterface on otherSeamNode: Face"
-                        + str(otherSeamNode.c_face_idx + 1)
-                        + "\n"
-                    )
-                    # do not make Faces at a detected seam!
-                    # self.makeSeamFace(child_info[1], otherSeamNode)
-            for seams in removalList:
-                parent_node.child_idx_lists.remove(seams)
-        else:
+    def analyze_face(self, face_idx, parent_node=None, parent_edge=None):
+        # Makes the node of face_idx and links it into the tree.
+        # Returns None, if an error happened before.
+        if self.error_code is not None:
             FreeCAD.Console.PrintError(
                 "got error code: "
                 + str(self.error_code)
@@ -1618,6 +2069,25 @@ class SheetTree(object):
                 + str(self.failed_face_idx + 1)
                 + "\n"
             )
+            return None
+
+        wires_edge_lists = []
+        wire_idx = -1
+        for n_wire in self.f_list[face_idx].Wires:
+            wire_idx += 1
+            wires_edge_lists.append([])
+            for n_edge in n_wire.Edges:
+                if parent_edge:
+                    if not self.same_edges(parent_edge, n_edge):
+                        wires_edge_lists[wire_idx].append(n_edge)
+                else:
+                    wires_edge_lists[wire_idx].append(n_edge)
+        if parent_node:
+            FreeCAD.Console.PrintLog(" Parent Face" + str(parent_node.idx + 1) + "\n")
+        # Need also the edge_list in the node!
+        return self.make_new_face_node(
+            face_idx, parent_node, parent_edge, wires_edge_lists
+        )
 
     # Check if a face is a chamfer, and handle it as a special case.
     # parent_face_idx: The index of the top face
@@ -1782,7 +2252,9 @@ class SheetTree(object):
         neighbors = []
 
         for edge in face.Edges:
-            faces = self.__Shape.ancestorsOfType(edge, Part.Face)
+            faces = [
+                self.__Shape.Faces[i] for i in self.find_edge_faces(edge, strict=True)
+            ]
 
             for f in faces:
                 found = False
@@ -1803,8 +2275,11 @@ class SheetTree(object):
         min_distance = 0.0
         normal = self.face_normal(face)
 
-        # iterate on all faces to try to find the opposite face
-        for i, other_face in enumerate(self.__Shape.Faces):
+        # iterate on the paired faces to try to find the opposite face,
+        # on all faces for other face types, see pair_counter_faces
+        all_faces = range(len(self.__Shape.Faces))
+        for i in self.counter_faces.get(face_idx, all_faces):
+            other_face = self.__Shape.Faces[i]
             if i != face_idx:
                 # the counter face normal must be parallel to the face normal, and pointing in the opposite direction
                 # thus the dot product of the normals must be -1
@@ -2034,7 +2509,9 @@ class SheetTree(object):
 
     # Find an edge's face among a list of faces
     def find_edge_face(self, edge, faces):
-        edge_faces = self.__Shape.ancestorsOfType(edge, Part.Face)
+        edge_faces = [
+            self.__Shape.Faces[i] for i in self.find_edge_faces(edge, strict=True)
+        ]
 
         for face in faces:
             for edge_face in edge_faces:
@@ -2072,24 +2549,11 @@ class SheetTree(object):
 
         return None
 
-    def searchNode(self, theIdx, sNode):
-        # search for a Node with theIdx in sNode.idx
-        FreeCAD.Console.PrintLog("my Idx: " + str(sNode.idx) + "\n")
-
-        if sNode.idx == theIdx:
-            return sNode
-        else:
-            result = None
-            childFaces = []
-            for n_node in sNode.child_list:
-                childFaces.append(n_node.idx)
-            FreeCAD.Console.PrintLog("my children: " + str(childFaces) + "\n")
-
-            for n_node in sNode.child_list:
-                nextSearch = self.searchNode(theIdx, n_node)
-                if nextSearch is not None:
-                    result = nextSearch
-                    break
+    def searchNode(self, theIdx, sNode=None):
+        # search for the Node with theIdx in sNode.idx, or else the node
+        # having theIdx in its nfIndexes. sNode is not needed anymore, as
+        # make_new_face_node registers each node in self.node_by_face.
+        result = self.node_by_face.get(theIdx)
         if result is not None:
             FreeCAD.Console.PrintLog("This is the result: " + str(result.idx) + "\n")
         else:
@@ -2097,11 +2561,6 @@ class SheetTree(object):
 
         return result
 
-        # suche bei mir. wenn ja liefere ab
-        # sonst sind Kinder da?
-        # Wenn Kinder vorhanden, frag solange Kinder bis gefunden
-        # oder kein Kind mehr da.
-
     def rotateVec(self, vec, phi, rAxis):
         """rotate a vector by the angle phi around the axis rAxis"""
         # https://de.wikipedia.org/wiki/Drehmatrix
@@ -2127,7 +2586,7 @@ class SheetTree(object):
         kFactor = bend_node.k_Factor
 
         transRad = bRad + kFactor * thick
-        if KFACTORSTANDARD == "din":
+        if self.context.k_factor_standard == "din":
             conv = ", converted from DIN"
         else:
             conv = ""
@@ -2138,6 +2597,7 @@ class SheetTree(object):
 
         normVec = radial_vector(bend_node.p_edge.Vertexes[0].Point, cent, axis)
 
+        compRadialVec = None
         if mode == "top":
             chord = cent.sub(bend_node.p_edge.Vertexes[0].Point)
             norm = axis.cross(chord)
@@ -2148,24 +2608,24 @@ class SheetTree(object):
             norm = axis.cross(chord)
             compRadialVec = axis.cross(norm)
 
+        def unbendPoints(pois):
+            # the correction to the sheet plane is used for top and counter face
+            bPoints = unbend_points(
+                pois, cent, axis, nullVec, tanVec, transRad, compRadialVec
+            )
+            return to_vectors(bPoints)
+
         def unbendPoint(poi):
+            # single vertexes are unbent without the array set-up
             radVec = radial_vector(poi, cent, axis)
             angle = math.atan2(nullVec.cross(radVec).dot(axis), nullVec.dot(radVec))
-            # print 'point Face', str(fIdx+1), ' ', angle
             if angle < -math.pi / 8:
                 angle = angle + 2 * math.pi
             rotVec = self.rotateVec(poi.sub(cent), -angle, axis)
-            # print 'point if Face', str(fIdx+1), ' ', angle, ' ', transRad*angle
-            if (mode == "top") or (mode == "counter"):
-                chord = cent.sub(cent + rotVec)
-                norm = axis.cross(chord)
-                correctionVec = compRadialVec.sub(axis.cross(norm))
-                # correctionVec = axis.cross(norm).sub(compRadialVec)
-                # print 'origVec ', axis.cross(norm), ' compRadialVec ', compRadialVec
-                bPoint = cent + rotVec + correctionVec + tanVec * transRad * angle
-            else:
-                bPoint = cent + rotVec + tanVec * transRad * angle
-
+            bPoint = cent + rotVec + tanVec * transRad * angle
+            if compRadialVec is not None:
+                norm = axis.cross(rotVec.negative())
+                bPoint = bPoint + compRadialVec.sub(axis.cross(norm))
             return bPoint
 
         divisions = 12  # FIXME need a dependence on something useful.
@@ -2177,6 +2637,8 @@ class SheetTree(object):
         for aWire in fWireList:
             uEdge = None
             idxList, closedW = self.sortEdgesTolerant(aWire.Edges)
+            if self.error_code == 27:
+                self.failed_face_idx = fIdx
             # print('Wire', str(fIdx+1), ' has ', len(idxList), ' edges, closed: ', closedW)
 
             eList = []  # is the list of unbend edges
@@ -2197,19 +2659,13 @@ class SheetTree(object):
                 vert1Idx = None
 
                 # print 'edge vertexes: ', str(fIdx+1), ' ', mode, ' ', fEdge.Vertexes[0].Point, ' ', fEdge.Vertexes[1].Point
-                for oVertIdx in bend_node.vertexDict:
-                    flagStr, origVec, unbendVec = bend_node.vertexDict[oVertIdx]
-                    # print 'origVec: ', origVec
-                    if equal_vector(fEdge.Vertexes[0].Point, origVec, 5):
-                        vert0Idx = oVertIdx
-                        flags0 = flagStr
-                        uVert0 = unbendVec
-                    if vertexCount > 1:
-                        if equal_vector(fEdge.Vertexes[1].Point, origVec, 5):
-                            vert1Idx = oVertIdx
-                            flags1 = flagStr
-                            uVert1 = unbendVec
-                    # can we break the for loop at some condition?
+                vert0Idx = bend_node.findVertex(fEdge.Vertexes[0].Point)
+                if vert0Idx is not None:
+                    flags0, origVec, uVert0 = bend_node.vertexDict[vert0Idx]
+                if vertexCount > 1:
+                    vert1Idx = bend_node.findVertex(fEdge.Vertexes[1].Point)
+                    if vert1Idx is not None:
+                        flags1, origVec, uVert1 = bend_node.vertexDict[vert1Idx]
                 # Handle cases, where a side face has additional vertexes
                 if mode == "side":
                     if vert0Idx is None:
@@ -2218,7 +2674,7 @@ class SheetTree(object):
                         flags0 = ""
                         origVec = fEdge.Vertexes[0].Point
                         uVert0 = unbendPoint(origVec)
-                        bend_node.vertexDict[vert0Idx] = flags0, origVec, uVert0
+                        bend_node.addVertex(vert0Idx, flags0, origVec, uVert0)
                     if vertexCount > 1:
                         if vert1Idx is None:
                             vert1Idx = len(bend_node.vertexDict)
@@ -2226,21 +2682,17 @@ class SheetTree(object):
                             flags1 = ""
                             origVec = fEdge.Vertexes[1].Point
                             uVert1 = unbendPoint(origVec)
-                            bend_node.vertexDict[vert1Idx] = flags1, origVec, uVert1
+                            bend_node.addVertex(vert1Idx, flags1, origVec, uVert1)
 
-                # make the key for bend_node.edgeDict, shift vert1 and add both.
+                # make the key for bend_node.edgeDict from the sorted vertex indexes.
                 if vert0Idx is None:
                     # print 'catastrophy: ', fEdge.Vertexes[0].Point, ' ', fEdge.Vertexes[1].Point, ' ', eType
                     Part.show(fEdge, "catastrophyEdge")
                     # FIXME, need proper failure mode.
-                if vert1Idx:
-                    if vert1Idx < vert0Idx:
-                        edgeKey = vert0Idx + (vert1Idx << 8)
-                    else:
-                        edgeKey = vert1Idx + (vert0Idx << 8)
-                    # x << n: x shifted left by n bits = Multiplication
+                if vert1Idx is not None:
+                    edgeKey = (min(vert0Idx, vert1Idx), max(vert0Idx, vert1Idx))
                 else:
-                    edgeKey = vert0Idx
+                    edgeKey = (vert0Idx,)
 
                 # print 'edgeKey: ', edgeKey, ' ', str(fIdx+1), ' ', mode, ' ', uVert0, ' ', uVert1
 
@@ -2281,10 +2733,14 @@ class SheetTree(object):
 
                     iMulti = (maxPar - minPar) / eDivisions
                     urollPts.append(uVert0)
-                    for i in range(1, eDivisions):
-                        posi = fEdge.valueAt(minPar + i * iMulti)
-                        bPosi = unbendPoint(posi)
-                        urollPts.append(bPosi)
+                    urollPts.extend(
+                        unbendPoints(
+                            [
+                                fEdge.valueAt(minPar + i * iMulti)
+                                for i in range(1, eDivisions)
+                            ]
+                        )
+                    )
                     urollPts.append(uVert1)
 
                     uCurve = Part.BSplineCurve()
@@ -2322,17 +2778,14 @@ class SheetTree(object):
                     # compare minimal 1/curvature with curve-lenght to decide on division
                     iMulti = (maxPar - minPar) / 24
                     maxCurva = 0.0
-                    testPts = []
-                    for i in range(24 + 1):
-                        posi = fEdge.valueAt(minPar + i * iMulti)
-                        bPosi = unbendPoint(posi)
-                        testPts.append(bPosi)
+                    testPts = unbendPoints(
+                        [fEdge.valueAt(minPar + i * iMulti) for i in range(24 + 1)]
+                    )
                     testCurve = Part.BSplineCurve()
                     testCurve.interpolate(testPts)
                     testEdge = testCurve.toShape()
 
                     for i in range(24 + 1):
-                        posi = testEdge.valueAt(minPar + i * iMulti)
                         # print 'testEdge ', i, ' curva: ' , testEdge.Curve.curvature(minPar + i*iMulti)
                         curva = testEdge.Curve.curvature(minPar + i * iMulti)
                         if curva > maxCurva:
@@ -2348,22 +2801,18 @@ class SheetTree(object):
                         bDivisions = 12
 
                     iMulti = (maxPar - minPar) / bDivisions
+                    innerPts = unbendPoints(
+                        [
+                            fEdge.valueAt(minPar + i * iMulti)
+                            for i in range(1, bDivisions)
+                        ]
+                    )
+                    urollPts.append(uVert0)
+                    urollPts.extend(innerPts)
                     if vertexCount > 1:
-                        urollPts.append(uVert0)
-                        for i in range(1, bDivisions):
-                            posi = fEdge.valueAt(minPar + i * iMulti)
-                            # curvature is 1/radius
-                            # print 'Face', str(fIdx+1), ' 1/Curvature: ', 1/fEdge.Curve.curvature(minPar + i*iMulti), ' ', fEdge.Length
-                            bPosi = unbendPoint(posi)
-                            urollPts.append(bPosi)
                         urollPts.append(uVert1)
                     else:
                         urollPts.append(uVert0)
-                        for i in range(1, bDivisions):
-                            posi = fEdge.valueAt(minPar + i * iMulti)
-                            bPosi = unbendPoint(posi)
-                            urollPts.append(bPosi)
-                        urollPts.append(uVert0)
                     # testPoly = Part.makePolygon(urollPts)
                     # Part.show(testPoly, 'testPoly'+ str(fIdx+1) + '_')
                     uCurve = Part.BSplineCurve()
@@ -2514,14 +2963,22 @@ class SheetTree(object):
         returns:
           a new sorted list of indexes to edges of the original wire
           flag if wire is closed or not (a wire of a cylinder mantle is not closed!)
+        Starting with the first edge, the next edge is the edge with the
+        lowest index, that is connected to the end of the sorted edges.
+        Sets error code 27, if the remaining edges are not connected.
         """
+        # the edges at each vertex, in the order of myEdgeList
+        vertIndex = VertexIndex()
+        vertEdges = {}
+        for eIdx, edge in enumerate(myEdgeList):
+            for theVert in edge.Vertexes[:2]:
+                vertEdges.setdefault(vertIndex.add(theVert.Point), []).append(eIdx)
+        used = [False] * len(myEdgeList)
+
         eIndex = 0
-        newEdgeList = []
-        idxList = list(range(len(myEdgeList)))
         newIdxList = [eIndex]
-        newEdgeList.append(myEdgeList[eIndex])
-        idxList.remove(eIndex)
-        gotConnection = False
+        used[eIndex] = True
+        remaining = len(myEdgeList) - 1
         closedWire = False
 
         startVert = myEdgeList[eIndex].Vertexes[0]
@@ -2529,33 +2986,34 @@ class SheetTree(object):
             vert = myEdgeList[eIndex].Vertexes[1]
         else:
             vert = myEdgeList[eIndex].Vertexes[0]
-        # Part.show(myEdgeList[0], 'tolEdge'+str(1)+'_')
-        while not gotConnection:
-            for eIdx in idxList:
-                edge = myEdgeList[eIdx]
-                if equal_vertex(vert, edge.Vertexes[0]):
-                    idxList.remove(eIdx)
+        while True:
+            eIndex = None
+            for eIdx in vertEdges.get(vertIndex.find(vert.Point), ()):
+                if not used[eIdx]:
                     eIndex = eIdx
-                    # print 'found eIdx: ', eIdx
-                    newIdxList.append(eIdx)
+                    break
+            if eIndex is not None:
+                edge = myEdgeList[eIndex]
+                used[eIndex] = True
+                remaining -= 1
+                newIdxList.append(eIndex)
+                if equal_vertex(vert, edge.Vertexes[0]):
                     if len(edge.Vertexes) > 1:
                         vert = edge.Vertexes[1]
-                    break
-                if len(edge.Vertexes) > 1:
-                    if equal_vertex(vert, edge.Vertexes[1]):
-                        idxList.remove(eIdx)
-                        eIndex = eIdx
-                        # print 'found eIdx: ', eIdx
-                        newIdxList.append(eIdx)
-                        vert = edge.Vertexes[0]
-                        break
-            if len(idxList) == 0:
-                gotConnection = True
+                else:
+                    vert = edge.Vertexes[0]
             if equal_vertex(vert, startVert):
                 # print 'got last connection'
-                gotConnection = True
                 closedWire = True
-            # Part.show(myEdgeList[eIdx], 'tolEdge'+str(eIdx+1)+'_')
+                break
+            if remaining == 0:
+                break
+            if eIndex is None:
+                FreeCAD.Console.PrintLog(
+                    "sortEdgesTolerant: no edge connected at " + str(vert.Point) + "\n"
+                )
+                self.error_code = 27
+                break
         # print 'tolerant wire: ', len(myEdgeList)
         return newIdxList, closedWire
 
@@ -2569,13 +3027,44 @@ class SheetTree(object):
         tanVec = bend_node.tan_vec
         theFace = self.f_list[bend_node.idx]
 
-        angle_0 = theFace.ParameterRange[0]
-        angle_1 = theFace.ParameterRange[1]
-        length_0 = theFace.ParameterRange[2]
+        par_range = self.surface_table.par_ranges[bend_node.idx].tolist()
+        angle_0, angle_1, length_0, length_1 = par_range
 
         halfAngle = (angle_0 + angle_1) / 2
         bLinePoint0 = theFace.valueAt(halfAngle, length_0)
-        # bLinePoint1 = theFace.valueAt(halfAngle,length_1)
+        if self.isUntrimmedBend(bend_node.idx):
+            # the fold line is the line of the face at halfAngle
+            bLinePoint1 = theFace.valueAt(halfAngle, length_1)
+            linePoints = [[bLinePoint0, bLinePoint1]]
+        else:
+            linePoints = self.sliceFoldLines(theFace, bLinePoint0, cent, axis)
+
+        wireList = []
+        for points in linePoints:
+            urollPts = to_vectors(
+                unbend_points(
+                    points, cent, axis, nullVec, tanVec, transRad, wrapAngle=0.0
+                )
+            )
+            edgeL = Part.makeLine(urollPts[0], urollPts[1])
+            wireList.append(edgeL)
+            # Part.show(edgeL, 'foldLine'+str(bend_node.idx +1)+'_')
+
+        return wireList
+
+    def isUntrimmedBend(self, fIdx):
+        # True, if the bend face fIdx covers its whole parameter range, then
+        # its area is the one of the cylinder segment. Trimmed or notched
+        # bend faces have a smaller area.
+        table = self.surface_table
+        angle_0, angle_1, length_0, length_1 = table.par_ranges[fIdx].tolist()
+        radius = float(table.radii[fIdx])
+        segmentArea = radius * abs(angle_1 - angle_0) * abs(length_1 - length_0)
+        return math.isclose(table.area(fIdx), segmentArea, rel_tol=1e-6)
+
+    def sliceFoldLines(self, theFace, bLinePoint0, cent, axis):
+        # Slice the bend face through its axis and bLinePoint0.
+        # Returns the end points of the line edges of the slice.
         normVec = radial_vector(bLinePoint0, cent, axis)
         sliceVec = normVec.cross(axis)
         origin = Base.Vector(0.0, 0.0, 0.0)
@@ -2593,35 +3082,17 @@ class SheetTree(object):
         # Part.show(Part.Compound(wires), 'slice')
         theComp = Part.Compound(wires)
         # FIXME, what if there are no wires?
-        wireList = []
+        linePoints = []
 
         for fEdge in theComp.Edges:
             eType = str(fEdge.Curve)
             # print "the type of curve: ", eType
-            urollPts = []
-
             if "<Line" in eType:
-                for lVert in fEdge.Vertexes:
-                    posi = lVert.Point
-                    radVec = radial_vector(posi, cent, axis)
-                    angle = math.atan2(
-                        nullVec.cross(radVec).dot(axis), nullVec.dot(radVec)
-                    )
-                    if angle < 0:
-                        angle = angle + 2 * math.pi
-                    rotVec = self.rotateVec(posi.sub(cent), -angle, axis)
-
-                    bPosi = cent + rotVec + tanVec * transRad * angle
-
-                    urollPts.append(bPosi)
-                edgeL = Part.makeLine(urollPts[0], urollPts[1])
-                lWire = Part.Wire([edgeL])
-                wireList.append(edgeL)
-                # Part.show(lWire, 'foldLine'+str(bend_node.idx +1)+'_')
+                linePoints.append([lVert.Point for lVert in fEdge.Vertexes])
             else:
                 print("FIXME! make errorcondition")
 
-        return wireList
+        return linePoints
 
     def unbendVertDict(self, bend_node, cent, axis, nullVec):
         """
@@ -2629,20 +3100,6 @@ class SheetTree(object):
         This is called with the vertices of the top and the opposite face only.
         """
 
-        def unbendDictPoint(poi, compRadialVec):
-            radVec = radial_vector(poi, cent, axis)
-            angle = math.atan2(nullVec.cross(radVec).dot(axis), nullVec.dot(radVec))
-            # print 'point Face', str(fIdx+1), ' ', angle
-            if angle < -math.pi / 8:
-                angle = angle + 2 * math.pi
-            rotVec = self.rotateVec(poi.sub(cent), -angle, axis)
-            chord = cent.sub(cent + rotVec)
-            norm = axis.cross(chord)
-            correctionVec = compRadialVec.sub(axis.cross(norm))
-            # print 'origVec ', axis.cross(norm), ' compRadialVec ', compRadialVec
-            bPoint = cent + rotVec + correctionVec + tanVec * transRad * angle
-            return bPoint
-
         thick = self.__thickness
         transRad = bend_node.innerRadius + bend_node.k_Factor * thick
         tanVec = bend_node.tan_vec
@@ -2655,24 +3112,44 @@ class SheetTree(object):
         norm = axis.cross(chord)
         oppCompRadialVec = axis.cross(norm)
 
-        for i in bend_node.vertexDict:
-            flagStr, origVec, unbendVec = bend_node.vertexDict[i]
-            if (not ("p" in flagStr)) and (not ("c" in flagStr)):
-                if "t" in flagStr:
-                    unbendVec = unbendDictPoint(origVec, topCompRadialVec)
-                else:
-                    unbendVec = unbendDictPoint(origVec, oppCompRadialVec)
-                # print 'unbendDictPoint for ', flagStr
+        # the points of the top face and of the opposite face are unbend
+        # each in one call
+        for compRadialVec, isTop in (
+            (topCompRadialVec, True),
+            (oppCompRadialVec, False),
+        ):
+            keys = []
+            for i in bend_node.vertexDict:
+                flagStr = bend_node.vertexDict[i][0]
+                if (not ("p" in flagStr)) and (not ("c" in flagStr)):
+                    if ("t" in flagStr) == isTop:
+                        keys.append(i)
+            if not keys:
+                continue
+            unbendVecs = to_vectors(
+                unbend_points(
+                    [bend_node.vertexDict[i][1] for i in keys],
+                    cent,
+                    axis,
+                    nullVec,
+                    tanVec,
+                    transRad,
+                    compRadialVec,
+                )
+            )
+            for i, unbendVec in zip(keys, unbendVecs):
+                flagStr, origVec, oldVec = bend_node.vertexDict[i]
                 bend_node.vertexDict[i] = flagStr, origVec, unbendVec
 
         # for i in bend_node.vertexDict:
         # flagStr, origVec, unbendVec = bend_node.vertexDict[i]
         # print 'vDict Face', str(bend_node.idx+1), ' ', i, ' ', flagStr, ' ', origVec, ' ', unbendVec
 
-    def generateBendShell2(self, bend_node):
+    def generateBendShell2(self, bend_node, top_only=False):
         """
         This function takes a cylindrical bend part of sheet metal and
         returns a flat version of that bend part.
+        With top_only=True only the top face is unbent.
         """
         theCenter = bend_node.bendCenter  # theCyl.Surface.Center
         theAxis = bend_node.axis  # theCyl.Surface.Axis
@@ -2685,6 +3162,13 @@ class SheetTree(object):
         # tanVec_line = Part.makeLine(zeroVert.Point, zeroVert.Point + bend_node.tan_vec*bend_node.innerRadius)
         # Part.show(tanVec_line, 'tanVec_line'+ str(bend_node.idx+1)+'_')
 
+        # remove the results of a former unfold, which are added by unbendFace:
+        # additional side vertexes and the unbend edges.
+        sideKeys = [k for k in bend_node.vertexDict if bend_node.vertexDict[k][0] == ""]
+        for key in sideKeys:
+            bend_node.removeVertex(key)
+        bend_node.edgeDict = {}
+
         # calculate the unbend points in the bend_ node.vertexDict
         self.unbendVertDict(bend_node, theCenter, theAxis, nullVec)
 
@@ -2694,6 +3178,9 @@ class SheetTree(object):
 
         flat_shell = []
         flat_shell.append(self.unbendFace(bend_node.idx, bend_node, nullVec, "top"))
+        foldwires = self.makeFoldLines(bend_node, nullVec)
+        if top_only:
+            return flat_shell, foldwires
         flat_shell.append(
             self.unbendFace(bend_node.c_face_idx, bend_node, nullVec, "counter")
         )
@@ -2705,7 +3192,6 @@ class SheetTree(object):
             # for v in bFace.Vertexes:
             #  print 'Face'+str(i+1) + ' ' + str(v.X) + ' ' + str(v.Y) + ' ' + str(v.Z)
 
-        foldwires = self.makeFoldLines(bend_node, nullVec)
         # print 'face idx: ', bend_node.idx +1, ' folds: ', foldwires
         return flat_shell, foldwires
 
@@ -2798,57 +3284,199 @@ class SheetTree(object):
         seam_wire = Part.Wire([sEdge, nextEdge, midEdge, lastEdge])
         seamFace = Part.Face(seam_wire)
         self.f_list.append(seamFace)
+        self.index_face(self.max_f_idx)
         theNode.nfIndexes.append(self.max_f_idx)
+        self.node_by_face.setdefault(self.max_f_idx, theNode)
         self.max_f_idx += 1
 
     def showFaces(self):
         for i in self.index_list:
             Part.show(self.f_list[i])
 
-    def unfold_tree2(self, node):
+    def unfold_tree2(self, node, release=False, top_only=False):
         # This function traverses the tree and unfolds the faces
         # beginning at the outermost nodes.
+        # With release=True the OCC data of each node is dropped, as soon
+        # as its subtree is unfolded, and the reference to the shape after
+        # the root. The tree can not be unfolded again.
+        # With top_only=True only the top faces of the nodes are unfolded,
+        # which is enough for a flat pattern, see makeFlatPattern.
+        # The tree is traversed in post-order with a stack of
+        # [node, next child position, shells of children, fold lines of children,
+        # placement]. The placement is the composition of the unbend transforms
+        # of all bend nodes above the node. It is applied once to the faces
+        # and fold lines of the node.
         # print "unfold_tree face", node.idx + 1
-        theShell = []
-        nodeShell = []
-        theFoldLines = []
-        nodeFoldLines = []
-        for n_node in node.child_list:
-            if self.error_code is None:
-                shell, foldLines = self.unfold_tree2(n_node)
-                theShell = theShell + shell
-                theFoldLines = theFoldLines + foldLines
-        if node.node_type == "Bend":
-            trans_vec = node.tan_vec * node._trans_length
-            for bFaces in theShell:
-                bFaces.rotate(
-                    self.f_list[node.idx].Surface.Center,
-                    node.axis,
-                    math.degrees(-node.bend_angle),
-                )
-                bFaces.translate(trans_vec)
-            for fold in theFoldLines:
-                fold.rotate(
-                    self.f_list[node.idx].Surface.Center,
-                    node.axis,
-                    math.degrees(-node.bend_angle),
-                )
-                fold.translate(trans_vec)
-            if self.error_code is None:
-                # nodeShell = self.generateBendShell(node)
-                nodeShell, nodeFoldLines = self.generateBendShell2(node)
-        else:
-            if self.error_code is None:
-                # nodeShell = self.generateShell(node)
-                for idx in node.nfIndexes:
-                    new_face = self.build_new_face(idx)
-                    nodeShell.append(new_face)
-
-                # if len(node.seam_edges)>0:
-                #  for seamEdge in node.seam_edges:
-                #    self.makeSeamFace(seamEdge, node)
-        FreeCAD.Console.PrintLog("ufo finish face" + str(node.idx + 1) + "\n")
-        return (theShell + nodeShell, theFoldLines + nodeFoldLines)
+        node_stack = [[node, 0, [], [], None]]
+        while True:
+            frame = node_stack[-1]
+            node = frame[0]
+            if frame[1] < len(node.child_list):
+                n_node = node.child_list[frame[1]]
+                frame[1] += 1
+                if self.error_code is None:
+                    placement = frame[4]
+                    if node.node_type == "Bend":
+                        if placement is None:
+                            placement = self.unbendPlacement(node)
+                        else:
+                            placement = placement.multiply(self.unbendPlacement(node))
+                    node_stack.append([n_node, 0, [], [], placement])
+                continue
+            node_stack.pop()
+            theShell = frame[2]
+            theFoldLines = frame[3]
+            nodeShell = []
+            nodeFoldLines = []
+            if node.node_type == "Bend":
+                if self.error_code is None:
+                    # nodeShell = self.generateBendShell(node)
+                    nodeShell, nodeFoldLines = self.generateBendShell2(
+                        node, top_only
+                    )
+            else:
+                if self.error_code is None:
+                    # nodeShell = self.generateShell(node)
+                    for idx in [node.idx] if top_only else node.nfIndexes:
+                        new_face = self.build_new_face(idx)
+                        nodeShell.append(new_face)
+
+                    # if len(node.seam_edges)>0:
+                    #  for seamEdge in node.seam_edges:
+                    #    self.makeSeamFace(seamEdge, node)
+            if frame[4] is not None:
+                for nShape in nodeShell + nodeFoldLines:
+                    nShape.Placement = frame[4].multiply(nShape.Placement)
+            FreeCAD.Console.PrintLog("ufo finish face" + str(node.idx + 1) + "\n")
+            if release:
+                self.release_node(node)
+            if not node_stack:
+                if release and node is self.root:
+                    self.release_shape()
+                return (theShell + nodeShell, theFoldLines + nodeFoldLines)
+            node_stack[-1][2].extend(theShell + nodeShell)
+            node_stack[-1][3].extend(theFoldLines + nodeFoldLines)
+
+    def release_node(self, node):
+        # drop the faces and edges of an unfolded node and of its children
+        node.release()
+        for nf_idx in node.nfIndexes:
+            self.f_list[nf_idx] = None
+            if self.node_by_face.get(nf_idx) is node:
+                del self.node_by_face[nf_idx]
+        node.child_list = []
+        self.released = True
+
+    def release_shape(self):
+        # drop the references of the tree to the shape, its faces and edges,
+        # after the whole tree has been unfolded. The shape itself is only
+        # freed, when the caller does not hold it too.
+        self.__Shape = None
+        self.f_list = []
+        self.surface_table = None
+        self.edge_faces = {}
+        self.wire_replacements = []
+
+    def reunfold(self, k_factor_lookup=None, k_factor_standard=None, top_only=False):
+        """Unfolds the analyzed tree again with other K-factors.
+        The analysis of the shape does not depend on the K-factor, only the
+        translation lengths of the bends need to be updated.
+        Returns the faces and fold lines like unfold_tree2.
+        """
+        if self.released:
+            raise TreeException("the tree was released by unfold_tree2")
+        self.error_code = None  # of a former unfold of the tree
+        self.failed_face_idx = None
+        context = copy.copy(self.context)
+        if k_factor_lookup is not None:
+            context.k_factor_lookup = k_factor_lookup
+        if k_factor_standard is not None:
+            context.k_factor_standard = k_factor_standard
+        self.context = context
+        self.k_factor_lookup = context.k_factor_lookup
+
+        node_stack = [self.root]
+        while node_stack:
+            node = node_stack.pop()
+            node_stack.extend(node.child_list)
+            node.context = context
+            node.k_factor_lookup = context.k_factor_lookup
+            if node.node_type != "Bend":
+                continue
+            trans_length = (
+                node.innerRadius + node.k_Factor * self.__thickness
+            ) * node.trans_angle
+            # The unbend points of the child node vertexes (flag "c") are
+            # translated by the translation length, see make_new_face_node.
+            shift = node.tan_vec * (trans_length - node._trans_length)
+            for vKey in node.vertexDict:
+                flagStr, origVec, unbendVec = node.vertexDict[vKey]
+                if "c" in flagStr:
+                    node.vertexDict[vKey] = flagStr, origVec, unbendVec + shift
+            node._trans_length = trans_length
+
+        return self.unfold_tree2(self.root, top_only=top_only)
+
+    def reroot(self, new_root):
+        """Makes the flat node new_root the stationary node of the unfold.
+        The parent and child links on the path to the old root are reversed
+        and the bends on this path are set up again for their new parent,
+        so the shape needs no new analysis.
+        """
+        if self.released:
+            raise TreeException("the tree was released by unfold_tree2")
+        self.error_code = None  # of a former unfold of the tree
+        self.failed_face_idx = None
+        if new_root is self.root:
+            return
+        if new_root.node_type != "Flat":
+            raise ValueError("Face" + str(new_root.idx + 1) + " is not a flat node")
+        # the path from the new root up to the old root
+        path = [new_root]
+        while path[-1].p_node is not None:
+            path.append(path[-1].p_node)
+        # the connecting edge is stored at the lower node, so start at the top
+        for lower, upper in reversed(list(zip(path, path[1:]))):
+            upper.child_list.remove(lower)
+            lower.child_list.append(upper)
+            upper.p_node = lower
+            upper.p_edge = lower.p_edge
+        new_root.p_node = None
+        new_root.p_edge = None
+        self.root = new_root
+
+        # The bends on the path are unbent in the other direction now: bend
+        # direction, tangent vector and vertexDict depend on the parent node.
+        for node in path[1:]:
+            if node.node_type != "Bend":
+                continue
+            node.axis = self.surface_table.axis(node.idx)
+            node.clearVertexes()
+            self.set_bend_dir(node)
+            self.set_bend_vertexes(node)
+            for child in node.child_list:
+                if child.node_type == "Flat":
+                    self.link_flat_child(child)
+
+    def flatNodes(self):
+        # all flat nodes of the tree, they can be the root of the unfold
+        nodes = []
+        node_stack = [self.root]
+        while node_stack:
+            node = node_stack.pop()
+            node_stack.extend(node.child_list)
+            if node.node_type == "Flat":
+                nodes.append(node)
+        return nodes
+
+    def unbendPlacement(self, bend_node):
+        # The transformation of the faces below a bend node into the plane
+        # of its parent: a rotation around the bend axis followed by the
+        # translation along the tangent by the unfolded length of the bend.
+        center = self.surface_table.center(bend_node.idx)
+        rot = Base.Rotation(bend_node.axis, math.degrees(-bend_node.bend_angle))
+        trans_vec = bend_node.tan_vec * bend_node._trans_length
+        return Base.Placement(center - rot.multVec(center) + trans_vec, rot)
 
     # Build a copy of the face, replacing any wire that must be replaced
     def build_new_face(self, face_index):
@@ -2883,6 +3511,7 @@ class SheetTree(object):
 #  from Defeaturing WB: Export to Step
 def sew_Shape():
     """checking Shape"""
+    import FreeCADGui
 
     doc = FreeCAD.ActiveDocument
     docG = FreeCADGui.ActiveDocument
@@ -2908,6 +3537,8 @@ def sew_Shape():
 
 
 def makeSolidExpSTEP():
+    import FreeCADGui
+
     doc = FreeCAD.ActiveDocument
     docG = FreeCADGui.ActiveDocument
     if doc is not None:
@@ -2944,27 +3575,44 @@ def makeSolidExpSTEP():
 ##
 
 
-def getUnfold(k_factor_lookup, solid, subelement, facename):
+def getUnfoldFromShape(
+    shape,
+    face_idx,
+    k_factor_lookup,
+    kFactorStandard="ansi",
+    refine=False,
+    release=False,
+    flatPatternOnly=False,
+):
+    """Unfolds the sheet metal shape, starting at the planar face with the
+    index face_idx. Needs no document or GUI.
+    k_factor_lookup: dictionary of the k-factors per radius/thickness ratio,
+    or an UnfoldContext, then kFactorStandard and refine are not used.
+    kFactorStandard: "ansi" or "din".
+    refine: the shape is refined, handle chamfers at the sheet edges.
+    release: drop the data of the tree nodes while unfolding and the
+    references of the tree to the shape after it, to lower the memory use.
+    The shape stays alive as long as the caller holds it. The tree can not
+    be used by getReunfold then.
+    flatPatternOnly: unfold only the top faces and return the compound of
+    the wires of the flat pattern instead of the unfolded solid, see
+    makeFlatPattern.
+    Returns the tuple (unfolded shape, compound of fold lines, tree). On
+    failure the shapes are None and tree.error_code is set.
+    """
+    if isinstance(k_factor_lookup, UnfoldContext):
+        context = k_factor_lookup
+    else:
+        context = UnfoldContext(k_factor_lookup, kFactorStandard, refine)
     resPart = None
-    normalVect = None
     folds = None
-    theName = None
-    faceSel = ""
-    ob_Name = solid.Name
-    err_code = 0
-
-    normalVect = subelement.normalAt(0, 0)
-    FreeCAD.Console.PrintLog(f"name: {facename}\n ")
-    f_number = int(facename.lstrip("Face")) - 1
 
     startzeit = time.process_time()
 
-    TheTree = SheetTree(
-        solid.Shape, f_number, k_factor_lookup
-    )  # initializes the tree-structure
+    TheTree = SheetTree(shape, face_idx, context)  # initializes the tree-structure
     if TheTree.error_code is None:
         TheTree.Bend_analysis(
-            f_number, None
+            face_idx, None
         )  # traverses the shape and builds the tree-structure
         endzeit = time.process_time()
         FreeCAD.Console.PrintLog("Analytical time: " + str(endzeit - startzeit) + "\n")
@@ -2972,7 +3620,7 @@ def getUnfold(k_factor_lookup, solid, subelement, facename):
         if TheTree.error_code is None:
             # TheTree.showFaces()
             theFaceList, foldLines = TheTree.unfold_tree2(
-                TheTree.root
+                TheTree.root, release, flatPatternOnly
             )  # traverses the tree-structure
             if TheTree.error_code is None:
                 unfoldTime = time.process_time()
@@ -2980,54 +3628,223 @@ def getUnfold(k_factor_lookup, solid, subelement, facename):
                     "time to run the unfold: " + str(unfoldTime - endzeit) + "\n"
                 )
                 folds = Part.Compound(foldLines)
-                # Part.show(folds, 'Fold_Lines')
-                try:
-                    newShell = Part.Shell(theFaceList)
-                except:
-                    FreeCAD.Console.PrintLog(
-                        "couldn't join some faces, show only single faces!\n"
-                    )
-                    resPart = Part.Compound(theFaceList)
-                    # for newFace in theFaceList:
-                    # Part.show(newFace)
+                if flatPatternOnly:
+                    resPart = makeFlatPattern(theFaceList)
                 else:
-                    try:
-                        TheSolid = Part.Solid(newShell)
-                        solidTime = time.process_time()
-                        FreeCAD.Console.PrintLog(
-                            "Time to make the solid: "
-                            + str(solidTime - unfoldTime)
-                            + "\n"
-                        )
-                    except:
-                        FreeCAD.Console.PrintLog(
-                            "Couldn't make a solid, show only a shell, Faces in List: "
-                            + str(len(theFaceList))
-                            + "\n"
-                        )
-                        resPart = newShell
-                        # Part.show(newShell)
-                        showTime = time.process_time()
-                        FreeCAD.Console.PrintLog(
-                            "Show time: " + str(showTime - unfoldTime) + "\n"
-                        )
-                    else:
-                        try:
-                            cleanSolid = TheSolid.removeSplitter()
-                            # Part.show(cleanSolid)
-                            resPart = cleanSolid
-
-                        except:
-                            # Part.show(TheSolid)
-                            resPart = TheSolid
-                        showTime = time.process_time()
-                        FreeCAD.Console.PrintLog(
-                            "Show time: "
-                            + str(showTime - solidTime)
-                            + " total time: "
-                            + str(showTime - startzeit)
-                            + "\n"
-                        )
+                    resPart = makeUnfoldResult(theFaceList)
+                showTime = time.process_time()
+                FreeCAD.Console.PrintLog(
+                    "total time: " + str(showTime - startzeit) + "\n"
+                )
+
+    return resPart, folds, TheTree
+
+
+def getReunfold(
+    TheTree, k_factor_lookup, kFactorStandard="ansi", flatPatternOnly=False
+):
+    """Unfolds a tree returned by getUnfoldFromShape again with other
+    K-factors, without a new analysis of the shape.
+    Returns the tuple (unfolded shape, compound of fold lines, tree).
+    """
+    resPart = None
+    folds = None
+    theFaceList, foldLines = TheTree.reunfold(
+        k_factor_lookup, kFactorStandard, flatPatternOnly
+    )
+    if TheTree.error_code is None:
+        folds = Part.Compound(foldLines)
+        if flatPatternOnly:
+            resPart = makeFlatPattern(theFaceList)
+        else:
+            resPart = makeUnfoldResult(theFaceList)
+    return resPart, folds, TheTree
+
+
+def getBestUnfold(
+    shape, face_idx, k_factor_lookup, kFactorStandard="ansi", refine=False
+):
+    """Like getUnfoldFromShape, but the analyzed tree is unfolded from each
+    of its flat faces and the unfold with the smallest bounding box in the
+    plane of its stationary face is kept. The shape is analyzed only once.
+    Returns the tuple (unfolded shape, compound of fold lines, tree), the
+    tree is rooted at the stationary face of the kept unfold.
+    """
+    if isinstance(k_factor_lookup, UnfoldContext):
+        context = k_factor_lookup
+    else:
+        context = UnfoldContext(k_factor_lookup, kFactorStandard, refine)
+
+    TheTree = SheetTree(shape, face_idx, context)
+    if TheTree.error_code is None:
+        TheTree.Bend_analysis(face_idx, None)
+    if TheTree.error_code is not None:
+        return None, None, TheTree
+
+    best = None  # (area, node, unfolded faces, fold lines)
+    for node in TheTree.flatNodes():
+        TheTree.reroot(node)
+        theFaceList, foldLines = TheTree.unfold_tree2(TheTree.root)
+        if TheTree.error_code is not None:
+            FreeCAD.Console.PrintLog(
+                "Unfold from Face" + str(node.idx + 1) + " failed\n"
+            )
+            error = TheTree.error_code, TheTree.failed_face_idx
+            TheTree.error_code = None
+            TheTree.failed_face_idx = None
+            continue
+        # the faces are measured, only the kept unfold is joined to a solid
+        area = flatBoundArea(Part.Compound(theFaceList), TheTree.f_list[node.idx])
+        if best is None or area < best[0]:
+            best = area, node, theFaceList, foldLines
+
+    if best is None:
+        TheTree.error_code, TheTree.failed_face_idx = error
+        return None, None, TheTree
+    TheTree.reroot(best[1])
+    FreeCAD.Console.PrintLog("Best unfold from Face" + str(best[1].idx + 1) + "\n")
+    return makeUnfoldResult(best[2]), Part.Compound(best[3]), TheTree
+
+
+def flatBoundArea(shape, face):
+    # area of the bounding box of a flat shape in the plane of the face,
+    # the box is aligned to the parameter directions of the plane
+    surface = face.Surface
+    origin = surface.value(0.0, 0.0)
+    u_dir = surface.value(1.0, 0.0) - origin
+    v_dir = surface.value(0.0, 1.0) - origin
+    rot = Base.Rotation(u_dir, v_dir, u_dir.cross(v_dir), "ZXY")
+    local = shape.copy()
+    local.Placement = Base.Placement(origin, rot).inverse().multiply(local.Placement)
+    box = local.BoundBox
+    return box.XLength * box.YLength
+
+
+def makeUnfoldResult(theFaceList):
+    # join the unfolded faces to a solid, or at least a shell or compound
+    try:
+        newShell = Part.Shell(theFaceList)
+    except:
+        FreeCAD.Console.PrintLog("couldn't join some faces, show only single faces!\n")
+        return Part.Compound(theFaceList)
+    try:
+        TheSolid = Part.Solid(newShell)
+    except:
+        FreeCAD.Console.PrintLog(
+            "Couldn't make a solid, show only a shell, Faces in List: "
+            + str(len(theFaceList))
+            + "\n"
+        )
+        return newShell
+    try:
+        return TheSolid.removeSplitter()
+    except:
+        return TheSolid
+
+
+def makeFlatPattern(theFaceList):
+    """Joins the unfolded top faces to the wires of the flat pattern. The
+    edges between two faces are dropped, the other edges form the outline
+    and the inner contours. Returns a compound of the wires, the outline
+    is the first one.
+    """
+    index = VertexIndex(4)
+    edges = {}  # (vertex ids, id of the center) -> edge
+    for face in theFaceList:
+        for edge in face.Edges:
+            ids = sorted(index.add(vert.Point) for vert in edge.Vertexes)
+            key = (tuple(ids), index.add(edge.CenterOfMass))
+            if key in edges:
+                del edges[key]  # edge between two faces
+            else:
+                edges[key] = edge
+    wires = [Part.Wire(group) for group in Part.sortEdges(list(edges.values()))]
+    wires.sort(key=lambda wire: wire.BoundBox.DiagonalLength, reverse=True)
+    return Part.Compound(wires)
+
+
+def getUnfold(
+    k_factor_lookup,
+    solid,
+    subelement,
+    facename,
+    kFactorStandard="ansi",
+    flatPatternOnly=False,
+    treeStore=None,
+):
+    # treeStore: dictionary of the caller, which keeps the analyzed trees of
+    # the unfolds, (document name, object name) -> (shape key, SheetTree).
+    # An unchanged shape is unfolded again from its stored tree, see
+    # getReunfold. None: no trees are kept.
+    normalVect = None
+    theName = None
+    faceSel = ""
+    ob_Name = solid.Name
+    err_code = 0
+
+    normalVect = subelement.normalAt(0, 0)
+    FreeCAD.Console.PrintLog(f"name: {facename}\n ")
+    f_number = int(facename.lstrip("Face")) - 1
+
+    refine = getattr(solid, "Refine", False) is True
+
+    # an unchanged shape was unfolded before with the same settings
+    cache = SheetMetalUnfoldCache.getUnfoldCache()
+    shapeKey = None
+    if cache is not None or treeStore is not None:
+        shapeKey = SheetMetalUnfoldCache.shapeKey(solid.Shape, refine)
+    cacheKey = None
+    if cache is not None:
+        cacheKey = cache.key(
+            solid.Shape,
+            f_number,
+            k_factor_lookup,
+            kFactorStandard,
+            refine,
+            shapeKey,
+            flatPatternOnly,
+        )
+        cached = cache.get(cacheKey)
+        if cached is not None:
+            FreeCAD.Console.PrintLog("Unfold taken from the cache\n")
+            resPart, folds = cached
+            return resPart, folds, normalVect, theName, err_code, faceSel, ob_Name
+
+    # the same shape was analyzed before, only the K-factors or the
+    # stationary face have changed
+    treeKey = (solid.Document.Name, solid.Name)
+    stored = None
+    if treeStore is not None:
+        stored = treeStore.get(treeKey)
+    rootNode = None
+    if stored is not None and stored[0] == shapeKey:
+        rootNode = stored[1].node_by_face.get(f_number)
+        if rootNode is not None and (
+            rootNode.idx != f_number or rootNode.node_type != "Flat"
+        ):
+            rootNode = None  # not a top face of the analyzed tree
+    if rootNode is not None:
+        FreeCAD.Console.PrintLog("Unfold of the stored analyzed tree\n")
+        stored[1].reroot(rootNode)
+        resPart, folds, TheTree = getReunfold(
+            stored[1], k_factor_lookup, kFactorStandard, flatPatternOnly
+        )
+    else:
+        resPart, folds, TheTree = getUnfoldFromShape(
+            solid.Shape,
+            f_number,
+            k_factor_lookup,
+            kFactorStandard,
+            refine,
+            flatPatternOnly=flatPatternOnly,
+        )
+    if treeStore is not None:
+        if TheTree.error_code is None:
+            treeStore[treeKey] = (shapeKey, TheTree)
+        else:
+            treeStore.pop(treeKey, None)  # analyze the shape again next time
+    if cacheKey is not None and resPart is not None:
+        cache.put(cacheKey, resPart, folds)
 
     if TheTree.error_code is not None:
         if TheTree.error_code == 1:
@@ -3056,8 +3873,6 @@ def getUnfold(k_factor_lookup, solid, subelement, facename):
     else:
         FreeCAD.Console.PrintLog("Unfold successful\n")
 
-    endzeit = time.process_time()
-    # FreeCAD.Console.PrintMessage("Analytical time: " + str(endzeit - startzeit) + "\n")
     return resPart, folds, normalVect, theName, err_code, faceSel, ob_Name
 
 
@@ -3074,13 +3889,19 @@ def SMGetGeoSegment(e):
     return None
 
 
-def SMmakeSketchfromEdges(edges, name):
+def SMGetSketchGeometry(edges, approximate=True):
+    # Sketch geometry of the edges. With approximate=False, B-splines are
+    # kept, else they are replaced by arcs.
     precision = 0.1  # precision in Bspline to BiArcs
     quasidef = 0.01  # quasi deflection for Ellipses and Parabola
-    usk = FreeCAD.activeDocument().addObject("Sketcher::SketchObject", name)
     geo = []
     for e in edges:
-        if isinstance(e.Curve, Part.BSplineCurve):
+        if isinstance(e.Curve, Part.BSplineCurve) and not approximate:
+            curve = e.Curve.copy()
+            if not e.Closed:
+                curve.segment(e.FirstParameter, e.LastParameter)
+            geo.append(curve)
+        elif isinstance(e.Curve, Part.BSplineCurve):
             arcs = e.Curve.toBiArcs(precision)
             for i in arcs:
                 eb = Part.Edge(i)
@@ -3098,10 +3919,101 @@ def SMmakeSketchfromEdges(edges, name):
             seg = SMGetGeoSegment(e)
             if seg is not None:
                 geo.append(seg)
-    usk.addGeometry(geo)
+    return geo
+
+
+def SMmakeSketchfromEdges(edges, name):
+    usk = FreeCAD.activeDocument().addObject("Sketcher::SketchObject", name)
+    usk.addGeometry(SMGetSketchGeometry(edges))
+    return usk
+
+
+def SMmakeSketchBulk(edges, name, coincident=True):
+    """Makes a sketch of the edges with a single addGeometry call, without
+    the constraints of Draft.makeSketch and without solving them.
+    coincident: constrain the end points shared by the edges coincident,
+    the shared points are found with a VertexIndex.
+    """
+    import Sketcher
+
+    usk = FreeCAD.activeDocument().addObject("Sketcher::SketchObject", name)
+    usk.addGeometry(SMGetSketchGeometry(edges, approximate=False))
+    if not coincident:
+        return usk
+
+    index = VertexIndex()
+    firstPoints = {}  # vertex id -> (geometry index, point position)
+    constraints = []
+    bounded = (Part.LineSegment, Part.ArcOfCircle, Part.BSplineCurve)
+    for geoIdx, geo in enumerate(usk.Geometry):
+        if not isinstance(geo, bounded):
+            continue
+        ids = [index.add(geo.StartPoint), index.add(geo.EndPoint)]
+        if ids[0] == ids[1]:
+            continue  # closed curve
+        for pos, vid in ((1, ids[0]), (2, ids[1])):
+            first = firstPoints.setdefault(vid, (geoIdx, pos))
+            if first != (geoIdx, pos):
+                constraints.append(
+                    Sketcher.Constraint("Coincident", first[0], first[1], geoIdx, pos)
+                )
+    if constraints:
+        usk.addConstraint(constraints)
     return usk
 
 
+def projectionPlacement(norm):
+    # Placement, which moves the plane with the normal norm into the XY
+    # plane like the projection of projectEx. The X direction is the one
+    # OCC chooses for a gp_Ax2 with the main direction norm.
+    a, b, c = norm.x, norm.y, norm.z
+    if abs(b) <= abs(a) and abs(b) <= abs(c):
+        xDir = Base.Vector(-c, 0.0, a) if abs(a) > abs(c) else Base.Vector(c, 0.0, -a)
+    elif abs(a) <= abs(b) and abs(a) <= abs(c):
+        xDir = Base.Vector(0.0, -c, b) if abs(b) > abs(c) else Base.Vector(0.0, c, -b)
+    else:
+        xDir = Base.Vector(-b, a, 0.0) if abs(a) > abs(b) else Base.Vector(b, -a, 0.0)
+    xDir.normalize()
+    zDir = Base.Vector(norm).normalize()
+    rot = Base.Rotation(xDir, zDir.cross(xDir), zDir, "ZXY")
+    return Base.Placement(Base.Vector(), rot).inverse()
+
+
+def getFlatPatternEdges(shape, norm, tol=1e-5):
+    """Returns a copy of a planar shape perpendicular to norm, moved into
+    the XY plane like the result of projectEx(shape, norm). Returns None,
+    if the shape is not planar or not perpendicular to norm, then it needs
+    the projection.
+    """
+    flat = shape.copy()
+    flat.Placement = projectionPlacement(norm).multiply(flat.Placement)
+    if not flat.Vertexes or flat.BoundBox.ZLength > tol:
+        return None
+    flat.translate(Base.Vector(0.0, 0.0, -flat.Vertexes[0].Point.z))
+    return flat
+
+
+def splitOutlineEdges(shape):
+    """Splits the edges of a flat pattern into the outline and the internal
+    edges. shape is the unfolded face, the compound of the flat pattern
+    wires or a compound of projected edges. The outline is the outer wire
+    of the face, else the edge group with the biggest bounding box.
+    Returns (outline edges, internal edges).
+    """
+    if len(shape.Faces) == 1:
+        outline = shape.Faces[0].OuterWire.Edges
+    else:
+        groups = [wire.Edges for wire in shape.Wires]
+        if not groups:
+            groups = Part.sortEdges(shape.Edges)
+        outline = max(
+            groups, key=lambda group: Part.Compound(group).BoundBox.DiagonalLength
+        )
+    outlineHashes = {edge.hashCode() for edge in outline}
+    internal = [edge for edge in shape.Edges if edge.hashCode() not in outlineHashes]
+    return outline, internal
+
+
 def processUnfold(
     k_factor_lookup,
     object,
@@ -3114,19 +4026,33 @@ def processUnfold(
     internalSketchColor="#ff5733",
     transparency=0.7,
     kFactorStandard="ansi",
+    flatPatternOnly=False,
+    sketchMode="draft",
+    treeStore=None,
 ):
-    global KFACTORSTANDARD
-    KFACTORSTANDARD = kFactorStandard
-
+    # flatPatternOnly: the unfold object gets the wires of the flat pattern
+    # in the plane of the reference face, no solid, see makeFlatPattern
+    # sketchMode: constraints of the sketches, one of SKETCH_MODES
+    # treeStore: the analyzed trees of former unfolds, see getUnfold
+    # The last element of the result is the flat pattern of the sketches in
+    # the XY plane, (outline and cutouts, fold lines or None), see
+    # SheetMetalExporter.exportFlatPatternDxf.
     unfoldShape = None
     unfold_sketch = None
     unfold_sketch_outline = None
     unfold_sketch_bend = None
     unfold_sketch_internal = None
+    flat_pattern = None
 
     try:
         shape, foldComp, norm, thename, err_cd, fSel, obN = getUnfold(
-            k_factor_lookup, object, referenceFace, faceName
+            k_factor_lookup,
+            object,
+            referenceFace,
+            faceName,
+            kFactorStandard,
+            flatPatternOnly,
+            treeStore,
         )
         foldLines = foldComp.Edges
     except Exception as e:
@@ -3148,68 +4074,46 @@ def processUnfold(
     if genSketch:
         # locate the projection face
         unfoldobj = shape
-        for face in shape.Faces:
-            fnorm = face.normalAt(0, 0)
-            isSameDir = abs(fnorm.dot(norm) - 1.0) < 0.00001
-            if isSameDir:
-                unfoldobj = face
-                break
+        if not flatPatternOnly:
+            for face in shape.Faces:
+                fnorm = face.normalAt(0, 0)
+                isSameDir = abs(fnorm.dot(norm) - 1.0) < 0.00001
+                if isSameDir:
+                    unfoldobj = face
+                    break
+        # Planar shapes are moved into the projection plane, only the
+        # others need the hidden line removal of projectEx.
         edges = []
-        perimEdges = projectEx(unfoldobj, norm)[0]
+        perimEdges = getFlatPatternEdges(unfoldobj, norm)
+        if perimEdges is None:
+            perimEdges = projectEx(unfoldobj, norm)[0]
         edges.append(perimEdges)
+        foldEdges = None
         if len(foldLines) > 0:
             co = Part.makeCompound(foldLines)
-            foldEdges = projectEx(co, norm)[0]
+            foldEdges = getFlatPatternEdges(co, norm)
+            if foldEdges is None:
+                foldEdges = projectEx(co, norm)[0]
 
             if not splitSketches:
                 edges.append(foldEdges)
-        unfold_sketch = generateSketch(edges, "Unfold_Sketch", sketchColor)
+        flat_pattern = (perimEdges, foldEdges)
+        unfold_sketch = generateSketch(edges, "Unfold_Sketch", sketchColor, sketchMode)
         FreeCAD.ActiveDocument.recompute()
 
         if splitSketches:
-            tidy = False
             try:
-                newface = Part.makeFace(unfold_sketch.Shape, "Part::FaceMakerBullseye")
-
-                try:
-                    owEdgs = newface.OuterWire.Edges
-                    faceEdgs = newface.Edges
-                except:
-                    exc_type, exc_obj, exc_tb = sys.exc_info()
-                    SMLogger.error(
-                        FreeCAD.Qt.translate(
-                            "Logger",
-                            "Exception at line {}"
-                            ": Outline Sketch failed, re-trying after tidying up",
-                        ).format(str(exc_tb.tb_lineno))
-                    )
-                    tidy = True
-                    owEdgs = unfold_sketch.Shape.Edges
-                    faceEdgs = unfold_sketch.Shape.Edges
-                    FreeCAD.ActiveDocument.recompute()
-
+                # the outline is known from the wires of the unfolded face
+                owEdgs, intEdgs = splitOutlineEdges(perimEdges)
                 unfold_sketch_outline = generateSketch(
-                    owEdgs, "Unfold_Sketch_Outline", sketchColor
+                    owEdgs, "Unfold_Sketch_Outline", sketchColor, sketchMode
                 )
-
-                if tidy:
-                    SMLogger.error(
-                        FreeCAD.Qt.translate(
-                            "Logger", "tidying up Unfold_Sketch_Outline"
-                        )
-                    )
-                intEdgs = []
-                idx = []
-                for i, e in enumerate(faceEdgs):
-                    for oe in owEdgs:
-                        if oe.hashCode() == e.hashCode():
-                            idx.append(i)
-                for i, e in enumerate(faceEdgs):
-                    if i not in idx:
-                        intEdgs.append(e)
                 if len(intEdgs) > 0:
                     unfold_sketch_internal = generateSketch(
-                        intEdgs, "Unfold_Sketch_Internal", internalSketchColor
+                        intEdgs,
+                        "Unfold_Sketch_Internal",
+                        internalSketchColor,
+                        sketchMode,
                     )
 
             except Exception as e:
@@ -3224,7 +4128,7 @@ def processUnfold(
 
         if len(foldLines) > 0 and splitSketches:
             unfold_sketch_bend = generateSketch(
-                foldEdges, "Unfold_Sketch_bends", bendSketchColor
+                foldEdges, "Unfold_Sketch_bends", bendSketchColor, sketchMode
             )
 
     if FreeCAD.GuiUp:
@@ -3236,22 +4140,36 @@ def processUnfold(
         unfold_sketch_outline,
         unfold_sketch_bend,
         unfold_sketch_internal,
+        flat_pattern,
     )
 
 
-def generateSketch(edges, name, color):
+# Constraints of the unfold sketches: "draft" for the constraints of
+# Draft.makeSketch, "coincident" for coincident end points only, "none".
+# The index is the preference UnfoldSketchConstraints.
+SKETCH_MODES = ("draft", "coincident", "none")
+
+
+def generateSketch(edges, name, color, mode="draft"):
+    # mode: one of SKETCH_MODES
     p = Part.makeCompound(edges)
-    try:
-        sk = Draft.makeSketch(
-            p.Edges, autoconstraints=True, addTo=None, delete=False, name=name
-        )
+    if mode in ("coincident", "none"):
+        sk = SMmakeSketchBulk(p.Edges, name, mode == "coincident")
         sk.Label = name
-    except:
-        doc = FreeCAD.ActiveDocument
-        skb = doc.ActiveObject
-        doc.removeObject(skb.Name)
-        SMLogger.warning(FreeCAD.Qt.translate("Logger", "discretizing Sketch"))
-        sk = SMmakeSketchfromEdges(p.Edges, name)
+    else:
+        import Draft
+
+        try:
+            sk = Draft.makeSketch(
+                p.Edges, autoconstraints=True, addTo=None, delete=False, name=name
+            )
+            sk.Label = name
+        except:
+            doc = FreeCAD.ActiveDocument
+            skb = doc.ActiveObject
+            doc.removeObject(skb.Name)
+            SMLogger.warning(FreeCAD.Qt.translate("Logger", "discretizing Sketch"))
+            sk = SMmakeSketchfromEdges(p.Edges, name)
 
     if FreeCAD.GuiUp:
         rgb_color = tuple(float(int(color[i : i + 2], 16)) for i in (1, 3, 5))
@@ -23,5 +23,7 @@
 
 import TestApp
 
+from Tests.testExporter import TestExporter
 from Tests.testFolder import TestFolder
 from Tests.testKfactor import TestKFactor
+from Tests.testUnfolder import TestUnfolder
@@ -0,0 +1,134 @@
+# #######################################################################
+#
+#  Copyright (c) 2023 Ondsel Inc.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+# #######################################################################
+
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+import Part
+from FreeCAD import Vector
+import SheetMetalExporter
+
+
+def make_plate():
+    # 40 x 20 plate with a round hole and a slot with round ends
+    v = Vector
+    plate = Part.makePlane(40, 20)
+    hole = Part.Face(Part.Wire(Part.makeCircle(2, v(10, 10, 0))))
+    slot = Part.Face(
+        Part.Wire(
+            [
+                Part.makeLine(v(25, 8, 0), v(30, 8, 0)),
+                Part.Arc(v(30, 8, 0), v(32, 10, 0), v(30, 12, 0)).toShape(),
+                Part.makeLine(v(30, 12, 0), v(25, 12, 0)),
+                Part.Arc(v(25, 12, 0), v(23, 10, 0), v(25, 8, 0)).toShape(),
+            ]
+        )
+    )
+    return plate.cut(hole).cut(slot).Faces[0]
+
+
+def make_perforated_plate():
+    # 40 x 20 plate with three equal square holes and a round hole
+    face = Part.makePlane(40, 20)
+    for x in (5, 15, 25):
+        face = face.cut(Part.makePlane(4, 4, Vector(x, 8, 0)))
+    hole = Part.Face(Part.Wire(Part.makeCircle(2, Vector(35, 10, 0))))
+    return face.cut(hole).Faces[0]
+
+
+def read_entities(filename):
+    # list of (entity type, {group code: [values]}) of the ENTITIES section
+    with open(filename) as f:
+        lines = [line.strip() for line in f]
+    pairs = list(zip(lines[0::2], lines[1::2]))
+    start = pairs.index(("2", "ENTITIES"))
+    entities = []
+    for code, value in pairs[start + 1 :]:
+        if code == "0":
+            entities.append((value, {}))
+        else:
+            entities[-1][1].setdefault(int(code), []).append(value)
+    return entities
+
+
+class TestExporter(unittest.TestCase):
+    def test_dxf_layers(self):
+        face = make_plate()
+        folds = Part.Compound([Part.makeLine(Vector(15, 0, 0), Vector(15, 20, 0))])
+        with tempfile.TemporaryDirectory() as tempDir:
+            filename = os.path.join(tempDir, "plate.dxf")
+            SheetMetalExporter.exportFlatPatternDxf(filename, face, folds)
+            entities = read_entities(filename)
+        types = [(name, groups.get(8, [None])[0]) for name, groups in entities]
+        self.assertEqual(types.count(("POLYLINE", "Outline")), 1)
+        self.assertEqual(types.count(("POLYLINE", "Internal")), 1)
+        self.assertEqual(types.count(("CIRCLE", "Internal")), 1)
+        self.assertEqual(types.count(("LINE", "Bend")), 1)
+        self.assertEqual(entities[-1][0], "EOF")
+
+        # the round ends of the slot are half circles with a bulge of 1
+        start = types.index(("POLYLINE", "Internal"))
+        bulges = []
+        for name, groups in entities[start + 1 :]:
+            if name != "VERTEX":
+                break
+            bulges.append(abs(float(groups.get(42, ["0"])[0])))
+        self.assertEqual(len(bulges), 4)
+        self.assertEqual(sorted(round(b, 6) for b in bulges), [0, 0, 1, 1])
+
+    def test_oriented_edges(self):
+        v = Vector
+        chain = [
+            Part.makeLine(v(1, 0, 0), v(0, 0, 0)),
+            Part.makeLine(v(1, 0, 0), v(1, 1, 0)),
+            Part.makeLine(v(0, 1, 0), v(1, 1, 0)),
+        ]
+        reversed_ = [r for edge, r in SheetMetalExporter.orientedEdges(chain)]
+        self.assertEqual(reversed_, [True, False, True])
+
+    def test_cutout_groups(self):
+        face = make_perforated_plate()
+        chains = SheetMetalExporter.cutoutChains(face)
+        chainGroups, corners = SheetMetalExporter.groupCutouts(chains)
+        self.assertEqual(len(chainGroups), 4)
+        self.assertEqual(sorted(len(group) for group in corners), [1, 3])
+        squares = [group for group in corners if len(group) == 3][0]
+        self.assertEqual(sorted(round(x, 6) for x, y in squares), [5, 15, 25])
+
+        with tempfile.TemporaryDirectory() as tempDir:
+            filename = os.path.join(tempDir, "plate.dxf")
+            SheetMetalExporter.exportFlatPatternDxf(filename, face)
+            with open(filename) as f:
+                lines = [line.strip() for line in f]
+            filename = os.path.join(tempDir, "plate.svg")
+            SheetMetalExporter.exportFlatPatternSvg(filename, face)
+            root = ET.parse(filename).getroot()
+        pairs = list(zip(lines[0::2], lines[1::2]))
+        self.assertEqual(pairs.count(("0", "BLOCK")), 1)
+        self.assertEqual(pairs.count(("0", "INSERT")), 3)
+        self.assertEqual(pairs.count(("0", "CIRCLE")), 1)
+
+        ns = "{http://www.w3.org/2000/svg}"
+        self.assertEqual(len(root.findall(".//" + ns + "defs/" + ns + "path")), 1)
+        self.assertEqual(len(root.findall(".//" + ns + "use")), 3)
+        self.assertEqual(len(root.findall(".//" + ns + "circle")), 1)
@@ -0,0 +1,360 @@
+# #######################################################################
+#
+#  Copyright (c) 2023 Ondsel Inc.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+# #######################################################################
+
+import math
+import os
+import tempfile
+import unittest
+import Part
+from FreeCAD import Vector
+from SheetMetalUnfoldCache import UnfoldCache
+import SheetMetalUnfolder as smu
+from SheetMetalLogger import TreeException
+from SheetMetalUnfolder import (
+    Simple_node,
+    SurfaceTable,
+    UnfoldContext,
+    VertexIndex,
+    equal_vector,
+    unbend_points,
+)
+
+
+def make_l_bracket():
+    # 1 mm sheet with a 90 degree bend of inner radius 1 mm, the bend axis
+    # is at (0, 2) parallel to z
+    v = Vector
+    r_out = 2.0 ** 0.5
+    r_in = 0.5 ** 0.5
+    edges = [
+        Part.makeLine(v(-10, 0, 0), v(0, 0, 0)),
+        Part.Arc(v(0, 0, 0), v(r_out, 2 - r_out, 0), v(2, 2, 0)).toShape(),
+        Part.makeLine(v(2, 2, 0), v(2, 12, 0)),
+        Part.makeLine(v(2, 12, 0), v(1, 12, 0)),
+        Part.makeLine(v(1, 12, 0), v(1, 2, 0)),
+        Part.Arc(v(1, 2, 0), v(r_in, 2 - r_in, 0), v(0, 1, 0)).toShape(),
+        Part.makeLine(v(0, 1, 0), v(-10, 1, 0)),
+        Part.makeLine(v(-10, 1, 0), v(-10, 0, 0)),
+    ]
+    return Part.Face(Part.Wire(edges)).extrude(v(0, 0, 10))
+
+
+def face_index_at(shape, point):
+    probe = Part.Vertex(point)
+    for idx, face in enumerate(shape.Faces):
+        if face.distToShape(probe)[0] < 1e-7:
+            return idx
+    return None
+
+
+class TestUnfolder(unittest.TestCase):
+    def test_vertex_index(self):
+        index = VertexIndex()
+        points = [
+            Vector(0.0, 0.0, 0.0),
+            Vector(10.0, 0.0, 0.0),
+            Vector(10.0, 2.0, -3.5),
+            Vector(-7.25, 4.5, 1.0),
+        ]
+        ids = [index.add(p) for p in points]
+        self.assertEqual(ids, [0, 1, 2, 3])
+
+        # coincident points get the id of the known point, also if they
+        # are in a neighbor cell of the grid
+        for vid, p in enumerate(points):
+            for d in (-0.000002, 0.000002):
+                q = Vector(p.x + d, p.y - d, p.z + d)
+                self.assertTrue(equal_vector(p, q))
+                self.assertEqual(index.find(q), vid)
+                self.assertEqual(index.add(q), vid)
+        self.assertEqual(len(index.points), len(points))
+
+        # points outside of the tolerance are not found
+        self.assertIsNone(index.find(Vector(0.0, 0.0001, 0.0)))
+        self.assertIsNone(index.find(Vector(5.0, 0.0, 0.0)))
+
+    def test_node_vertex_dict(self):
+        node = Simple_node(0)
+        node.addVertex(0, "tp0", Vector(0, 0, 0), Vector(0, 0, 0))
+        node.addVertex(1, "o", Vector(0, 1, 0), None)
+        self.assertEqual(node.findVertex(Vector(0.000001, 1, 0)), 1)
+        self.assertIsNone(node.findVertex(Vector(1, 1, 0)))
+        node.removeVertex(1)
+        self.assertIsNone(node.findVertex(Vector(0, 1, 0)))
+        # a key used again for another point does not find the removed point
+        node.addVertex(1, "", Vector(5, 0, 0), Vector(5, 0, 0))
+        self.assertIsNone(node.findVertex(Vector(0, 1, 0)))
+        self.assertEqual(node.findVertex(Vector(5, 0, 0)), 1)
+
+    def test_k_factor_context(self):
+        lookup = {1: 0.4, 3: 0.5}
+        nodes = []
+        for standard in ("ansi", "din"):
+            node = Simple_node(0, context=UnfoldContext(lookup, standard))
+            node.innerRadius = 2.0
+            node.thickness = 1.0
+            nodes.append(node)
+        # each node uses the standard of its own context
+        self.assertAlmostEqual(nodes[0].k_Factor, 0.5)
+        self.assertAlmostEqual(nodes[1].k_Factor, 0.25)
+
+    def test_unbend_points(self):
+        # points on a cylinder of radius 2 around the z axis are moved back
+        # to the angle 0 and along the tangent by transRad * angle
+        angles = [0.0, 0.5, 1.5, 3.0]
+        points = [Vector(2 * math.cos(a), 2 * math.sin(a), 0.5 * a) for a in angles]
+        result = unbend_points(
+            points,
+            Vector(0, 0, 0),
+            Vector(0, 0, 1),
+            Vector(1, 0, 0),
+            Vector(0, 1, 0),
+            1.5,
+        )
+        self.assertEqual(result.shape, (4, 3))
+        for a, p in zip(angles, result):
+            self.assertTrue(equal_vector(Vector(*p), Vector(2, 1.5 * a, 0.5 * a)))
+        # below the wrap angle, the angle is counted from the other side
+        p = unbend_points(
+            [Vector(2 * math.cos(-0.5), 2 * math.sin(-0.5), 0)],
+            Vector(0, 0, 0),
+            Vector(0, 0, 1),
+            Vector(1, 0, 0),
+            Vector(0, 1, 0),
+            1.0,
+            wrapAngle=0.0,
+        )[0]
+        self.assertAlmostEqual(p[1], 2 * math.pi - 0.5)
+
+    def test_unfold_cache(self):
+        cache = UnfoldCache(maxEntries=2)
+        box = Part.makeBox(10, 20, 1)
+        keys = [
+            cache.key(box, i, {1: 0.4}, "ansi", False) for i in range(3)
+        ]
+        self.assertEqual(keys[0], cache.key(box, 0, {1: 0.4}, "ansi", False))
+        self.assertNotEqual(keys[0], cache.key(box, 0, {1: 0.4}, "din", False))
+        self.assertNotEqual(keys[0], cache.key(box, 0, {1: 0.5}, "ansi", False))
+        self.assertNotEqual(
+            keys[0], cache.key(box, 0, {1: 0.4}, "ansi", False, None, True)
+        )
+
+        for key in keys:
+            cache.put(key, box, Part.Compound([]))
+        # the oldest entry is evicted
+        self.assertIsNone(cache.get(keys[0]))
+        flat, folds = cache.get(keys[2])
+        self.assertAlmostEqual(flat.Volume, box.Volume)
+
+        # the disk cache removes both files of the oldest entry
+        with tempfile.TemporaryDirectory() as tempDir:
+            cache = UnfoldCache(maxEntries=0, diskDir=tempDir)
+            cache.put(keys[0], box, Part.Compound([]))
+            cache.maxDiskSize = sum(
+                os.path.getsize(os.path.join(tempDir, name))
+                for name in os.listdir(tempDir)
+            )
+            for name in os.listdir(tempDir):
+                os.utime(os.path.join(tempDir, name), (0, 0))  # the oldest
+            cache.put(keys[1], box, Part.Compound([]))
+            names = sorted(os.listdir(tempDir))
+            self.assertEqual(names, [keys[1] + ".flat.brep", keys[1] + ".folds.brep"])
+
+    def test_reroot(self):
+        shape = make_l_bracket()
+        face_a = face_index_at(shape, Vector(-5, 1, 5))
+        face_b = face_index_at(shape, Vector(1, 7, 5))
+        flat, folds, tree = smu.getUnfoldFromShape(shape, face_a, {1: 0.5})
+        self.assertIsNotNone(flat)
+
+        # unfold the analyzed tree with the other flange as stationary face
+        tree.reroot(tree.node_by_face[face_b])
+        self.assertEqual(tree.root.idx, face_b)
+        faces, foldLines = tree.unfold_tree2(tree.root)
+        self.assertIsNone(tree.error_code)
+        rerooted = smu.makeUnfoldResult(faces)
+        self.assertAlmostEqual(rerooted.Volume, flat.Volume, places=3)
+        self.assertAlmostEqual(rerooted.Area, flat.Area, places=3)
+        # the other flange stays in place
+        self.assertIsNotNone(face_index_at(rerooted, Vector(1, 7, 5)))
+
+        # the error of a failed unfold does not stick to the tree
+        tree.error_code = 13
+        tree.reroot(tree.node_by_face[face_a])
+        faces, foldLines = tree.reunfold({1: 0.5})
+        self.assertIsNone(tree.error_code)
+        self.assertTrue(faces)
+
+        best, folds, tree = smu.getBestUnfold(shape, face_a, {1: 0.5})
+        self.assertAlmostEqual(best.Volume, flat.Volume, places=3)
+
+    def test_plane_thickness(self):
+        shape = make_l_bracket()
+        face_a = face_index_at(shape, Vector(-5, 1, 5))
+        face_b = face_index_at(shape, Vector(1, 7, 5))
+        tree = smu.SheetTree(shape, face_a, {1: 0.5})
+        self.assertIsNone(tree.error_code)
+        # the counter face is found without the boolean probe
+        thickness = tree.plane_thickness(face_a, Vector(-5, 1, 5), 1.0)
+        self.assertAlmostEqual(thickness, 1.0)
+        thickness = tree.plane_thickness(face_b, Vector(1, 7, 5), 1.0)
+        self.assertAlmostEqual(thickness, 1.0)
+        # the bend face has no parallel planar face
+        face_bend = face_index_at(shape, Vector(0.5**0.5, 2 - 0.5**0.5, 5))
+        self.assertIsNone(tree.plane_thickness(face_bend, Vector(0, 0, 5), 1.0))
+
+    def test_counter_faces(self):
+        shape = make_l_bracket()
+        face_a = face_index_at(shape, Vector(-5, 1, 5))
+        tree = smu.SheetTree(shape, face_a, {1: 0.5})
+        counter_a = face_index_at(shape, Vector(-5, 0, 5))
+        self.assertEqual(tree.counter_faces[face_a], [counter_a])
+        self.assertEqual(tree.counter_faces[counter_a], [face_a])
+        # the inner and the outer bend face share the axis
+        inner = face_index_at(shape, Vector(0.5**0.5, 2 - 0.5**0.5, 5))
+        outer = face_index_at(shape, Vector(2.0**0.5, 2 - 2.0**0.5, 5))
+        self.assertEqual(tree.counter_faces[inner], [outer])
+        self.assertEqual(tree.counter_faces[outer], [inner])
+        # the end faces of the flanges have no counter face
+        end = face_index_at(shape, Vector(-10, 0.5, 5))
+        self.assertEqual(tree.counter_faces[end], [])
+
+        # faces without pairing, like B-spline surfaces, are found by the
+        # scan of all remaining faces
+        tree.counter_faces = {}
+        tree.Bend_analysis(face_a, None)
+        self.assertIsNone(tree.error_code)
+        self.assertEqual(tree.root.c_face_idx, counter_a)
+
+    def test_surface_table(self):
+        shape = make_l_bracket()
+        table = SurfaceTable(shape.Faces)
+        face_a = face_index_at(shape, Vector(-5, 1, 5))
+        self.assertEqual(table.kinds[face_a], SurfaceTable.PLANE)
+        # the outer normal of the face
+        self.assertTrue(equal_vector(table.axis(face_a), Vector(0, 1, 0)))
+        self.assertAlmostEqual(table.area(face_a), 100.0)
+
+        inner = face_index_at(shape, Vector(0.5**0.5, 2 - 0.5**0.5, 5))
+        outer = face_index_at(shape, Vector(2.0**0.5, 2 - 2.0**0.5, 5))
+        for idx, radius in ((inner, 1.0), (outer, 2.0)):
+            self.assertEqual(table.kinds[idx], SurfaceTable.CYLINDER)
+            self.assertAlmostEqual(table.radii[idx], radius)
+            self.assertAlmostEqual(abs(table.directions[idx][2]), 1.0)
+            self.assertAlmostEqual(table.centers[idx][0], 0.0)
+            self.assertAlmostEqual(table.centers[idx][1], 2.0)
+            u0, u1 = table.par_ranges[idx][:2]
+            self.assertAlmostEqual(abs(u1 - u0), math.pi / 2)
+
+    def test_fold_lines(self):
+        shape = make_l_bracket()
+        face_a = face_index_at(shape, Vector(-5, 1, 5))
+        inner = face_index_at(shape, Vector(0.5**0.5, 2 - 0.5**0.5, 5))
+        flat, folds, tree = smu.getUnfoldFromShape(shape, face_a, {1: 0.5})
+        # the fold line of the untrimmed bend is made without slicing
+        self.assertTrue(tree.isUntrimmedBend(inner))
+        self.assertEqual(len(folds.Edges), 1)
+        self.assertAlmostEqual(folds.Edges[0].Length, 10.0)
+        self.assertAlmostEqual(abs(folds.Edges[0].tangentAt(0).z), 1.0)
+
+    def test_release(self):
+        shape = make_l_bracket()
+        face_a = face_index_at(shape, Vector(-5, 1, 5))
+        flat, folds, tree = smu.getUnfoldFromShape(shape, face_a, {1: 0.5})
+        released, releasedFolds, tree = smu.getUnfoldFromShape(
+            shape, face_a, {1: 0.5}, release=True
+        )
+        self.assertAlmostEqual(released.Volume, flat.Volume, places=3)
+        # the tree holds no faces of the shape anymore
+        self.assertTrue(tree.released)
+        self.assertEqual(tree.f_list, [])
+        self.assertEqual(tree.edge_faces, {})
+        self.assertRaises(TreeException, tree.reunfold, {1: 0.4})
+
+    def test_flat_pattern_only(self):
+        shape = make_l_bracket()
+        face_a = face_index_at(shape, Vector(-5, 1, 5))
+        flat, folds, tree = smu.getUnfoldFromShape(shape, face_a, {1: 0.5})
+        pattern, patternFolds, tree = smu.getUnfoldFromShape(
+            shape, face_a, {1: 0.5}, flatPatternOnly=True
+        )
+        self.assertIsNotNone(pattern)
+        self.assertEqual(len(pattern.Solids), 0)
+        # one outline, the edge between the flange and the bend is dropped
+        self.assertEqual(len(pattern.Wires), 1)
+        self.assertTrue(pattern.Wires[0].isClosed())
+        # the sheet is 1 mm thick
+        area = Part.Face(pattern.Wires[0]).Area
+        self.assertAlmostEqual(area, flat.Volume, places=3)
+        self.assertEqual(len(patternFolds.Edges), len(folds.Edges))
+
+    def test_flat_pattern_edges(self):
+        face = Part.makePlane(10, 20, Vector(1, 2, 5))
+        flat = smu.getFlatPatternEdges(face, Vector(0, 0, 1))
+        box = flat.BoundBox
+        self.assertAlmostEqual(box.ZMax, 0.0)
+        self.assertAlmostEqual(box.XMin, 1.0)
+        self.assertAlmostEqual(box.YMax, 22.0)
+        # a face tilted to the x-axis is moved into the XY plane
+        norm = Vector(1, 0, 1).normalize()
+        face.rotate(Vector(0, 0, 0), Vector(0, 1, 0), 45)
+        flat = smu.getFlatPatternEdges(face, norm)
+        self.assertAlmostEqual(flat.BoundBox.ZLength, 0.0)
+        self.assertAlmostEqual(flat.Area, 200.0)
+        # a solid needs the projection
+        self.assertIsNone(smu.getFlatPatternEdges(Part.makeBox(1, 1, 1), norm))
+
+    def test_split_outline_edges(self):
+        plate = Part.makePlane(10, 10)
+        hole = Part.Face(Part.Wire(Part.makeCircle(2, Vector(5, 5, 0))))
+        face = plate.cut(hole).Faces[0]
+        outline, internal = smu.splitOutlineEdges(face)
+        self.assertEqual(len(outline), 4)
+        self.assertEqual(len(internal), 1)
+        self.assertAlmostEqual(internal[0].Length, 4 * math.pi)
+        # loose edges are grouped, the biggest group is the outline
+        loose = Part.Compound(face.Edges)
+        outline, internal = smu.splitOutlineEdges(loose)
+        self.assertEqual(len(outline), 4)
+        self.assertEqual(len(internal), 1)
+
+    def test_sort_edges_tolerant(self):
+        shape = make_l_bracket()
+        tree = smu.SheetTree(shape, face_index_at(shape, Vector(-5, 1, 5)), {1: 0.5})
+        v = Vector
+        edges = [
+            Part.makeLine(v(0, 0, 0), v(1, 0, 0)),
+            Part.makeLine(v(1, 1, 0), v(0, 1, 0)),
+            Part.makeLine(v(1, 0, 0), v(1, 1, 0)),
+            Part.makeLine(v(0, 1, 0), v(0, 0, 0)),
+        ]
+        self.assertEqual(tree.sortEdgesTolerant(edges), ([0, 2, 1, 3], True))
+        self.assertIsNone(tree.error_code)
+
+        # a gap stops the sorting with an error instead of looping
+        edges[3] = Part.makeLine(v(5, 5, 0), v(6, 6, 0))
+        self.assertEqual(tree.sortEdgesTolerant(edges), ([0, 2, 1], False))
+        self.assertEqual(tree.error_code, 27)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -29,9 +29,9 @@ from SheetMetalLogger import SMLogger, UnfoldException
 from engineering_mode import engineering_mode_enabled
 import FreeCAD
 import FreeCADGui
+import SheetMetalExporter
 import SheetMetalKfactor
-import importDXF
-import importSVG
+import SheetMetalUnfoldCache
 import os
 import SheetMetalUnfolder as smu
 
@@ -49,6 +49,11 @@ mw = FreeCADGui.getMainWindow()
 
 
 class SMUnfoldTaskPanel:
+    # analyzed trees of the unfolds of the open documents, so the same shape
+    # is unfolded from another face or with other K-factors without a new
+    # analysis, see smu.getUnfold
+    unfoldTrees = {}
+
     def __init__(self):
         path = f"{modPath}/UnfoldOptions.ui"
         self.form = FreeCADGui.PySideUic.loadUi(path)
@@ -71,6 +76,9 @@ class SMUnfoldTaskPanel:
         self.referenceFace = FreeCADGui.Selection.getSelectionEx()[0].SubObjects[0]
         self.facename = FreeCADGui.Selection.getSelectionEx()[0].SubElementNames[0]
         self.object = FreeCADGui.Selection.getSelectionEx()[0].Object
+        # use the flat face giving the smallest flat pattern instead of the
+        # selected one, set by the unattended unfold
+        self.bestFace = False
 
         # End Technical debt
 
@@ -96,6 +104,41 @@ class SMUnfoldTaskPanel:
         if FreeCAD.ActiveDocument.getObject("Sheet_metal_definition"):
             return True    
 
+    def _getUnfoldTrees(self):
+        # drop the trees of closed documents
+        docs = FreeCAD.listDocuments()
+        for key in [key for key in self.unfoldTrees if key[0] not in docs]:
+            del self.unfoldTrees[key]
+        return self.unfoldTrees
+
+    def _selectBestFace(self, params):
+        # make the flat face with the smallest flat pattern the reference
+        # face, its analyzed tree is kept, so the unfold needs no new analysis
+        refine = getattr(self.object, "Refine", False) is True
+        shape = self.object.Shape
+        flat, folds, tree = smu.getBestUnfold(
+            shape,
+            int(self.facename.lstrip("Face")) - 1,
+            params["lookupTable"],
+            params["kFactorStandard"],
+            refine,
+        )
+        if flat is None:
+            return  # the unfold from the selected face reports the error
+        self.facename = "Face" + str(tree.root.idx + 1)
+        self.referenceFace = shape.Faces[tree.root.idx]
+        treeKey = (self.object.Document.Name, self.object.Name)
+        self._getUnfoldTrees()[treeKey] = (
+            SheetMetalUnfoldCache.shapeKey(shape, refine),
+            tree,
+        )
+
+    def _getSketchMode(self):
+        mode = self.pg.GetInt("UnfoldSketchConstraints", 0)
+        if 0 <= mode < len(smu.SKETCH_MODES):
+            return smu.SKETCH_MODES[mode]
+        return "draft"
+
     def _isNoMdsSelected(self):
         return self.form.availableMds.currentIndex() == 0
 
@@ -216,6 +259,8 @@ class SMUnfoldTaskPanel:
             return
 
         try:
+            if self.bestFace:
+                self._selectBestFace(params)
             result = smu.processUnfold(
                 params["lookupTable"],
                 self.object,
@@ -228,9 +273,12 @@ class SMUnfoldTaskPanel:
                 internalSketchColor=params["intSketchColor"],
                 transparency=params["genObjTransparency"],
                 kFactorStandard=params["kFactorStandard"],
+                flatPatternOnly=self.pg.GetBool("flatPatternOnly", False),
+                sketchMode=self._getSketchMode(),
+                treeStore=self._getUnfoldTrees(),
             )
             if result:
-                self.doExport(result[1])
+                self.doExport(result[1], result[5])
 
                 FreeCAD.ActiveDocument.commitTransaction()
                 FreeCADGui.ActiveDocument.resetEdit()
@@ -249,7 +297,7 @@ class SMUnfoldTaskPanel:
                     "Please try to select a different face to unfold your object\n\n"
                     "If the opposite face also fails then switch Refine to false on feature ",
                 )
-                + FreeCADGui.Selection.getSelection()[0].Name
+                + self.object.Name
             )
             QtGui.QMessageBox.question(
                 None,
@@ -266,7 +314,7 @@ class SMUnfoldTaskPanel:
         FreeCADGui.Control.closeDialog()
         FreeCAD.ActiveDocument.recompute()
 
-    def doExport(self, obj):
+    def doExport(self, obj, flatPattern=None):
         # Not sure we should be doing export in this dialog but if we want to,
         # it should be handled here and not in the unfold function.
 
@@ -285,9 +333,19 @@ class SMUnfoldTaskPanel:
         filename = f"{FreeCAD.ActiveDocument.FileName[0:-6]}-{obj.Name}.{self._getExportType()}"
         print("Exporting to " + filename)
 
-        if self._getExportType() == "dxf":
+        # the files are written from the flat pattern, with layers for the
+        # outline, the cutouts and the bend lines
+        if self._getExportType() == "dxf" and flatPattern is not None:
+            SheetMetalExporter.exportFlatPatternDxf(filename, *flatPattern)
+        elif flatPattern is not None:
+            SheetMetalExporter.exportFlatPatternSvg(filename, *flatPattern)
+        elif self._getExportType() == "dxf":
+            import importDXF
+
             importDXF.export(__objs__, filename)
         else:
+            import importSVG
+
             importSVG.export(__objs__, filename)
         del __objs__
 
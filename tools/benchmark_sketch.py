@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+###################################################################################
+#
+#  benchmark_sketch.py
+#
+#  Copyright 2023 Ondsel Inc.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+###################################################################################
+
+# Benchmark of the sketch modes of the unfold sketches on a generated flat
+# pattern: a plate with a grid of square holes, EDGES edges in total.
+# Each mode of SheetMetalUnfolder.SKETCH_MODES makes a sketch of the edges
+# in a new document, the time includes the recompute of the sketch.
+#
+# Run it with FreeCADCmd or from the FreeCAD Python console, with the
+# SheetMetal workbench installed:
+#   exec(open("/path/to/SheetMetal/tools/benchmark_sketch.py").read())
+# The number of edges can be set with the variable EDGES before, the modes
+# with the variable MODES.
+
+import math
+import time
+
+import FreeCAD
+import Part
+import SheetMetalUnfolder as smu
+
+try:
+    EDGES
+except NameError:
+    EDGES = 5000
+
+try:
+    MODES
+except NameError:
+    MODES = list(smu.SKETCH_MODES)
+
+HOLE = 2.0  # side length of the holes
+PITCH = 5.0  # distance of the holes
+
+
+def make_pattern(edges):
+    """Returns the edges of a plate with square holes, about edges edges."""
+    v = FreeCAD.Vector
+    holes = max(1, (edges - 4) // 4)
+    columns = int(math.ceil(math.sqrt(holes)))
+    rows = int(math.ceil(holes / float(columns)))
+    width = columns * PITCH + PITCH
+    height = rows * PITCH + PITCH
+    corners = [v(0, 0, 0), v(width, 0, 0), v(width, height, 0), v(0, height, 0)]
+    wires = [Part.makePolygon(corners + corners[:1])]
+    for i in range(holes):
+        x = PITCH + (i % columns) * PITCH
+        y = PITCH + (i // columns) * PITCH
+        wires.append(
+            Part.makePolygon(
+                [
+                    v(x, y, 0),
+                    v(x + HOLE, y, 0),
+                    v(x + HOLE, y + HOLE, 0),
+                    v(x, y + HOLE, 0),
+                    v(x, y, 0),
+                ]
+            )
+        )
+    return Part.Compound(wires).Edges
+
+
+def main():
+    edges = make_pattern(EDGES)
+    print("Flat pattern with %d edges" % len(edges))
+    times = {}
+    for mode in MODES:
+        doc = FreeCAD.newDocument("SketchBenchmark")
+        try:
+            start = time.perf_counter()
+            sketch = smu.generateSketch(edges, "Unfold_Sketch", "#000080", mode)
+            doc.recompute()
+            times[mode] = time.perf_counter() - start
+            print(
+                "%-10s %8.3f s  geometry: %d  constraints: %d"
+                % (mode, times[mode], sketch.GeometryCount, sketch.ConstraintCount)
+            )
+        finally:
+            FreeCAD.closeDocument(doc.Name)
+    if "draft" in times:
+        for mode in times:
+            if mode != "draft":
+                print(
+                    "%-10s saves %8.3f s against draft"
+                    % (mode, times["draft"] - times[mode])
+                )
+
+
+main()
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+###################################################################################
+#
+#  benchmark_unfold.py
+#
+#  Copyright 2023 Ondsel Inc.
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 2 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public
+#  License along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+###################################################################################
+
+# Benchmark of the unfolder on a generated strip with many bends.
+# The strip is a staircase of flanges, bent alternating +90 and -90 degrees.
+#
+# The stack based tree construction and the unfolding with accumulated
+# placements of SheetTree are compared with the former recursive
+# implementation, kept below as RecursiveSheetTree. The fold lines of the
+# bends are computed from the cylinder parameters, the variant "slice"
+# slices the bend faces instead, like it is done for trimmed bends.
+#
+# Run it with FreeCADCmd or from the FreeCAD Python console, with the
+# SheetMetal workbench installed:
+#   exec(open("/path/to/SheetMetal/tools/benchmark_unfold.py").read())
+# The number of bends can be set with the variable BENDS before.
+#
+# The peak resident set size of the process is printed after each run.
+# It only grows, so to compare the memory use of the implementations run
+# one per process, with VARIANTS = ["recursive"] or VARIANTS = ["stack"].
+# For the fold lines, compare VARIANTS = ["stack", "slice"] with BENDS = 100.
+# The stack variant releases the node data while unfolding and the
+# references of the tree to the shape after it. The strip itself is kept
+# for the other variants.
+
+import math
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import FreeCAD
+import Part
+import SheetMetalUnfolder as smu
+
+try:
+    BENDS
+except NameError:
+    BENDS = 200
+
+try:
+    VARIANTS
+except NameError:
+    VARIANTS = ["recursive", "stack", "slice"]
+
+THICKNESS = 1.0
+RADIUS = 1.0  # inner bend radius
+FLANGE = 10.0  # length of the straight segments of the center line
+WIDTH = 20.0
+K_FACTOR_LOOKUP = {1: 0.5}
+
+
+def make_strip(bends, thickness=THICKNESS, radius=RADIUS):
+    """Returns the solid of a strip with bends and the index of the planar
+    face at the start of the strip, which is used as base face.
+    """
+    v = FreeCAD.Vector
+    z_axis = v(0, 0, 1)
+    directions = [v(1, 0, 0), v(0, 1, 0)]  # turns left and right alternating
+    rm = radius + thickness / 2.0  # radius of the center line
+
+    # corners of the center line
+    points = [v(0, 0, 0)]
+    for i in range(bends + 1):
+        points.append(points[-1] + directions[i % 2] * FLANGE)
+
+    def side_edges(offset):
+        # edges of the strip side at offset to the left of the center line
+        edges = []
+        start = points[0] + z_axis.cross(directions[0]) * offset
+        for i in range(1, bends + 1):
+            d_in = directions[(i - 1) % 2]
+            d_out = directions[i % 2]
+            turn = 1.0 if d_in.cross(d_out).z > 0 else -1.0
+            n_in = z_axis.cross(d_in)
+            center = points[i] - d_in * rm + n_in * (turn * rm)
+            rad = rm - turn * offset
+            t1 = points[i] - d_in * rm - center
+            t2 = points[i] + d_out * rm - center
+            mid = t1 + t2
+            mid.normalize()
+            a_start = center + t1 * (rad / rm)
+            a_end = center + t2 * (rad / rm)
+            edges.append(Part.makeLine(start, a_start))
+            edges.append(Part.Arc(a_start, center + mid * rad, a_end).toShape())
+            start = a_end
+        n_last = z_axis.cross(directions[bends % 2])
+        end = points[-1] + n_last * offset
+        edges.append(Part.makeLine(start, end))
+        return edges
+
+    half = thickness / 2.0
+    left = side_edges(half)
+    right = side_edges(-half)
+    caps = [
+        Part.makeLine(left[0].Vertexes[0].Point, right[0].Vertexes[0].Point),
+        Part.makeLine(left[-1].Vertexes[-1].Point, right[-1].Vertexes[-1].Point),
+    ]
+    wire = Part.Wire(Part.__sortEdges__(left + right + caps))
+    solid = Part.Face(wire).extrude(v(0, 0, WIDTH))
+
+    # the base face is the left side of the first flange
+    probe = Part.Vertex(
+        points[0] + directions[0] * (FLANGE / 4.0) + v(0, half, WIDTH / 2.0)
+    )
+    for idx, face in enumerate(solid.Faces):
+        if str(face.Surface) == "<Plane object>":
+            if face.distToShape(probe)[0] < 1e-7:
+                return solid, idx
+    raise RuntimeError("base face of the strip not found")
+
+
+class RecursiveSheetTree(smu.SheetTree):
+    """SheetTree with the former recursive tree construction and unfolding,
+    used as reference for the benchmark.
+    """
+
+    def Bend_analysis(self, face_idx, parent_node=None, parent_edge=None):
+        if self.error_code is None:
+            wires_edge_lists = []
+            wire_idx = -1
+            for n_wire in self.f_list[face_idx].Wires:
+                wire_idx += 1
+                wires_edge_lists.append([])
+                for n_edge in n_wire.Edges:
+                    if parent_edge:
+                        if not self.same_edges(parent_edge, n_edge):
+                            wires_edge_lists[wire_idx].append(n_edge)
+                    else:
+                        wires_edge_lists[wire_idx].append(n_edge)
+            parent_node = self.make_new_face_node(
+                face_idx, parent_node, parent_edge, wires_edge_lists
+            )
+            removalList = []
+            for child_index, child_info in enumerate(parent_node.child_idx_lists):
+                if child_info[0] in self.index_set:
+                    child_face_idx = child_info[0]
+                    child_face = self._SheetTree__Shape.Faces[child_face_idx]
+                    edge = child_info[1]
+                    if not self.handle_hole(
+                        parent_node, face_idx, edge, child_face, child_index
+                    ):
+                        self.Bend_analysis(child_face_idx, parent_node, edge)
+                else:
+                    parent_node.seam_edges.append(child_info[1])
+                    removalList.append(child_info)
+            for seams in removalList:
+                parent_node.child_idx_lists.remove(seams)
+
+    def unfold_tree2(self, node):
+        theShell = []
+        nodeShell = []
+        theFoldLines = []
+        nodeFoldLines = []
+        for n_node in node.child_list:
+            if self.error_code is None:
+                shell, foldLines = self.unfold_tree2(n_node)
+                theShell = theShell + shell
+                theFoldLines = theFoldLines + foldLines
+        if node.node_type == "Bend":
+            trans_vec = node.tan_vec * node._trans_length
+            for bFaces in theShell:
+                bFaces.rotate(
+                    self.f_list[node.idx].Surface.Center,
+                    node.axis,
+                    math.degrees(-node.bend_angle),
+                )
+                bFaces.translate(trans_vec)
+            for fold in theFoldLines:
+                fold.rotate(
+                    self.f_list[node.idx].Surface.Center,
+                    node.axis,
+                    math.degrees(-node.bend_angle),
+                )
+                fold.translate(trans_vec)
+            if self.error_code is None:
+                nodeShell, nodeFoldLines = self.generateBendShell2(node)
+        else:
+            if self.error_code is None:
+                for idx in node.nfIndexes:
+                    nodeShell.append(self.build_new_face(idx))
+        return (theShell + nodeShell, theFoldLines + nodeFoldLines)
+
+
+class SlicingSheetTree(smu.SheetTree):
+    """SheetTree, which makes the fold lines of all bends by slicing the
+    bend faces, used as reference for the analytic fold lines.
+    """
+
+    def isUntrimmedBend(self, fIdx):
+        return False
+
+
+def tree_signature(node):
+    # face indexes of all nodes in pre-order
+    signature = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        signature.append((node.idx, node.node_type, tuple(node.nfIndexes)))
+        stack.extend(reversed(node.child_list))
+    return signature
+
+
+def shell_key(face):
+    box = face.BoundBox
+    return tuple(
+        round(val, 6)
+        for val in (face.Area, box.XMin, box.YMin, box.ZMin, box.XMax, box.YMax, box.ZMax)
+    )
+
+
+def fold_key(edge):
+    # end points of a fold line, independent of its direction
+    points = [tuple(round(c, 6) for c in v.Point) for v in edge.Vertexes]
+    return tuple(sorted(points))
+
+
+def peak_rss():
+    # peak resident set size of the process in MB, None if unknown
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024.0  # bytes on macOS, kB on Linux
+    return rss / 1024.0
+
+
+def run(tree_class, shape, face_idx, release=False):
+    start = time.perf_counter()
+    tree = tree_class(shape, face_idx, K_FACTOR_LOOKUP)
+    tree.Bend_analysis(face_idx, None)
+    analysis = time.perf_counter()
+    signature = tree_signature(tree.root)
+    if release:
+        faces, folds = tree.unfold_tree2(tree.root, release=True)
+    else:
+        faces, folds = tree.unfold_tree2(tree.root)
+    unfold = time.perf_counter()
+    if tree.error_code is not None:
+        raise RuntimeError(smu.unfold_error[tree.error_code])
+    return signature, faces, folds, analysis - start, unfold - analysis
+
+
+def main():
+    shape, face_idx = make_strip(BENDS)
+    print("Strip with %d bends, %d faces" % (BENDS, len(shape.Faces)))
+
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, 20 * BENDS))
+    try:
+        results = {}
+        for name, tree_class, release in (
+            ("recursive", RecursiveSheetTree, False),
+            ("stack", smu.SheetTree, True),
+            ("slice", SlicingSheetTree, True),
+        ):
+            if name not in VARIANTS:
+                continue
+            signature, faces, folds, t_analysis, t_unfold = run(
+                tree_class, shape, face_idx, release
+            )
+            results[name] = (signature, faces, folds)
+            rss = peak_rss()
+            print(
+                "%-10s analysis: %8.3f s  unfold: %8.3f s  bends/s: %8.1f  peak RSS: %s"
+                % (
+                    name,
+                    t_analysis,
+                    t_unfold,
+                    BENDS / (t_analysis + t_unfold),
+                    "n/a" if rss is None else "%.1f MB" % rss,
+                )
+            )
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+    if "recursive" in results and "stack" in results:
+        ref_signature, ref_faces, ref_folds = results["recursive"]
+        signature, faces, folds = results["stack"]
+        same_tree = ref_signature == signature
+        same_shell = len(ref_faces) == len(faces) and all(
+            f1.isSame(f2) or shell_key(f1) == shell_key(f2)
+            for f1, f2 in zip(ref_faces, faces)
+        )
+        print("identical trees: %s, identical shells: %s" % (same_tree, same_shell))
+    if "stack" in results and "slice" in results:
+        folds = results["stack"][2]
+        ref_folds = results["slice"][2]
+        same_folds = len(ref_folds) == len(folds) and all(
+            fold_key(f1) == fold_key(f2) for f1, f2 in zip(ref_folds, folds)
+        )
+        print("identical fold lines: %s" % same_folds)
+
+
+main()